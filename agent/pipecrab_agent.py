@@ -0,0 +1,220 @@
+# pipecrab_agent.py
+#
+# Remote worker for PipeCrab Dashboard. Connects back to the dashboard over one
+# WebSocket, runs the scripts it is told to launch and streams their output.
+#
+#   python -m agent.pipecrab_agent --url ws://127.0.0.1:8000/agents/ws --name worker-1
+import os
+import sys
+import json
+import zlib
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+from collections import deque
+from datetime import datetime
+
+import websockets
+
+
+OUTPUT_FLUSH_INTERVAL = 0.25
+OUTPUT_BATCH_BYTES = 64 * 1024
+RECONNECT_MAX_DELAY = 30
+
+
+def get_timestamp():
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
+
+
+def wait_with_rusage(process):
+    # wait4 gives the resource usage of exactly this child, unlike RUSAGE_CHILDREN
+    if not hasattr(os, "wait4"):
+        return process.wait(), {}
+
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Popen reaped it first (terminate/kill poll the child before signalling): no usage then
+        return process.wait(), {}
+    code = os.waitstatus_to_exitcode(status)
+    process.returncode = code
+    max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return code, {
+        "user_seconds": usage.ru_utime,
+        "system_seconds": usage.ru_stime,
+        "max_rss_kb": max_rss_kb,
+    }
+
+
+class Agent:
+    def __init__(self, url, name, token="", capacity=4, workdir=".", python=sys.executable):
+        self.url = url
+        self.name = name
+        self.token = token
+        self.capacity = capacity
+        self.workdir = os.path.abspath(workdir)
+        self.python = python
+        self.launches = {}
+        # Frames wait here until a connection takes them, so output survives reconnects
+        self.outbox = deque()
+        self.loop = None
+        self.wakeup = None
+
+    # --- outgoing frames (event loop thread only) ---
+    def queue_text(self, message):
+        self.outbox.append(json.dumps(message))
+        self.wakeup.set()
+
+    def queue_batch(self, message):
+        self.outbox.append(zlib.compress(json.dumps(message).encode("utf-8"), 6))
+        self.wakeup.set()
+
+    def flush_output(self, launch_id):
+        launch = self.launches.get(launch_id)
+        if not launch:
+            return
+        with launch["lock"]:
+            lines, launch["lines"], launch["size"] = launch["lines"], [], 0
+        if lines:
+            self.queue_batch({"type": "output", "launch_id": launch_id, "lines": lines})
+
+    # --- connection ---
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        flusher = asyncio.create_task(self._flusher())
+        delay = 1
+
+        try:
+            while True:
+                try:
+                    async with websockets.connect(self.url, max_size=None) as ws:
+                        print(f"{get_timestamp()} Connected to {self.url} as '{self.name}'")
+                        delay = 1
+                        await self._session(ws)
+                except (OSError, websockets.ConnectionClosed, websockets.InvalidHandshake) as e:
+                    print(f"{get_timestamp()} Connection lost: {e}. Reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        finally:
+            flusher.cancel()
+
+    async def _session(self, ws):
+        await ws.send(json.dumps({
+            "type": "hello",
+            "agent": self.name,
+            "token": self.token,
+            "host": socket.gethostname(),
+            "capacity": self.capacity,
+            "running": list(self.launches),
+        }))
+        sender = asyncio.create_task(self._sender(ws))
+        try:
+            async for raw in ws:
+                self._handle(json.loads(raw))
+        finally:
+            sender.cancel()
+
+    async def _sender(self, ws):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.outbox:
+                await ws.send(self.outbox[0])
+                self.outbox.popleft()  # only dropped once the send went through
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(OUTPUT_FLUSH_INTERVAL)
+            for launch_id in list(self.launches):
+                self.flush_output(launch_id)
+
+    # --- commands from the dashboard ---
+    def _handle(self, message):
+        kind = message.get("type")
+        if kind == "launch":
+            self._launch(message["launch_id"], message.get("command", []))
+        elif kind == "terminate":
+            launch = self.launches.get(message.get("launch_id"))
+            if launch and launch["process"].poll() is None:
+                if message.get("force"):
+                    launch["process"].kill()
+                else:
+                    launch["process"].terminate()
+
+    def _resolve_script(self, path):
+        # Paths are the dashboard's; fall back to the same file name under our scripts/
+        if os.path.isfile(path):
+            return path
+        return os.path.join(self.workdir, "scripts", os.path.basename(path))
+
+    def _launch(self, launch_id, command):
+        if not command:
+            self.queue_text({"type": "launch_failed", "launch_id": launch_id, "error": "empty command"})
+            return
+        if len(self.launches) >= self.capacity:
+            self.queue_text({"type": "launch_failed", "launch_id": launch_id, "error": f"agent at capacity ({self.capacity})"})
+            return
+
+        script_path = self._resolve_script(command[0])
+        try:
+            process = subprocess.Popen(
+                [self.python, "-u", script_path, *command[1:]],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, cwd=self.workdir
+            )
+        except Exception as e:
+            self.queue_text({"type": "launch_failed", "launch_id": launch_id, "error": str(e)})
+            return
+
+        self.launches[launch_id] = {"process": process, "lines": [], "size": 0, "lock": threading.Lock(), "started": time.monotonic()}
+        self.queue_text({"type": "started", "launch_id": launch_id, "pid": process.pid})
+        print(f"{get_timestamp()} Launch {launch_id}: PID {process.pid} {script_path}")
+
+        reader = threading.Thread(target=self._read_output, args=(launch_id, process), daemon=True)
+        reader.start()
+        threading.Thread(target=self._wait_exit, args=(launch_id, process, reader), daemon=True).start()
+
+    def _read_output(self, launch_id, process):
+        launch = self.launches[launch_id]
+        for line in iter(process.stdout.readline, ""):
+            with launch["lock"]:
+                launch["lines"].append(line)
+                launch["size"] += len(line)
+                full = launch["size"] >= OUTPUT_BATCH_BYTES
+            if full:
+                self.loop.call_soon_threadsafe(self.flush_output, launch_id)
+
+    def _wait_exit(self, launch_id, process, reader):
+        code, usage = wait_with_rusage(process)
+        reader.join()
+        self.loop.call_soon_threadsafe(self._finish, launch_id, code, usage)
+
+    def _finish(self, launch_id, code, usage):
+        self.flush_output(launch_id)
+        launch = self.launches.pop(launch_id, None)
+        duration = time.monotonic() - launch["started"] if launch else 0
+        self.queue_text({"type": "exit", "launch_id": launch_id, "code": code, "rusage": usage, "duration_seconds": duration})
+        print(f"{get_timestamp()} Launch {launch_id}: exit code {code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PipeCrab remote worker agent")
+    parser.add_argument("--url", default=os.getenv("PIPECRAB_URL", "ws://127.0.0.1:8000/agents/ws"), help="Dashboard agent endpoint")
+    parser.add_argument("--name", default=os.getenv("AGENT_NAME", socket.gethostname()), help="Agent name used in task settings")
+    parser.add_argument("--token", default=os.getenv("AGENT_TOKEN", ""), help="Shared secret, must match AGENT_TOKEN on the dashboard")
+    parser.add_argument("--capacity", type=int, default=int(os.getenv("AGENT_CAPACITY", "4")), help="Maximum parallel scripts")
+    parser.add_argument("--workdir", default=".", help="Directory scripts are resolved and run in")
+    args = parser.parse_args()
+
+    agent = Agent(args.url, args.name, args.token, args.capacity, args.workdir)
+    try:
+        asyncio.run(agent.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# admin.py
+import os
+import asyncio
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import PlainTextResponse
+from app.utils.profiler import sample_stacks, collapsed, summarize
+
+router = APIRouter()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+
+def check_admin(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = 10,
+    interval_ms: float = 5,
+    format: str = "collapsed",
+    include_idle: bool = False,
+    include_tasks: bool = True,
+    x_admin_token: str | None = Header(default=None)
+):
+    check_admin(x_admin_token)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
+    if not 1 <= interval_ms <= 1000:
+        # Below 1ms the sampler thread would spin holding the GIL and stall what it observes
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+
+    loop = asyncio.get_running_loop()
+    print(f"[PROFILE] Sampling for {seconds}s every {interval_ms}ms")
+    try:
+        # Own thread, so the sampler neither blocks the loop nor holds a store worker
+        counts, samples = await loop.run_in_executor(
+            None, sample_stacks, seconds, interval_ms / 1000, loop if include_tasks else None, include_idle, ["admin.py:profile"]
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse(collapsed(counts))
+    return dict(summarize(counts, samples), seconds=seconds, interval_ms=interval_ms)
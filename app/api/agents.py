@@ -0,0 +1,179 @@
+# agents.py
+import os
+import json
+import zlib
+import uuid
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+
+def get_timestamp():
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
+
+router = APIRouter()
+
+AGENT_TOKEN = os.getenv("AGENT_TOKEN", "")
+AGENT_LAUNCH_TIMEOUT = float(os.getenv("AGENT_LAUNCH_TIMEOUT", "15"))
+
+connected_agents = {}
+remote_launches = {}
+loop = None
+
+
+class RemoteProcess:
+    # Popen-like handle for a script running under a pipecrab-agent. State changes
+    # arrive over the agent connection; the pid belongs to the remote host.
+    supports_pidfd = False
+
+    def __init__(self, launch_id, agent_name, log_file_path, append_log):
+        self.launch_id = launch_id
+        self.agent_name = agent_name
+        self.log_file_path = log_file_path
+        self.append_log = append_log
+        self.pid = None
+        self.returncode = None
+        self.rusage = {}
+        self.started = asyncio.get_running_loop().create_future()
+
+    def poll(self):
+        return self.returncode
+
+    def _signal(self, force):
+        agent = connected_agents.get(self.agent_name)
+        if agent and self.returncode is None:
+            asyncio.get_running_loop().create_task(agent.send({"type": "terminate", "launch_id": self.launch_id, "force": force}))
+
+    def terminate(self):
+        self._signal(False)
+
+    def kill(self):
+        self._signal(True)
+
+
+class AgentConnection:
+    def __init__(self, name, websocket, hello):
+        self.name = name
+        self.websocket = websocket
+        self.host = hello.get("host", "")
+        self.capacity = hello.get("capacity", 0)
+        self.connected_at = datetime.utcnow()
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+
+def decode_frame(message):
+    # Output batches come as zlib-compressed binary frames, control messages as text
+    if message.get("bytes") is not None:
+        return json.loads(zlib.decompress(message["bytes"]))
+    return json.loads(message["text"])
+
+
+def handle_agent_message(agent_name, data):
+    process = remote_launches.get(data.get("launch_id"))
+    if process is None:
+        return  # launch from before a dashboard restart
+    if process.agent_name != agent_name:
+        print(f"[AGENT] Ignored '{data.get('type')}' from '{agent_name}' for launch {process.launch_id} of agent '{process.agent_name}'")
+        return
+
+    kind = data.get("type")
+    if kind == "started":
+        process.pid = data.get("pid")
+        if not process.started.done():
+            process.started.set_result(process.pid)
+    elif kind == "launch_failed":
+        process.returncode = -1
+        remote_launches.pop(process.launch_id, None)
+        if not process.started.done():
+            process.started.set_exception(RuntimeError(data.get("error", "launch failed")))
+    elif kind == "output":
+        lines = data.get("lines", [])
+        if lines:
+            process.append_log(process.log_file_path, "\n".join(line.rstrip("\n") for line in lines))
+    elif kind == "exit":
+        process.rusage = data.get("rusage", {})
+        usage = process.rusage
+        process.append_log(process.log_file_path, (
+            f"{get_timestamp()} [AGENT] {agent_name}: exit code {data.get('code')}, "
+            f"cpu {usage.get('user_seconds', 0):.2f}s user / {usage.get('system_seconds', 0):.2f}s sys, "
+            f"max RSS {usage.get('max_rss_kb', 0) // 1024} MB, wall {data.get('duration_seconds', 0):.1f}s"
+        ))
+        process.returncode = data.get("code", -1)
+        remote_launches.pop(process.launch_id, None)
+
+
+async def launch_remote(agent_name, script_command, log_file_path, append_log):
+    agent = connected_agents.get(agent_name)
+    if agent is None:
+        raise LookupError(f"Agent '{agent_name}' is not connected")
+
+    launch_id = uuid.uuid4().hex[:12]
+    process = RemoteProcess(launch_id, agent_name, log_file_path, append_log)
+    remote_launches[launch_id] = process
+    await agent.send({"type": "launch", "launch_id": launch_id, "command": script_command})
+    try:
+        await asyncio.wait_for(asyncio.shield(process.started), AGENT_LAUNCH_TIMEOUT)
+    except Exception:
+        remote_launches.pop(launch_id, None)
+        raise
+    return process
+
+
+@router.websocket("/ws")
+async def agent_socket(websocket: WebSocket):
+    global loop
+    loop = asyncio.get_running_loop()
+    await websocket.accept()
+
+    try:
+        hello = decode_frame(await websocket.receive())
+    except Exception:
+        await websocket.close(code=1002)
+        return
+
+    if hello.get("type") != "hello" or not hello.get("agent"):
+        await websocket.close(code=1002)
+        return
+    if not AGENT_TOKEN:
+        # Without a shared secret any WebSocket client could pose as an agent and run its tasks
+        print(f"[AGENT] Rejected '{hello.get('agent')}': AGENT_TOKEN is not set on the dashboard")
+        await websocket.close(code=1008)
+        return
+    if hello.get("token") != AGENT_TOKEN:
+        print(f"[AGENT] Rejected '{hello.get('agent')}': bad token")
+        await websocket.close(code=1008)
+        return
+
+    name = hello["agent"]
+    agent = AgentConnection(name, websocket, hello)
+    connected_agents[name] = agent
+    print(f"[AGENT] '{name}' connected from {agent.host}")
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            handle_agent_message(name, decode_frame(message))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Running launches stay tracked: the agent buffers output and resends it on reconnect
+        if connected_agents.get(name) is agent:
+            connected_agents.pop(name, None)
+        print(f"[AGENT] '{name}' disconnected")
+
+
+@router.get("/")
+async def list_agents():
+    return [{
+        "name": agent.name,
+        "host": agent.host,
+        "capacity": agent.capacity,
+        "connected_at": agent.connected_at.isoformat(),
+        "running": [launch_id for launch_id, p in remote_launches.items() if p.agent_name == agent.name],
+    } for agent in connected_agents.values()]
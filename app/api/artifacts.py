@@ -0,0 +1,54 @@
+# artifacts.py
+import os
+import mimetypes
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.utils.artifacts import get_artifact_store
+from app.utils.store import run_io
+
+router = APIRouter()
+
+
+@router.get("/runs")
+async def list_runs(task: str | None = None, limit: int = 50):
+    return await run_io(get_artifact_store().list_runs, task, limit)
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    run = await run_io(get_artifact_store().get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    for artifact in run["artifacts"]:
+        artifact["url"] = f"/artifacts/download/{run_id}/{artifact['name']}"
+    return run
+
+
+def file_response(path, filename):
+    # FileResponse streams from disk; servers that support the zero-copy send
+    # extension hand the file to sendfile() instead of reading it in Python
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=filename)
+
+
+@router.get("/download/{run_id}/{name:path}")
+async def download_artifact(run_id: str, name: str):
+    path = await run_io(get_artifact_store().find_artifact, run_id, name)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return file_response(path, os.path.basename(name))
+
+
+@router.get("/objects/{sha256}")
+async def download_object(sha256: str):
+    if len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+        raise HTTPException(status_code=400, detail="Invalid object id")
+    path = get_artifact_store().object_path(sha256)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Object not found")
+    return file_response(path, sha256)
+
+
+@router.get("/stats")
+async def artifact_stats():
+    return await run_io(get_artifact_store().stats)
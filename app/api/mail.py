@@ -0,0 +1,35 @@
+# mail.py
+import re
+import asyncio
+from fastapi import APIRouter, HTTPException, Body
+from app.utils.email_service import email_service
+
+router = APIRouter()
+
+
+@router.post("/send")
+async def send_email(
+    recipients: list[str] | str = Body(...),
+    subject: str = Body(...),
+    body: str = Body(default=""),
+    wait: bool = Body(default=True)
+):
+    if isinstance(recipients, str):
+        recipients = re.split(r"[,\s;]+", recipients)
+    try:
+        future = email_service.send(recipients, subject, body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not wait:
+        return {"queued": True}
+    try:
+        return await asyncio.wrap_future(future)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Email delivery failed: {e}")
+
+
+@router.get("/status")
+async def email_status():
+    return email_service.status()
@@ -0,0 +1,418 @@
+# pipelines.py
+import os
+import json
+import uuid
+import asyncio
+import threading
+import subprocess
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Body
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.base import JobLookupError
+from app.api import scripts
+from app.utils.reaper import reaper
+from app.utils.artifacts import get_artifact_store, ARTIFACT_ROOT
+from app.utils.store import run_io
+
+
+def get_timestamp():
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
+
+router = APIRouter()
+
+PIPELINES_JSON_PATH = os.getenv("PIPELINES_JSON_PATH", "pipelines.json")
+PIPELINE_ARTIFACT_ROOT = os.getenv("PIPELINE_ARTIFACT_ROOT", os.path.join(ARTIFACT_ROOT, "pipelines"))
+PIPELINE_RUN_HISTORY = int(os.getenv("PIPELINE_RUN_HISTORY", "50"))
+
+pipeline_runs = {}
+active_runs = {}
+loop = None
+_lock = threading.Lock()
+
+
+# --- definitions ---
+
+def load_pipelines_sync():
+    if not os.path.exists(PIPELINES_JSON_PATH):
+        return []
+    with _lock, open(PIPELINES_JSON_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_pipelines_sync(pipelines):
+    with _lock:
+        tmp_path = f"{PIPELINES_JSON_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pipelines, f, indent=2)
+        os.replace(tmp_path, PIPELINES_JSON_PATH)
+
+
+def topological_order(steps):
+    # Kahn's algorithm; raises ValueError on unknown dependencies or cycles
+    ids = [step["id"] for step in steps]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Step ids must be unique")
+
+    needs = {step["id"]: list(step.get("needs", [])) for step in steps}
+    for step_id, deps in needs.items():
+        for dep in deps:
+            if dep not in needs:
+                raise ValueError(f"Step '{step_id}' needs unknown step '{dep}'")
+
+    remaining = {step_id: len(deps) for step_id, deps in needs.items()}
+    ready = [step_id for step_id in ids if remaining[step_id] == 0]
+    order = []
+    while ready:
+        step_id = ready.pop(0)
+        order.append(step_id)
+        for other, deps in needs.items():
+            if step_id in deps:
+                remaining[other] -= 1
+                if remaining[other] == 0:
+                    ready.append(other)
+
+    if len(order) != len(ids):
+        cycle = sorted(step_id for step_id in ids if step_id not in order)
+        raise ValueError(f"Dependency cycle between steps: {', '.join(cycle)}")
+    return order
+
+
+def validate_pipeline_name(name):
+    # The name becomes a directory under PIPELINE_ARTIFACT_ROOT, so it must stay a single path component
+    # (':' included: on Windows "C:name" would leave the artifact root)
+    if name in ("", ".", "..") or any(c in name for c in '/\\:\0'):
+        raise ValueError(f"Invalid pipeline name '{name}': it must not be '.', '..' or contain '/', '\\' or ':'")
+
+
+def validate_pipeline(pipeline, tasks_by_name):
+    validate_pipeline_name(pipeline.get("name", ""))
+    if not pipeline.get("steps"):
+        raise ValueError("Pipeline needs at least one step")
+    for step in pipeline["steps"]:
+        if not step.get("id") or not step.get("task"):
+            raise ValueError("Every step needs an 'id' and a 'task'")
+        task = tasks_by_name.get(step["task"])
+        if task is None:
+            raise ValueError(f"Step '{step['id']}' refers to unknown task '{step['task']}'")
+        if task.get("agent", "").strip():
+            # Steps run locally: an agent has no access to the step's artifact directory or inputs
+            raise ValueError(f"Step '{step['id']}' uses task '{step['task']}', which runs on agent '{task['agent'].strip()}'; pipeline steps must be local tasks")
+    topological_order(pipeline["steps"])
+    if pipeline.get("schedule_expression"):
+        CronTrigger.from_crontab(pipeline["schedule_expression"])
+
+
+def critical_path(steps, step_states):
+    # Longest chain of dependent steps by measured duration: the part of the run
+    # that parallelism could not hide
+    finish = {}
+    previous = {}
+    for step_id in topological_order(steps):
+        deps = next(step.get("needs", []) for step in steps if step["id"] == step_id)
+        best = max(deps, key=lambda d: finish[d], default=None)
+        previous[step_id] = best
+        finish[step_id] = (finish[best] if best else 0) + (step_states[step_id].get("duration_seconds") or 0)
+
+    if not finish:
+        return [], 0
+    end = max(finish, key=finish.get)
+    path = []
+    while end:
+        path.append(end)
+        end = previous[end]
+    path.reverse()
+    return path, round(finish[path[-1]], 3)
+
+
+# --- execution ---
+
+def read_step_result(artifact_dir):
+    result_path = os.path.join(artifact_dir, "result.json")
+    if not os.path.exists(result_path):
+        return None
+    try:
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        return {"error": f"unreadable result.json: {e}"}
+
+
+async def run_step(run, step, task, done):
+    state = run["steps"][step["id"]]
+    deps = step.get("needs", [])
+    if deps:
+        await asyncio.gather(*(done[dep].wait() for dep in deps))
+
+    try:
+        if any(run["steps"][dep]["status"] != "succeeded" for dep in deps):
+            state["status"] = "skipped"
+            return
+
+        log_file_path = f"logs/{task['name']}.log"
+        # Step outputs go through the artifact store; the scratch dir stays until the run ends
+        # so downstream steps can read it via PIPECRAB_INPUTS
+        artifact_run_id, artifact_dir = await run_io(
+            get_artifact_store().begin_run, task["name"], task.get("id"), f"pipeline:{run['pipeline']}/{run['id']}/{step['id']}"
+        )
+        state["artifact_run_id"] = artifact_run_id
+        inputs = {dep: {"dir": run["steps"][dep]["artifact_dir"], "result": run["steps"][dep]["result"]} for dep in deps}
+        env = dict(os.environ,
+                   PIPECRAB_RUN_ID=run["id"],
+                   PIPECRAB_STEP=step["id"],
+                   PIPECRAB_ARTIFACT_DIR=artifact_dir,
+                   PIPECRAB_INPUTS=json.dumps(inputs))
+
+        async with scripts.launch_slots:
+            if run["status"] == "cancelled":
+                state["status"] = "skipped"
+                return
+
+            command = scripts.build_command(task)
+            scripts.append_to_limited_log(log_file_path, f"{get_timestamp()} [PIPELINE] {run['pipeline']} run {run['id']}, step '{step['id']}' started.")
+            with await run_io(scripts.open_run_output, log_file_path, artifact_run_id, "pipeline") as log_handle:
+                process = subprocess.Popen(command, stdout=log_handle, stderr=subprocess.STDOUT, text=True, env=env)
+            scripts.follow_run_output(log_file_path, artifact_run_id, process)
+
+            state.update(status="running", pid=process.pid, artifact_dir=artifact_dir, started_at=datetime.utcnow().isoformat())
+            started = asyncio.get_running_loop().time()
+            exited = asyncio.get_running_loop().create_future()
+
+            async def on_exit(p):
+                if not exited.done():
+                    exited.set_result(p.returncode)
+
+            key = f"pipeline:{run['id']}:{step['id']}"
+            reaper.watch(key, process, on_exit)
+            try:
+                exit_code = await exited
+            except asyncio.CancelledError:
+                reaper.unwatch(key)
+                await scripts.terminate_process(process, log_file_path)
+                state["status"] = "cancelled"
+                raise
+
+        state["exit_code"] = exit_code
+        state["duration_seconds"] = round(asyncio.get_running_loop().time() - started, 3)
+        state["finished_at"] = datetime.utcnow().isoformat()
+        state["result"] = await run_io(read_step_result, artifact_dir)
+        state["artifacts"] = await run_io(get_artifact_store().finish_run, artifact_run_id, exit_code, True)
+        state["status"] = "succeeded" if exit_code == 0 else "failed"
+        scripts.append_to_limited_log(log_file_path, f"{get_timestamp()} [PIPELINE] {run['pipeline']} run {run['id']}, step '{step['id']}' {state['status']} (exit code {exit_code}).")
+    except asyncio.CancelledError:
+        if state["status"] == "pending":
+            state["status"] = "skipped"
+        raise
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+    finally:
+        done[step["id"]].set()
+
+
+async def execute_run(run, pipeline, tasks_by_name):
+    done = {step["id"]: asyncio.Event() for step in pipeline["steps"]}
+    step_tasks = [asyncio.create_task(run_step(run, step, tasks_by_name[step["task"]], done)) for step in pipeline["steps"]]
+
+    try:
+        await asyncio.gather(*step_tasks)
+    except asyncio.CancelledError:
+        for task in step_tasks:
+            task.cancel()
+        await asyncio.gather(*step_tasks, return_exceptions=True)
+        run["status"] = "cancelled"
+    finally:
+        active_runs.pop(run["id"], None)
+        for state in run["steps"].values():
+            if state.get("artifact_run_id"):
+                await run_io(finish_step_artifacts, state["artifact_run_id"], state.get("exit_code"))
+
+    if run["status"] != "cancelled":
+        failed = any(state["status"] == "failed" for state in run["steps"].values())
+        run["status"] = "failed" if failed else "succeeded"
+
+    finished = datetime.utcnow()
+    run["finished_at"] = finished.isoformat()
+    run["wall_seconds"] = round((finished - datetime.fromisoformat(run["started_at"])).total_seconds(), 3)
+    run["critical_path"], run["critical_path_seconds"] = critical_path(pipeline["steps"], run["steps"])
+    await run_io(write_run_record, run)
+    print(f"[PIPELINE] {run['pipeline']} run {run['id']} {run['status']} in {run['wall_seconds']}s, critical path {' -> '.join(run['critical_path'])} ({run['critical_path_seconds']}s)")
+
+
+def finish_step_artifacts(artifact_run_id, exit_code):
+    store = get_artifact_store()
+    store.finish_run(artifact_run_id, exit_code)  # no-op unless the step was cancelled
+    store.remove_scratch(artifact_run_id)
+
+
+def write_run_record(run):
+    with open(os.path.join(run["artifact_dir"], "run.json"), "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+
+
+async def start_pipeline_run(name):
+    pipelines = await run_io(load_pipelines_sync)
+    pipeline = next((p for p in pipelines if p["name"] == name), None)
+    if pipeline is None:
+        raise LookupError(f"Pipeline '{name}' not found")
+
+    tasks_by_name = {task["name"]: task for task in await scripts.load_scripts()}
+    validate_pipeline(pipeline, tasks_by_name)
+
+    run_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    artifact_dir = os.path.join(PIPELINE_ARTIFACT_ROOT, name, run_id)
+    os.makedirs(artifact_dir, exist_ok=True)
+    run = {
+        "id": run_id,
+        "pipeline": name,
+        "status": "running",
+        "started_at": datetime.utcnow().isoformat(),
+        "artifact_dir": artifact_dir,
+        "steps": {step["id"]: {
+            "task": step["task"],
+            "needs": step.get("needs", []),
+            "status": "pending",
+            "artifact_dir": None,
+            "artifact_run_id": None,
+            "artifacts": [],
+            "result": None,
+        } for step in pipeline["steps"]},
+    }
+
+    pipeline_runs[run_id] = run
+    while len(pipeline_runs) > PIPELINE_RUN_HISTORY:
+        oldest = next(iter(pipeline_runs))
+        if oldest in active_runs:
+            break
+        pipeline_runs.pop(oldest)
+
+    active_runs[run_id] = asyncio.create_task(execute_run(run, pipeline, tasks_by_name))
+    return run
+
+
+def launch_scheduled_pipeline(name):
+    # APScheduler thread: hand the run to the event loop
+    future = asyncio.run_coroutine_threadsafe(start_pipeline_run(name), loop)
+    try:
+        run = future.result(timeout=30)
+        print(f"[PIPELINE] Cron started {name} run {run['id']}")
+    except Exception as e:
+        print(f"[PIPELINE] Cron start of {name} failed: {e}")
+
+
+def schedule_pipeline(pipeline):
+    job_id = f"pipeline_{pipeline['name']}_cron"
+    try:
+        scripts.scheduler.remove_job(job_id)
+    except JobLookupError:
+        pass
+    if pipeline.get("schedule_expression") and pipeline.get("enabled", True):
+        scripts.scheduler.add_job(
+            launch_scheduled_pipeline, scripts.build_cron_trigger(pipeline["schedule_expression"], scripts.CRON_JITTER_SECONDS),
+            args=[pipeline["name"]], id=job_id, replace_existing=True
+        )
+
+
+async def start_pipeline_schedules():
+    global loop
+    loop = asyncio.get_running_loop()
+    try:
+        pipelines = await run_io(load_pipelines_sync)
+    except Exception as e:
+        print(f"[PIPELINE] Failed to load {PIPELINES_JSON_PATH}: {e}")
+        return
+    for pipeline in pipelines:
+        try:
+            schedule_pipeline(pipeline)
+        except Exception as e:
+            print(f"[PIPELINE] Failed to schedule {pipeline.get('name')}: {e}")
+
+
+async def shutdown_pipelines():
+    # Runs are not resumable, so their steps are stopped before the dashboard goes away
+    runs = list(active_runs.values())
+    for task in runs:
+        task.cancel()
+    await asyncio.gather(*runs, return_exceptions=True)
+
+
+# --- API ---
+
+@router.get("/")
+async def list_pipelines():
+    return await run_io(load_pipelines_sync)
+
+
+@router.post("/")
+async def save_pipeline(
+    name: str = Body(...),
+    description: str = Body(default=""),
+    steps: list[dict] = Body(...),
+    schedule_expression: str = Body(default=""),
+    enabled: bool = Body(default=True)
+):
+    pipeline = {
+        "name": name.strip(),
+        "description": description,
+        "steps": [{"id": s.get("id", "").strip(), "task": s.get("task", ""), "needs": s.get("needs", [])} for s in steps],
+        "schedule_expression": schedule_expression.strip(),
+        "enabled": enabled,
+    }
+    tasks_by_name = {task["name"]: task for task in await scripts.load_scripts()}
+    try:
+        validate_pipeline(pipeline, tasks_by_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pipelines = [p for p in await run_io(load_pipelines_sync) if p["name"] != pipeline["name"]]
+    pipelines.append(pipeline)
+    await run_io(save_pipelines_sync, pipelines)
+    schedule_pipeline(pipeline)
+    return {"message": f"Pipeline '{pipeline['name']}' saved.", "order": topological_order(pipeline["steps"])}
+
+
+@router.delete("/delete/{name}")
+async def delete_pipeline(name: str):
+    pipelines = await run_io(load_pipelines_sync)
+    remaining = [p for p in pipelines if p["name"] != name]
+    if len(remaining) == len(pipelines):
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+    await run_io(save_pipelines_sync, remaining)
+    try:
+        scripts.scheduler.remove_job(f"pipeline_{name}_cron")
+    except JobLookupError:
+        pass
+    return {"message": f"Pipeline '{name}' deleted."}
+
+
+@router.post("/run/{name}")
+async def run_pipeline(name: str):
+    try:
+        run = await start_pipeline_run(name)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Pipeline '{name}' started.", "run_id": run["id"]}
+
+
+@router.get("/runs")
+async def list_runs(name: str | None = None):
+    return [run for run in reversed(pipeline_runs.values()) if name is None or run["pipeline"] == name]
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    run = pipeline_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    task = active_runs.get(run_id)
+    if task is None:
+        raise HTTPException(status_code=400, detail="Run is not active")
+    pipeline_runs[run_id]["status"] = "cancelled"
+    task.cancel()
+    return {"message": f"Run {run_id} cancelled."}
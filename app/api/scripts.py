@@ -1,64 +1,62 @@
 #scripts.py
 import os
-import shutil
+import sys
 import json
 import subprocess
 import re
-import threading
-from dotenv import load_dotenv
-load_dotenv(override=True)
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Body, UploadFile, File
 from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.jobstores.base import JobLookupError
 from app.config_telegram import TELEGRAM_BOTS, DEFAULT_BOT_NAME
-from pathlib import Path
-from dotenv import dotenv_values
 import asyncio
+import threading
+from functools import lru_cache
 from app.utils.db import save_sql_scripts
-from app.utils.db import load_sql_scripts
-from cron_descriptor import get_description
-
-TASKS_TABLE_DDL = """
-IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'Tasks')
-                    CREATE TABLE Tasks (
-                        Id INT IDENTITY PRIMARY KEY,
-                        Name NVARCHAR(255) NOT NULL,
-                        Path NVARCHAR(255) NOT NULL,
-                        Description NVARCHAR(255),
-                        Tags NVARCHAR(100),
-                        IsEnabled BIT NOT NULL,
-                        UseScheduler BIT NOT NULL DEFAULT 0,
-                        CronExpr NVARCHAR(50),
-                        CronExprParse NVARCHAR(255),
-                        Apps NVARCHAR(255),
-                        EmailRecipients NVARCHAR(1000),
-                        BotName NVARCHAR(100),
-                        PassBotParam BIT NOT NULL DEFAULT 0,
-                        PassPushParam BIT NOT NULL DEFAULT 0,
-                        PushText NVARCHAR(255),
-                        LastUpTime INT NULL,
-                        LastLaunchCount INT NULL,
-                        ScriptJson NVARCHAR(MAX) CHECK (ISJSON(ScriptJson) > 0),
-                        LastUpdated DATETIME DEFAULT GETDATE()
-                    )
-"""
-
-
+from app.utils.db import load_sql_scripts, create_sql_tasks_table, check_sql_tasks_table, TASKS_TABLE_DDL
+from app.utils.sqlite_db import migrate_json_to_sqlite
+from app.utils.store import get_task_store, run_io
+from app.utils.settings import get_settings, write_env_values
+from app.api import agents
+from app.utils.reaper import reaper
+from app.utils.artifacts import get_artifact_store
+from app.utils.script_store import get_script_store, same_content
+from app.utils.log_reader import read_log_window, read_last_session, MappedLog
+from app.utils.structured_log import get_structured_log, structured_logs_enabled, LEVELS
+from app.utils.schedule_timeline import build_timeline
+from app.utils.request_timing import phase
+from app.utils.task_state import TaskStates
+from app.utils.cluster import ClusterCoordinator, create_cluster_store, CLUSTER_MODE, NODE_ID
+from app.utils.pid_registry import (
+    AdoptedProcess, detached_popen_kwargs, register_process, unregister_process,
+    load_registry, replace_registry, verify_registered_process, registry_start_time
+)
 
 def get_timestamp():
     return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
 
+
+@lru_cache(maxsize=512)
+def describe_cron(expression):
+    from cron_descriptor import get_description
+    return get_description(expression)
+
 router = APIRouter()
+# Started by the app lifespan (start_scheduler); jobs added before that wait until it runs
 scheduler = BackgroundScheduler()
-scheduler.start()
 
 SCRIPTS_JSON_PATH = "scripts.json"
+# Owned by the event loop thread; start/stop of a task are serialized by task_states
 running_processes = {}
 stopped_uptime_seconds = {}
+task_states = TaskStates()
+cluster = None
+loop = None
 
 class ScriptUpdateRequest(BaseModel):
     id: int | None = None
@@ -74,197 +72,295 @@ class ScriptUpdateRequest(BaseModel):
     schedule_expression: str = "* * * * *"
 
 
-LOG_LINE_LIMIT = int(os.getenv("LOG_LINE_LIMIT", "1000"))
+class BulkRequest(BaseModel):
+    action: str
+    ids: list[int] = []
+    tag: str = ""
+    app: str = ""
 
-def append_to_limited_log(log_file_path, new_line, max_lines=LOG_LINE_LIMIT):
+
+LOG_LINE_LIMIT = int(os.getenv("LOG_LINE_LIMIT", "1000"))
+PYTHON_EXECUTABLE = os.getenv("PYTHON_EXECUTABLE", sys.executable)
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "5"))
+# "stop" terminates running tasks on shutdown; opt-in "detach" leaves them running over a restart
+# and re-adopts them via /proc, so it needs Linux
+SHUTDOWN_MODE = os.getenv("SHUTDOWN_MODE", "stop").lower()
+if SHUTDOWN_MODE == "detach" and not os.path.isdir("/proc"):
+    print("[STATE] SHUTDOWN_MODE=detach needs /proc to re-adopt tasks; using stop")
+    SHUTDOWN_MODE = "stop"
+LOG_TRIM_INTERVAL = float(os.getenv("LOG_TRIM_INTERVAL", "60"))
+log_trim_lock = threading.Lock()
+# Cron dispatch: random delay added to each fire (per-task "cron_jitter" overrides it)
+CRON_JITTER_SECONDS = int(os.getenv("CRON_JITTER_SECONDS", "0"))
+# Non-urgent cron runs wait while the host is busy: 1-minute load average per CPU
+# above CRON_LOAD_THRESHOLD, or CRON_MAX_ACTIVE local processes running (0 disables either)
+CRON_LOAD_THRESHOLD = float(os.getenv("CRON_LOAD_THRESHOLD", "0"))
+CRON_MAX_ACTIVE = int(os.getenv("CRON_MAX_ACTIVE", "0"))
+CRON_MAX_DELAY_SECONDS = float(os.getenv("CRON_MAX_DELAY_SECONDS", "300"))
+CRON_RECHECK_SECONDS = float(os.getenv("CRON_RECHECK_SECONDS", "15"))
+# Cluster mode: how far back a fire is matched to its schedule slot (clock skew between nodes)
+CRON_FIRE_KEY_WINDOW = 60
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
+PROFILE_MODES = ("cprofile", "sample")
+# Process launches in flight at once, shared by bulk starts and pipeline steps
+LAUNCH_CONCURRENCY = int(os.getenv("LAUNCH_CONCURRENCY", "4"))
+launch_slots = asyncio.Semaphore(LAUNCH_CONCURRENCY)
+BULK_ACTIONS = ("start", "stop", "restart", "enable", "disable")
+
+def log_task_name(log_file_path):
+    return os.path.basename(log_file_path)[:-len(".log")]
+
+
+def append_to_limited_log(log_file_path, new_line):
+    if structured_logs_enabled():
+        try:
+            get_structured_log().write_text(log_task_name(log_file_path), new_line)
+        except Exception as e:
+            print(f"[LOGGING] Failed to write structured log for {log_file_path}: {e}")
+        return
     try:
-        if os.path.exists(log_file_path):
-            with open(log_file_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-            lines = lines[-(max_lines - 1):]  # keep last (N-1) lines
-        else:
-            lines = []
-        lines.append(new_line + "\n")
-        with open(log_file_path, "w", encoding="utf-8") as f:
-            f.writelines(lines)
+        # Append only: the child may be writing to the same file; log_maintenance_loop trims it
+        with open(log_file_path, "a", encoding="utf-8") as f:
+            f.write(new_line + "\n")
     except Exception as e:
         print(f"[LOGGING] Failed to write to {log_file_path}: {e}")
 
 
-async def load_scripts():
-    use_db = os.getenv("USE_SQL", "false").lower() == "true"
+def use_sqlite_store():
+    return get_settings().use_sqlite
 
-    if use_db:
-        return await asyncio.to_thread(load_sql_scripts)
 
-    if not os.path.exists(SCRIPTS_JSON_PATH):
-        return []
+def begin_artifact_run(script_name, script_id=None, trigger="manual"):
+    # Every local run writes its outputs to PIPECRAB_ARTIFACT_DIR; they are collected on exit
+    run_id, scratch_dir = get_artifact_store().begin_run(script_name, script_id, trigger)
+    return run_id, dict(os.environ, PIPECRAB_RUN_ID=run_id, PIPECRAB_ARTIFACT_DIR=scratch_dir)
+
 
+def open_run_output(log_file_path, run_id, trigger):
+    # Child stdout: the task log itself, or with LOG_FORMAT=jsonl the run's spool,
+    # which follow_run_output turns into records
+    if structured_logs_enabled() and run_id:
+        log = get_structured_log()
+        log.begin_run(log_task_name(log_file_path), run_id, trigger)
+        return log.open_spool(log_task_name(log_file_path), run_id)
+    with log_trim_lock:
+        # Once open, the handle shows in /proc, so a trim after this sees the writer
+        return open(log_file_path, "a", encoding="utf-8")
+
+
+def follow_run_output(log_file_path, run_id, process):
+    if structured_logs_enabled() and run_id:
+        get_structured_log().follow(log_task_name(log_file_path), run_id, process)
+
+
+async def collect_artifacts(run_id, script_name, exit_code):
     try:
-        with open(SCRIPTS_JSON_PATH, "r", encoding="utf-8") as f:
-            scripts = json.load(f)
-            if not isinstance(scripts, list):
-                print("[LOAD] scripts.json is not a list")
-                return []
-            if len(scripts) <= 1:
-                print(f"[LOAD WARNING] scripts.json contains {len(scripts)} task(s). Watch for data loss.")
-            return scripts
+        collected = await run_io(get_artifact_store().finish_run, run_id, exit_code)
     except Exception as e:
-        print(f"[LOAD ERROR] Failed to load scripts.json: {e}")
-        return []
+        append_to_limited_log(f"logs/{script_name}.log", f"{get_timestamp()} [ERROR] Failed to collect artifacts of run {run_id}: {e}")
+        return
+    if collected:
+        append_to_limited_log(f"logs/{script_name}.log", f"{get_timestamp()} [MANAGER] Run {run_id}: stored {len(collected)} artifact(s).")
+
+
+async def load_scripts():
+    with phase("storage"):
+        return await get_task_store().load_all()
 
 
 
 async def save_scripts(scripts, original_id=None):
-    use_db = os.getenv("USE_SQL", "false").lower() == "true"
-    if use_db:
-        try:
-            return await asyncio.to_thread(save_sql_scripts, scripts, original_id)
-        except Exception as e:
-            print("[DB SAVE ERROR]", str(e).encode("ascii", errors="replace").decode())
-        return
+    store = get_task_store()
+    try:
+        with phase("storage"):
+            return await store.save(scripts, original_id)
+    except Exception as e:
+        print(f"[{store.kind.upper()} SAVE ERROR]", str(e).encode("ascii", errors="replace").decode())
 
-    if not isinstance(scripts, list) or not scripts:
-        print("[WARNING] Skipping save_scripts: scripts is empty or not a list")
-        return
 
-    # If updating one script in JSON mode
-    if original_id is not None:
-        if os.path.exists(SCRIPTS_JSON_PATH):
-            with open(SCRIPTS_JSON_PATH, "r", encoding="utf-8") as f:
-                existing = json.load(f)
-        else:
-            existing = []
-
-        updated = []
-        found = False
-        for s in existing:
-            if s.get("id") == original_id:
-                updated.append(scripts[0])  # replace
-                found = True
-            else:
-                updated.append(s)
 
-        if not found:
-            updated.extend(scripts)
+def cron_jitter(script):
+    jitter = script.get("cron_jitter")
+    if jitter is None or jitter == "":
+        return 0 if script.get("urgent") else CRON_JITTER_SECONDS
+    return max(0, int(jitter))
 
-        with open(SCRIPTS_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump(updated, f, indent=2)
-        return
 
-    # Default: full overwrite
-    with open(SCRIPTS_JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump(scripts, f, indent=2)
+def build_cron_trigger(cron_expr, jitter=0):
+    trigger = CronTrigger.from_crontab(cron_expr)
+    # APScheduler delays each fire by a random 0..jitter seconds
+    trigger.jitter = jitter or None
+    return trigger
+
+
+def host_busy():
+    if CRON_LOAD_THRESHOLD > 0 and hasattr(os, "getloadavg"):
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > CRON_LOAD_THRESHOLD:
+            return f"load average {load:.2f} per CPU"
+    if CRON_MAX_ACTIVE > 0:
+        active = sum(1 for p in reaper.watched_processes() if not isinstance(p, agents.RemoteProcess))
+        if active >= CRON_MAX_ACTIVE:
+            return f"{active} active processes"
+    return None
+
 
+def defer_cron_script(script_name, command, script_id, agent, deferred_since):
+    # One-shot retry job; misfire_grace_time=None so a busy scheduler never drops it
+    scheduler.add_job(
+        launch_cron_script, "date", run_date=datetime.now(scheduler.timezone) + timedelta(seconds=CRON_RECHECK_SECONDS),
+        args=[script_name, command, script_id, agent], kwargs={"deferred_since": deferred_since},
+        id=f"{script_id}_cron_deferred_{int(deferred_since * 1000)}", replace_existing=True, misfire_grace_time=None
+    )
 
 
+def cron_fire_key(script_id, cron_expr, jitter=0, now=None):
+    # The scheduled time a fire belongs to, before jitter, so every node computes the same key
+    now = now or datetime.now(scheduler.timezone)
+    trigger = CronTrigger.from_crontab(cron_expr, timezone=scheduler.timezone)
+    slot = None
+    fire = trigger.get_next_fire_time(None, now - timedelta(seconds=jitter + CRON_FIRE_KEY_WINDOW))
+    while fire is not None and fire <= now:
+        slot = fire
+        fire = trigger.get_next_fire_time(fire, fire + timedelta(seconds=1))
+    slot = slot or now.replace(second=0, microsecond=0)
+    return f"{script_id}@{slot.isoformat()}"
 
 
-def launch_cron_script(script_name: str, command: list[str]):
+def launch_cron_script(script_name: str, command: list[str], script_id=None, agent=None, urgent=False,
+                       deferred_since=None, cron_expr=None, jitter=0):
     log_file_path = f"logs/{script_name}.log"
-    append_to_limited_log(log_file_path, f"{get_timestamp()} Cron job triggered.")
 
-    try:
-        process = subprocess.Popen(command, stdout=open(log_file_path, "a"), stderr=subprocess.STDOUT, text=True)
-        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Cron-launched PID: {process.pid}")
+    if cluster is not None and agent:
+        # An agent is connected to one node only; that node launches, the others skip the fire
+        if agent not in agents.connected_agents:
+            return
+    elif cluster is not None:
+        # Cluster mode: every node with the schedule queues the fire, the fire key keeps one
+        try:
+            fire_key = cron_fire_key(script_id, cron_expr, jitter) if cron_expr else None
+            run_id = cluster.enqueue(script_id, script_name, fire_key)
+            if run_id is not None:
+                append_to_limited_log(log_file_path, f"{get_timestamp()} Cron job triggered. [CLUSTER] Queued run {run_id}")
+            else:
+                print(f"[CLUSTER] Cron fire of '{script_name}' ({fire_key}) already queued by another node")
+        except Exception as e:
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Failed to queue cluster run: {e}")
+        return
+
+    if deferred_since is None:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} Cron job triggered.")
+
+    if not urgent and not agent:
+        busy = host_busy()
+        waited = time.time() - deferred_since if deferred_since else 0
+        if busy and waited < CRON_MAX_DELAY_SECONDS:
+            if deferred_since is None:
+                append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Host busy ({busy}), delaying run.")
+            defer_cron_script(script_name, command, script_id, agent, deferred_since or time.time())
+            return
+        if deferred_since:
+            reason = f", still busy ({busy})" if busy else ""
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Delayed run starting after {waited:.0f}s{reason}.")
+
+    if agent:
+        # APScheduler thread: hand the launch to the event loop that owns the agent connection
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                agents.launch_remote(agent, command[2:], log_file_path, append_to_limited_log), agents.loop
+            )
+            process = future.result(timeout=agents.AGENT_LAUNCH_TIMEOUT + 1)
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Cron-launched on agent '{agent}', remote PID: {process.pid}")
+        except Exception as e:
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Failed to launch script on agent '{agent}': {e}")
+        return
 
-        # save process to running_processes
-        for script in running_processes:
-            if running_processes[script]["is_cron_job"] and script_name.lower() in script_name.lower():
-                running_processes[script]["process"] = process
-                break
+    try:
+        run_id, env = begin_artifact_run(script_name, script_id, "cron")
+        with open_run_output(log_file_path, run_id, "cron") as log_handle:
+            process = subprocess.Popen(command, stdout=log_handle, stderr=subprocess.STDOUT, text=True, env=env)
     except Exception as e:
         append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Failed to launch script: {e}")
+        return
 
+    try:
+        if loop is None:
+            raise RuntimeError("event loop not captured, start_scheduler() was not called from the app")
+        follow_run_output(log_file_path, run_id, process)
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Cron-launched PID: {process.pid}")
+        # APScheduler thread: the reaper lives on the event loop
+        loop.call_soon_threadsafe(
+            reaper.watch, f"cron:{run_id}", process, lambda p: collect_artifacts(run_id, script_name, p.returncode)
+        )
+        loop.call_soon_threadsafe(set_cron_process, script_id, process)
+    except Exception as e:
+        # Nothing would watch or reap the child, so it is not left running untracked
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Cron run bookkeeping failed, killing PID {process.pid}: {e}")
+        process.kill()
+        process.wait()
+        try:
+            get_artifact_store().finish_run(run_id, process.returncode)
+        except Exception as e:
+            print(f"[ARTIFACTS] Failed to close run {run_id}: {e}")
 
 
-@router.get("/")
-async def list_scripts():
-    use_sql = os.getenv("USE_SQL", "false").lower() == "true"
 
-    if use_sql:
-        from app.utils.db import get_sql_connection
-        conn = get_sql_connection()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="SQL connection failed")
+def set_cron_process(script_id, process):
+    # Latest cron run of a scheduled task, shown as its process
+    info = running_processes.get(script_id)
+    if info is not None and info["is_cron_job"]:
+        info["process"] = process
+
 
+def scan_log_stats(log_path, apps):
+    run_count = 0
+    has_errors = False
+    if structured_logs_enabled():
+        # Runs and warning/error records are indexed, nothing to scan
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Id, Name, Path, Description, Tags, IsEnabled, UseScheduler, CronExpr, CronExprParse, Apps,EmailRecipients, BotName, PassBotParam, PassPushParam, PushText FROM Tasks")
-            rows = cursor.fetchall()
-
-            scripts = []
-            for row in rows:
-                name = row.Name
-                log_path = f"logs/{name}.log"
-                run_count = 0
-                uptime = 0
-                has_errors = False
-                apps = json.loads(row.Apps or "[]")
-
-                if row.Id in running_processes:
-                    status = "running"
-                    uptime = int((datetime.utcnow() - running_processes[row.Id]["start_time"]).total_seconds())
-                elif row.Id in stopped_uptime_seconds:
-                    status = "stopped"
-                    uptime = stopped_uptime_seconds[row.Id]
-                else:
-                    status = "stopped"
-
-                if os.path.exists(log_path):
-                    try:
-                        with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                            log_text = f.read()
-                            last_start = log_text.rfind("Task started.")
-                            if "scheduler" in apps and last_start != -1:
-                                run_count = log_text[last_start:].count("Cron job triggered.")
-                            elif "scheduler" in apps:
-                                run_count = log_text.count("Cron job triggered.")
-                            else:
-                                run_count = log_text.count("Script executed.")
-
-                            recent_session = log_text[last_start:] if last_start != -1 else ""
-                            if re.search(r"(error|exception|failed|critical|fatal|warning|[a-zA-Z]*Error|[a-zA-Z]*Exception)", recent_session, re.IGNORECASE):
-                                has_errors = True
-                    except Exception:
-                        pass
-
-                scripts.append({
-                    "id": row.Id,
-                    "name": name,
-                    "enabled": row.IsEnabled == 1,
-                    "path": row.Path,
-                    "description": row.Description,
-                    "tags": row.Tags or "",
-                    "apps": apps,
-                    "email_recipients": row.EmailRecipients or "",
-                    "status": status,
-                    "uptime_seconds": uptime,
-                    "run_count": run_count,
-                    "has_errors": has_errors,
-                    "schedule_expression": row.CronExpr,
-                    "cron_expr_parse": row.CronExprParse,
-                    "bot_name": row.BotName,
-                    "pass_bot_param": row.PassBotParam,
-                    "pass_push_param": getattr(row, "PassPushParam", False),
-                    "push_text": getattr(row, "PushText", ""),
-                })
-
-
-            return scripts
+            return get_structured_log().stats(log_task_name(log_path), cron_only="scheduler" in apps)
+        except Exception:
+            return run_count, has_errors
+    if not os.path.exists(log_path):
+        return run_count, has_errors
 
-        except Exception as e:
-            print("[SQL] list_scripts error:", e)
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            conn.close()
+    try:
+        # Only the last session is read and decoded, found by scanning back from EOF
+        recent = read_last_session(log_path)
+        recent_session = recent.decode("utf-8", errors="ignore") if recent is not None else ""
+        if "scheduler" in apps and recent is not None:
+            run_count = recent_session.count("Cron job triggered.")
+        else:
+            with open(log_path, "rb") as f:
+                run_count = f.read().count(b"Cron job triggered." if "scheduler" in apps else b"Script executed.")
 
-    # === fallback to JSON ===
-    scripts = await load_scripts()
-    for script in scripts:
-        name = script["name"]
-        log_file_path = f"logs/{name}.log"
+        if re.search(r"(error|exception|failed|critical|fatal|warning|[a-zA-Z]*Error|[a-zA-Z]*Exception)", recent_session, re.IGNORECASE):
+            has_errors = True
+    except Exception:
+        pass
+    return run_count, has_errors
+
+
+def scan_all_log_stats(scripts):
+    return [scan_log_stats(f"logs/{s['name']}.log", s.get("apps", [])) for s in scripts]
+
+
+@router.get("/")
+async def list_scripts():
+    store = get_task_store()
+    try:
+        with phase("storage"):
+            scripts = await store.list_all()
+    except Exception as e:
+        print(f"[{store.kind.upper()}] list_scripts error:", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
+    # One executor hop for all log files instead of a blocking read per task
+    with phase("log_scan"):
+        log_stats = await run_io(scan_all_log_stats, scripts)
+
+    for script, (run_count, has_errors) in zip(scripts, log_stats):
+        script["state"] = task_states.state(script.get("id"))
         if script.get("id") in running_processes:
             script["status"] = "running"
             uptime = datetime.utcnow() - running_processes[script["id"]]["start_time"]
@@ -276,36 +372,37 @@ async def list_scripts():
             script["status"] = "stopped"
             script["uptime_seconds"] = 0
 
-        script["run_count"] = 0
-        if os.path.exists(log_file_path):
-            try:
-                with open(log_file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    log_text = f.read()
-                    if "scheduler" in script.get("apps", []):
-                        last_start = log_text.rfind("Task started.")
-                        if last_start != -1:
-                            session_text = log_text[last_start:]
-                            script["run_count"] = session_text.count("Cron job triggered.")
-                        else:
-                            script["run_count"] = log_text.count("Cron job triggered.")
-                    else:
-                        script["run_count"] = log_text.count("Script executed.")
-            except Exception:
-                pass
-
-        script["has_errors"] = False
-        if os.path.exists(log_file_path):
-            try:
-                with open(log_file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-                    sessions = content.split("[")
-                    recent_session = next(("[" + sessions[i] + "".join(sessions[i+1:]) for i in range(len(sessions) - 1, -1, -1) if "Task started." in sessions[i]), "")
-                    if re.search(r"(error|exception|failed|critical|fatal|warning|[a-zA-Z]*Error|[a-zA-Z]*Exception)", recent_session, re.IGNORECASE):
-                        script["has_errors"] = True
-            except Exception:
-                pass
+        script["run_count"] = run_count
+        script["has_errors"] = has_errors
+
+    with phase("serialization"):
+        return JSONResponse(jsonable_encoder(scripts))
+
+
+@router.get("/schedule/timeline")
+async def schedule_timeline(hours: int = 24, next_runs: int = 5):
+    if not 1 <= hours <= 168:
+        raise HTTPException(status_code=400, detail="hours must be between 1 and 168")
+
+    names = {f"{s['id']}_cron": s["name"] for s in await load_scripts()}
+    jobs = []
+    for job in scheduler.get_jobs():
+        if not isinstance(job.trigger, CronTrigger):
+            continue
+        if job.id.startswith("pipeline_"):
+            name = f"pipeline: {job.id[len('pipeline_'):-len('_cron')]}"
+        else:
+            name = names.get(job.id, job.id)
+        jobs.append({"job_id": job.id, "name": name, "trigger": job.trigger})
 
-    return scripts
+    start = datetime.now(scheduler.timezone)
+    timeline = await run_io(build_timeline, jobs, start, hours, next_runs)
+    for entry in timeline["jobs"]:
+        try:
+            entry["description"] = describe_cron(entry["expression"])
+        except Exception:
+            entry["description"] = ""
+    return timeline
 
 
 @router.post("/")
@@ -320,7 +417,11 @@ async def add_script(
     bot_name: str = Body(default=DEFAULT_BOT_NAME),
     pass_push_param: bool = Body(default=False),
     push_text: str = Body(default=""),
-    schedule_expression: str = Body(default="* * * * *")
+    schedule_expression: str = Body(default="* * * * *"),
+    agent: str = Body(default=""),
+    cron_jitter: int | None = Body(default=None),
+    urgent: bool = Body(default=False),
+    profile: str = Body(default="")
 ):
     scripts = await load_scripts()
     if any(script["name"] == name for script in scripts):
@@ -340,12 +441,16 @@ async def add_script(
         "pass_push_param": pass_push_param,
         "push_text": push_text,
         "schedule_expression": schedule_expression,
+        "agent": agent.strip(),
+        "cron_jitter": cron_jitter,
+        "urgent": urgent,
+        "profile": profile if profile in PROFILE_MODES else "",
         "enabled": False,
         "id": None
     }
 
     try:
-        new_script["cron_expr_parse"] = get_description(schedule_expression)
+        new_script["cron_expr_parse"] = describe_cron(schedule_expression)
     except Exception:
         new_script["cron_expr_parse"] = ""
 
@@ -355,31 +460,30 @@ async def add_script(
     destination_path = os.path.join(scripts_folder, os.path.basename(path))
     copied_to_scripts = False
 
-    # If outside /scripts, copy it in
+    # If outside /scripts, copy it in (skipped when scripts/ already has the same content)
     if (
         not os.path.commonpath([source_path, scripts_folder]) == scripts_folder
         and source_path != destination_path
     ):
-        os.makedirs(scripts_folder, exist_ok=True)
         try:
-            shutil.copy2(source_path, destination_path)
+            _, _, copied_to_scripts = await run_io(get_script_store().sync_file, source_path, destination_path)
             new_script["path"] = destination_path
-            copied_to_scripts = True
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to copy script: {e}")
 
     # Save script and assign ID
-    from app.utils.db import save_sql_scripts
-    new_id = await asyncio.to_thread(save_sql_scripts, [new_script])
-    new_script["id"] = new_id
-    new_script["script_json"] = json.dumps({k: v for k, v in new_script.items() if k != "script_json"})
-
-    await save_scripts([new_script], original_id=new_id)
+    try:
+        new_script["id"] = await get_task_store().insert(new_script)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save script: {e}")
+    await record_script_version(new_script, "add")
 
     # Create log file if not exists
     os.makedirs("logs", exist_ok=True)
     log_file_path = f"logs/{name}.log"
-    if not os.path.exists(log_file_path):
+    if structured_logs_enabled():
+        append_to_limited_log(log_file_path, f"{get_timestamp()} Log file initialized.")
+    elif not os.path.exists(log_file_path):
         with open(log_file_path, "w", encoding="utf-8") as f:
             f.write(f"{get_timestamp()} Log file initialized.\n")
 
@@ -388,120 +492,365 @@ async def add_script(
 
 
 
-def log_subprocess_output(pipe, log_file_path):
-    for line in iter(pipe.readline, ''):
-        if not line:
-            break
-        append_to_limited_log(log_file_path, line.rstrip())
-
-@router.post("/start/{script_name}")
-async def start_script(script_name: str):
-    scripts = await load_scripts()
-    matching = next((s for s in scripts if s["name"].strip().lower() == script_name.strip().lower()), None)
-    if not matching:
-        raise HTTPException(status_code=404, detail=f"Script '{script_name}' not found")
-    if matching["id"] in running_processes:
-        raise HTTPException(status_code=400, detail="Script already running")
+def open_log_writers(log_dir="logs"):
+    # Log files any process (children, detached or adopted runs, this process) has open,
+    # from /proc/*/fd; None where there is no /proc
+    if not os.path.isdir("/proc"):
+        return None
+    root = os.path.abspath(log_dir) + os.sep
+    held = set()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith(root):
+                held.add(target)
+    return held
 
-    full_path = os.path.abspath(matching["path"])
-    if not os.path.isfile(full_path):
-        raise HTTPException(status_code=404, detail="Script file does not exist or is invalid")
 
-    os.makedirs("logs", exist_ok=True)
+def trim_log(log_file_path, max_lines=LOG_LINE_LIMIT):
+    # Only for files nobody has open: the tail is written to a new file and swapped in
+    try:
+        if not os.path.exists(log_file_path):
+            return False
+        with MappedLog(log_file_path) as log:
+            start = log.tail_offset(max_lines, log.size)
+            if start == 0:
+                return False
+            tail = log.read(start, log.size)
+        tmp_path = f"{log_file_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(tail)
+        os.replace(tmp_path, log_file_path)
+        return True
+    except Exception as e:
+        print(f"[LOGGING] Failed to trim {log_file_path}: {e}")
+        return False
+
+
+def trim_idle_logs(busy_paths, log_dir="logs", max_lines=LOG_LINE_LIMIT):
+    # A file another process appends to is never rewritten, or lines written between the
+    # read and the swap would be lost; it is trimmed once its writer has exited.
+    # The lock keeps open_run_output from opening a log while it is checked and swapped.
+    if not os.path.isdir(log_dir):
+        return 0
+    trimmed = 0
+    with log_trim_lock:
+        held = open_log_writers(log_dir)
+        if held is None:
+            held = {os.path.abspath(path) for path in busy_paths}
+        for entry in os.scandir(log_dir):
+            if entry.is_file() and entry.name.endswith(".log") and os.path.abspath(entry.path) not in held:
+                trimmed += trim_log(entry.path, max_lines)
+    return trimmed
+
+
+async def log_maintenance_loop(interval=LOG_TRIM_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        if structured_logs_enabled():
+            continue  # segments rotate on their own
+        # Fallback without /proc: logs of tasks with a live local process
+        busy = [
+            info["log_file_path"] for info in list(running_processes.values())
+            if info["is_cron_job"] or (info["process"] is not None and info["process"].poll() is None)
+        ]
+        await run_io(trim_idle_logs, busy)
+
+
+async def complete_one_time_run(script_id, script_name, process):
     log_file_path = f"logs/{script_name}.log"
+
+    info = running_processes.get(script_id)
+    if not info or info["process"] is not process:
+        return  # stopped manually in the meantime
+
+    exit_code = "unknown, adopted process" if getattr(process, "adopted", False) else process.returncode
+    append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] 1timerun completed (exit code {exit_code}), stopping task.")
+    try:
+        await stop_script(script_name)
+    except HTTPException as e:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Auto-stop failed: {e.detail}")
+
+
+def build_command(script):
+    full_path = os.path.abspath(script["path"])
     # command = ["python", "-u", full_path]
-    command = [r"C:\Program Files\Python312\python.exe", "-u", full_path]
+    command = [PYTHON_EXECUTABLE, "-u", full_path]
 
-    if "telegram" in matching.get("apps", []):
-        if matching.get("pass_bot_param", True):
-            bot_name = matching.get("bot_name", DEFAULT_BOT_NAME)
+    profile_mode = script.get("profile", "")
+    if profile_mode in PROFILE_MODES and not script.get("agent", "").strip():
+        # Same script and arguments, run through the profiler wrapper; the profile lands in the run's artifacts
+        command = [PYTHON_EXECUTABLE, "-u", "-m", "app.utils.profile_runner", "--mode", profile_mode, "--top", str(PROFILE_TOP_N), full_path]
+
+    if "telegram" in script.get("apps", []):
+        if script.get("pass_bot_param", True):
+            bot_name = script.get("bot_name", DEFAULT_BOT_NAME)
             command.extend(["--bot", bot_name])
 
-    if matching.get("pass_push_param", False):
-        push_text = matching.get("push_text", "").strip()
+    if script.get("pass_push_param", False):
+        push_text = script.get("push_text", "").strip()
         if push_text:
             command.extend(["--push", f'"{push_text}"'])
 
-    if "email" in matching.get("apps", []):
-        raw = matching.get("email_recipients", "").strip()
+    if "email" in script.get("apps", []):
+        raw = script.get("email_recipients", "").strip()
         if raw:
             parts = re.split(r"[,\s;]+", raw)
             cleaned = [p.strip() for p in parts if p.strip()]
             command.extend(["--email", ",".join(cleaned)])
 
+    return command
+
+
+@router.post("/start/{script_name}")
+async def start_script(script_name: str):
+    scripts = await load_scripts()
+    matching = next((s for s in scripts if s["name"].strip().lower() == script_name.strip().lower()), None)
+    if not matching:
+        raise HTTPException(status_code=404, detail=f"Script '{script_name}' not found")
+    return await start_task(matching, script_name)
+
+
+async def start_task(matching, script_name, persist=True, idempotent=False):
+    # persist=False leaves saving the task to the caller (bulk operations save once);
+    # idempotent=True reports a task that is already running instead of rejecting it
+    async with task_states.operation(matching["id"], "start"):
+        if matching["id"] in running_processes:
+            if idempotent:
+                return {"message": f"Script '{script_name}' is already running", "changed": False}
+            raise HTTPException(status_code=400, detail="Script already running")
+        task_states.transition(matching["id"], "starting")
+        try:
+            return await launch_task(matching, script_name, persist)
+        finally:
+            # Whatever happened, the state follows what is actually tracked
+            task_states.transition(matching["id"], "running" if matching["id"] in running_processes else "stopped")
+
+
+async def launch_task(matching, script_name, persist=True):
+    full_path = os.path.abspath(matching["path"])
+    if not matching.get("agent") and not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Script file does not exist or is invalid")
+
+    os.makedirs("logs", exist_ok=True)
+    log_file_path = f"logs/{script_name}.log"
+    command = build_command(matching)
+    agent_name = matching.get("agent", "").strip()
+
     cron_expr = matching.get("schedule_expression", "").strip()
     if cron_expr and "scheduler" in matching.get("apps", []):
-        trigger = CronTrigger.from_crontab(cron_expr)
-        scheduler.add_job(launch_cron_script, trigger, args=[script_name, command], id=f"{matching['id']}_cron", replace_existing=True)
+        jitter = cron_jitter(matching)
+        trigger = build_cron_trigger(cron_expr, jitter)
+        scheduler.add_job(
+            launch_cron_script, trigger, args=[script_name, command, matching["id"], agent_name or None],
+            kwargs={"urgent": bool(matching.get("urgent")), "cron_expr": cron_expr, "jitter": jitter},
+            id=f"{matching['id']}_cron", replace_existing=True
+        )
 
         running_processes[matching["id"]] = {
             "process": None,
             "start_time": datetime.utcnow(),
-            "is_cron_job": True
+            "is_cron_job": True,
+            "log_file_path": log_file_path
         }
 
         append_to_limited_log(log_file_path, f"{get_timestamp()} Task started.")
         append_to_limited_log(log_file_path, f"{get_timestamp()} Launch command: {' '.join(command)}")
-        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Scheduled script (no PID yet)")
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Scheduled script (no PID yet)" + (f", jitter up to {jitter}s" if jitter else ""))
 
         matching["enabled"] = True
         matching["status"] = "running"
         matching["script_json"] = json.dumps({k: v for k, v in matching.items() if k != "script_json"})
-        if isinstance(matching, dict):
+        if persist:
             await save_scripts([matching], original_id=matching["id"])
 
         return {"message": f"Scheduled '{script_name}' via cron"}
 
-    # Standard script launch
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    # Standard script launch: the child writes straight into its log file, so output
+    # keeps flowing (and the process keeps running) across dashboard restarts
+    append_to_limited_log(log_file_path, f"{get_timestamp()} Task started.")
+    append_to_limited_log(log_file_path, f"{get_timestamp()} Launch command: {' '.join(command)}")
+
+    if agent_name:
+        try:
+            process = await agents.launch_remote(agent_name, command[2:], log_file_path, append_to_limited_log)
+        except Exception as e:
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Failed to launch script on agent '{agent_name}': {e}")
+            raise HTTPException(status_code=503, detail=f"Agent launch failed: {e}")
+    else:
+        run_id, env = await run_io(begin_artifact_run, matching["name"], matching["id"])
+        with await run_io(open_run_output, log_file_path, run_id, "manual") as log_handle:
+            process = subprocess.Popen(command, stdout=log_handle, stderr=subprocess.STDOUT, text=True, env=env, **detached_popen_kwargs())
+        follow_run_output(log_file_path, run_id, process)
+
+    cluster_run_id = None
+    if cluster is not None and not agent_name:
+        # Recorded in TaskRuns so other nodes do not autostart a second copy
+        try:
+            cluster_run_id = await cluster.record_local_run(matching["id"], script_name)
+        except Exception as e:
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Failed to record cluster run: {e}")
 
+    start_time = datetime.utcnow()
     running_processes[matching["id"]] = {
         "process": process,
-        "start_time": datetime.utcnow(),
-        "is_cron_job": False
+        "start_time": start_time,
+        "is_cron_job": False,
+        "log_file_path": log_file_path,
+        "run_id": None if agent_name else run_id,
+        "cluster_run_id": cluster_run_id
     }
-
-    append_to_limited_log(log_file_path, f"{get_timestamp()} Task started.")
-    append_to_limited_log(log_file_path, f"{get_timestamp()} Launch command: {' '.join(command)}")
-    append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Starting process PID: {process.pid}")
-
-    log_thread = threading.Thread(target=log_subprocess_output, args=(process.stdout, log_file_path))
-    log_thread.start()
+    if agent_name:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Started on agent '{agent_name}', remote PID: {process.pid}")
+    else:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Starting process PID: {process.pid}")
+        await run_io(register_process, matching["id"], script_name, process.pid, command, start_time, log_file_path, run_id)
 
     matching["enabled"] = False if "1timerun" in matching.get("apps", []) else True
     matching["status"] = "running"
     matching["script_json"] = json.dumps({k: v for k, v in matching.items() if k != "script_json"})
-    if isinstance(matching, dict):
+    if persist:
         await save_scripts([matching], original_id=matching["id"])
 
-    if "1timerun" in matching.get("apps", []):
-        def auto_stop():
-            try:
-                process.wait()
-                log_thread.join()
-                append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] 1timerun completed, triggering stop.")
-                import requests
-                port = os.getenv("PORT", "8000")
-                requests.post(f"http://127.0.0.1:{port}/scripts/stop/{script_name}")
-            except Exception as e:
-                append_to_limited_log(log_file_path, f"{get_timestamp()} [ERROR] Auto-stop failed: {e}")
-
-        threading.Thread(target=auto_stop, daemon=True).start()
+    one_time = "1timerun" in matching.get("apps", [])
+    if not agent_name:
+        reaper.watch(matching["id"], process, lambda p: on_local_exit(matching["id"], script_name, run_id, one_time, p, cluster_run_id))
+    elif one_time:
+        reaper.watch(matching["id"], process, lambda p: complete_one_time_run(matching["id"], script_name, p))
 
     return {"message": f"Started script '{script_name}'"}
 
 
+async def on_local_exit(script_id, script_name, run_id, one_time, process, cluster_run_id=None):
+    exit_code = None if getattr(process, "adopted", False) else process.returncode
+    if run_id:
+        await collect_artifacts(run_id, script_name, exit_code)
+    if cluster_run_id:
+        await finish_cluster_local_run(cluster_run_id, exit_code)
+    if one_time:
+        await complete_one_time_run(script_id, script_name, process)
+
+
 
 
     
 
+async def terminate_process(process, log_file_path, grace_seconds=5):
+    if not process or process.poll() is not None:
+        return
+
+    append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Sending SIGTERM to PID {process.pid}")
+    process.terminate()
+
+    # Poll instead of process.wait() so the event loop keeps serving while we wait
+    deadline = asyncio.get_running_loop().time() + grace_seconds
+    while process.poll() is None and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+
+    if process.poll() is None:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] WARNING: Process {process.pid} did not terminate in time. Forcing kill.")
+        process.kill()
+    else:
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Process {process.pid} terminated cleanly.")
+
+
+def select_tasks(scripts, ids, tag, app):
+    # All given selectors must match; tags compare without the leading "#"
+    tag = tag.strip().lstrip("#").lower()
+    return [
+        s for s in scripts
+        if (not ids or s.get("id") in ids)
+        and (not tag or tag in (t.lstrip("#").lower() for t in (s.get("tags") or "").split()))
+        and (not app or app in s.get("apps", []))
+    ]
+
+
+@router.post("/bulk")
+async def bulk_action(request: BulkRequest):
+    if request.action not in BULK_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"action must be one of: {', '.join(BULK_ACTIONS)}")
+    if not (request.ids or request.tag or request.app):
+        raise HTTPException(status_code=400, detail="Select tasks by ids, tag or app")
+
+    selected = select_tasks(await load_scripts(), set(request.ids), request.tag, request.app)
+    changed = []
+
+    async def run(script):
+        name = script["name"]
+        before = (script.get("enabled"), script.get("status"))
+        try:
+            if request.action in ("stop", "restart"):
+                result = await stop_task(script, name, persist=False, idempotent=True)
+            if request.action in ("start", "restart"):
+                # Same slots as pipeline steps, so a bulk start cannot fork everything at once
+                async with launch_slots:
+                    result = await start_task(script, name, persist=False, idempotent=True)
+            if request.action in ("enable", "disable"):
+                script["enabled"] = request.action == "enable"
+                script["script_json"] = json.dumps({k: v for k, v in script.items() if k != "script_json"})
+                result = {"message": f"Script '{name}' {request.action}d"}
+            outcome = {"ok": True, "changed": result.get("changed", True), "message": result["message"]}
+        except HTTPException as e:
+            outcome = {"ok": False, "error": e.detail}
+        except Exception as e:
+            outcome = {"ok": False, "error": str(e)}
+        if (script.get("enabled"), script.get("status")) != before:
+            changed.append(script)
+        return dict(outcome, id=script["id"], name=name, state=task_states.state(script["id"]))
+
+    results = await asyncio.gather(*(run(script) for script in selected))
+
+    # One store write for all tasks instead of a save per task
+    if changed:
+        await get_task_store().save_many(changed)
+    if request.action in ("stop", "restart") and changed:
+        await get_task_store().save_runtime_state({
+            "saved_at": datetime.utcnow().isoformat(),
+            "stopped_uptime_seconds": stopped_uptime_seconds,
+        })
+
+    return {
+        "action": request.action,
+        "matched": len(selected),
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "results": results,
+    }
+
+
 @router.post("/stop/{script_name}")
 async def stop_script(script_name: str):
     scripts = await load_scripts()
     matching = next((s for s in scripts if s["name"].strip().lower() == script_name.strip().lower()), None)
-    if not matching or matching["id"] not in running_processes:
-        raise HTTPException(status_code=400, detail="Script not running")
+    if not matching:
+        raise HTTPException(status_code=404, detail=f"Script '{script_name}' not found")
+    return await stop_task(matching, script_name)
+
+
+async def stop_task(matching, script_name, persist=True, idempotent=False):
+    async with task_states.operation(matching["id"], "stop"):
+        if matching["id"] not in running_processes:
+            if idempotent:
+                return {"message": f"Script '{script_name}' is not running", "changed": False}
+            raise HTTPException(status_code=400, detail="Script not running")
+        task_states.transition(matching["id"], "stopping")
+        try:
+            return await halt_task(matching, script_name, persist)
+        finally:
+            task_states.transition(matching["id"], "stopped")
 
+
+async def halt_task(matching, script_name, persist=True):
     info = running_processes.pop(matching["id"])
     log_file_path = f"logs/{script_name}.log"
 
@@ -510,17 +859,19 @@ async def stop_script(script_name: str):
             scheduler.remove_job(f"{matching['id']}_cron")
         except JobLookupError:
             pass
+        # Runs held back by the load-aware dispatcher are dropped with the schedule
+        for job in scheduler.get_jobs():
+            if job.id.startswith(f"{matching['id']}_cron_deferred_"):
+                job.remove()
     else:
-        process = info["process"]
-        if process and process.poll() is None:
-            append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Sending SIGTERM to PID {process.pid}")
-            process.terminate()
-            try:
-                process.wait(timeout=5)
-                append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Process {process.pid} terminated cleanly.")
-            except subprocess.TimeoutExpired:
-                append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] WARNING: Process {process.pid} did not terminate in time. Forcing kill.")
-                process.kill()
+        reaper.unwatch(matching["id"])
+        await terminate_process(info["process"], log_file_path)
+        await run_io(unregister_process, matching["id"])
+        if info.get("run_id"):
+            exit_code = None if getattr(info["process"], "adopted", False) else info["process"].returncode
+            await collect_artifacts(info["run_id"], script_name, exit_code)
+        if info.get("cluster_run_id"):
+            await finish_cluster_local_run(info["cluster_run_id"], None)
 
     append_to_limited_log(log_file_path, f"{get_timestamp()} Task stopped.")
 
@@ -531,33 +882,9 @@ async def stop_script(script_name: str):
     matching["status"] = "stopped"
     matching["script_json"] = json.dumps({k: v for k, v in matching.items() if k != "script_json"})
 
-    if isinstance(matching, dict):
+    if persist:
         await save_scripts([matching], original_id=matching["id"])
-
-    use_db = os.getenv("USE_SQL", "false").lower() == "true"
-    if use_db:
-        from app.utils.db import get_sql_connection
-        conn = get_sql_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                run_count = matching.get("run_count", 0)
-                cursor.execute("""
-                    UPDATE Tasks
-                    SET IsEnabled = 0,
-                        LastUpTime = ?,
-                        LastLaunchCount = ?
-                    WHERE Id = ?
-                """, (
-                    int(uptime.total_seconds()),
-                    run_count,
-                    matching["id"]
-                ))
-                conn.commit()
-            except Exception as e:
-                print("[DB] Failed to update script state:", e)
-            finally:
-                conn.close()
+        await get_task_store().update_state(matching["id"], False, int(uptime.total_seconds()), matching.get("run_count", 0))
 
     return {"message": f"Stopped script '{script_name}'"}
 
@@ -565,16 +892,83 @@ async def stop_script(script_name: str):
 
 
 
+def read_text_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
 @router.get("/logs/{log_type}", response_class=PlainTextResponse)
-async def view_logs(log_type: str):
+async def view_logs(log_type: str, tail: int | None = None, since_session: str | None = None, before_offset: int | None = None):
+    if tail is not None and tail < 1:
+        raise HTTPException(status_code=400, detail="tail must be at least 1")
+    if since_session not in (None, "last"):
+        raise HTTPException(status_code=400, detail="since_session only supports 'last'")
+
+    if structured_logs_enabled():
+        if since_session or before_offset is not None:
+            raise HTTPException(status_code=400, detail="Use /scripts/logs/{name}/query with LOG_FORMAT=jsonl")
+        log = get_structured_log()
+        if not await run_io(log.exists, log_type):
+            raise HTTPException(status_code=404, detail="Log file not found")
+        return await run_io(log.text, log_type, tail or LOG_LINE_LIMIT)
+
     log_path = f"logs/{log_type}.log"
     if not os.path.exists(log_path):
         raise HTTPException(status_code=404, detail="Log file not found")
-    with open(log_path, "r", encoding="utf-8") as f:
-        return f.read()
+    if tail is None and since_session is None and before_offset is None:
+        return await run_io(read_text_file, log_path)
+
+    if before_offset is not None and tail is None and since_session is None:
+        tail = LOG_LINE_LIMIT  # paging backwards: one screen at a time
+    text, start, end, size = await run_io(read_log_window, log_path, tail, since_session == "last", before_offset)
+    # X-Log-Start is the before_offset of the previous page; 0 means the start of the log
+    return PlainTextResponse(text, headers={"X-Log-Start": str(start), "X-Log-End": str(end), "X-Log-Size": str(size)})
+
+@router.get("/logs/{log_type}/query")
+async def query_logs(log_type: str, run: str | None = None, level: str | None = None,
+                     since: float | None = None, until: float | None = None, limit: int = 200):
+    # e.g. ?run=last&level=error: the errors of the latest run, read via the index
+    if not structured_logs_enabled():
+        raise HTTPException(status_code=400, detail="Log queries need LOG_FORMAT=jsonl")
+    if level is not None and level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"level must be one of: {', '.join(LEVELS)}")
+    log = get_structured_log()
+    result = await run_io(log.query, log_type, run, level, since, until, max(1, min(limit, 5000)))
+    if result["run_id"]:
+        result["run"] = await run_io(log.run_summary, log_type, result["run_id"])
+    return result
+
+
+def latest_profile(script_name):
+    # Newest run of the task that stored a profile.json artifact
+    store = get_artifact_store()
+    for run in store.list_runs(script_name, limit=50):
+        path = store.find_artifact(run["run_id"], "profile.json")
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            profile.update(run_id=run["run_id"], started_at=run["started_at"])
+            profile["downloads"] = [
+                f"/artifacts/download/{run['run_id']}/{name}" for name in ("profile.prof", "profile.collapsed")
+                if store.find_artifact(run["run_id"], name)
+            ]
+            return profile
+    return None
+
+
+@router.get("/profile/{script_name}")
+async def get_script_profile(script_name: str):
+    profile = await run_io(latest_profile, script_name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile recorded for this task")
+    return profile
+
 
 @router.post("/clear_log/{script_name}")
 async def clear_log(script_name: str):
+    if structured_logs_enabled():
+        await run_io(get_structured_log().clear, script_name)
+        return {"message": "Log cleared."}
     path = f"logs/{script_name}.log"
     if os.path.exists(path):
         open(path, "w").close()
@@ -584,34 +978,18 @@ async def clear_log(script_name: str):
 
 @router.delete("/delete/{script_id}")
 async def delete_script(script_id: int):
-    use_db = os.getenv("USE_SQL", "false").lower() == "true"
-    script_name = None
+    store = get_task_store()
+    try:
+        script_name = await store.delete(script_id)
+    except Exception as e:
+        print(f"[{store.kind.upper()}] Delete error:", e)
+        raise HTTPException(status_code=500, detail="Failed to delete script.")
 
-    if use_db:
-        from app.utils.db import get_sql_connection
-        conn = get_sql_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Name FROM Tasks WHERE Id = ?", script_id)
-                row = cursor.fetchone()
-                if row:
-                    script_name = row.Name
-                cursor.execute("DELETE FROM Tasks WHERE Id = ?", script_id)
-                conn.commit()
-                print(f"[DB] Deleted task with ID: {script_id}")
-            except Exception as e:
-                print("[DB] Delete error:", e)
-                raise HTTPException(status_code=500, detail="Failed to delete script.")
-            finally:
-                conn.close()
-    else:
-        scripts = await load_scripts()
-        for s in scripts:
-            if s.get("id") == script_id:
-                script_name = s.get("name")
-        scripts = [s for s in scripts if s.get("id") != script_id]
-        await save_scripts(scripts)
+    task_states.forget(script_id)
+    try:
+        await run_io(get_script_store().forget_task, script_id)
+    except Exception as e:
+        print(f"[SCRIPT STORE] Failed to drop version history of task {script_id}: {e}")
 
     # Delete associated log file
     if script_name:
@@ -622,6 +1000,8 @@ async def delete_script(script_id: int):
                 print(f"[LOG] Deleted log file: {log_path}")
         except Exception as e:
             print(f"[LOG] Failed to delete log file for '{script_name}': {e}")
+        if structured_logs_enabled():
+            await run_io(get_structured_log().clear, script_name)
 
     return {"message": f"Script with ID {script_id} deleted."}
 
@@ -643,7 +1023,11 @@ async def update_script(
     pass_push_param: bool = Body(default=False),
     push_text: str = Body(default=""),
     schedule_expression: str = Body(default="* * * * *"),
-    enabled: bool = Body(default=False)
+    enabled: bool = Body(default=False),
+    agent: str | None = Body(default=None),
+    cron_jitter: int | None = Body(default=None),
+    urgent: bool | None = Body(default=None),
+    profile: str | None = Body(default=None)
 ):
     scripts = await load_scripts()
     script = next((s for s in scripts if s.get("id") == id), None)
@@ -668,10 +1052,19 @@ async def update_script(
         "schedule_expression": schedule_expression,
         "enabled": enabled
     })
+    if agent is not None:
+        # The dashboard form has no agent field, so an omitted value keeps the current one
+        script["agent"] = agent.strip()
+    if cron_jitter is not None:
+        script["cron_jitter"] = cron_jitter if cron_jitter >= 0 else None  # -1 resets to CRON_JITTER_SECONDS
+    if urgent is not None:
+        script["urgent"] = urgent
+    if profile is not None:
+        script["profile"] = profile if profile in PROFILE_MODES else ""
 
     try:
         cron_expr = script.get("schedule_expression", "* * * * *")
-        script["cron_expr_parse"] = get_description(cron_expr)
+        script["cron_expr_parse"] = describe_cron(cron_expr)
     except Exception:
         script["cron_expr_parse"] = ""
 
@@ -688,15 +1081,14 @@ async def update_script(
         not os.path.commonpath([source_path, scripts_folder]) == scripts_folder
         and source_path != destination_path
     ):
-        os.makedirs(scripts_folder, exist_ok=True)
         try:
-            shutil.copy2(source_path, destination_path)
+            _, _, copied_to_scripts = await run_io(get_script_store().sync_file, source_path, destination_path)
             script["path"] = destination_path
             script["script_json"] = json.dumps({k: v for k, v in script.items() if k != "script_json"})
             await save_scripts([script], original_id=script["id"])
-            copied_to_scripts = True
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to copy script: {e}")
+    await record_script_version(script, "update")
 
     return {"message": "Script updated.", "copied_to_scripts": copied_to_scripts}
 
@@ -705,18 +1097,73 @@ async def update_script(
 async def get_telegram_bots():
     return {"bots": list(TELEGRAM_BOTS.keys()), "default_bot": DEFAULT_BOT_NAME}
 
+def store_upload(fileobj, dest_path, users):
+    # Streams the upload into the script store, then updates scripts/ only if it changed.
+    # Tasks already running the file get both the old and the new content in their history.
+    store = get_script_store()
+    with store.exclusive():
+        content_hash, size = store.put_stream(fileobj)
+        previous = None
+        if os.path.isfile(dest_path) and not same_content(dest_path, content_hash, size):
+            for task in users:
+                previous = store.record_path(task["id"], task["name"], dest_path, "replaced")
+            if previous is None:
+                previous, _ = store.put_file(dest_path)
+        changed = store.materialize(content_hash, size, dest_path)
+        for task in users:
+            store.record_version(task["id"], task["name"], dest_path, content_hash, size, "upload")
+    return {"sha256": content_hash, "size": size, "unchanged": not changed, "previous_sha256": previous}
+
+
 @router.post("/upload-script")
 async def upload_script(file: UploadFile = File(...)):
-    os.makedirs("scripts", exist_ok=True)
     filename = os.path.basename(file.filename)
     dest_path = os.path.join("scripts", filename)
+    users = [
+        s for s in await load_scripts()
+        if s.get("id") is not None and os.path.abspath(s.get("path", "")) == os.path.abspath(dest_path)
+    ]
 
     try:
-        with open(dest_path, "wb") as f:
-            f.write(await file.read())
-        return {"message": "Script uploaded", "path": f"scripts/{filename}"}
+        stored = await run_io(store_upload, file.file, dest_path, users)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save script: {str(e)}")
+    finally:
+        await file.close()
+    return {"message": "Script uploaded", "path": f"scripts/{filename}", **stored}
+
+
+async def record_script_version(script, source):
+    # History is best effort: a task whose file is missing (e.g. agent tasks) has none
+    try:
+        await run_io(get_script_store().record_path, script["id"], script["name"], os.path.abspath(script["path"]), source)
+    except Exception as e:
+        print(f"[SCRIPT STORE] Failed to record version of '{script['name']}': {e}")
+
+
+def find_script_by_name(scripts, script_name):
+    script = next((s for s in scripts if s["name"].strip().lower() == script_name.strip().lower()), None)
+    if not script:
+        raise HTTPException(status_code=404, detail=f"Script '{script_name}' not found")
+    return script
+
+
+@router.get("/versions/{script_name}")
+async def list_script_versions(script_name: str, limit: int = 50):
+    script = find_script_by_name(await load_scripts(), script_name)
+    versions = await run_io(get_script_store().list_versions, script["id"], limit)
+    return {"name": script["name"], "path": script["path"], "versions": versions}
+
+
+@router.post("/versions/{script_name}/restore/{version}")
+async def restore_script_version(script_name: str, version: int):
+    script = find_script_by_name(await load_scripts(), script_name)
+    # Whatever is on disk now (maybe edited by hand) goes into the history first
+    restored = await run_io(get_script_store().restore_version, script["id"], script["name"], version, os.path.abspath(script["path"]))
+    if restored is None:
+        raise HTTPException(status_code=404, detail=f"Version {version} of '{script['name']}' not found")
+    content_hash, changed = restored
+    return {"message": f"Restored version {version} of '{script['name']}'", "sha256": content_hash, "unchanged": not changed}
 
 @router.post("/copy")
 async def copy_script(payload: dict = Body(...)):
@@ -726,24 +1173,16 @@ async def copy_script(payload: dict = Body(...)):
     if not src or not dst or not os.path.isfile(src):
         raise HTTPException(status_code=400, detail="Invalid source file.")
 
-    os.makedirs("scripts", exist_ok=True)
     destination = os.path.join("scripts", dst)
 
     try:
-        shutil.copyfile(src, destination)
-        return {"message": f"Copied to {destination}"}
+        _, _, copied = await run_io(get_script_store().sync_file, src, destination)
+        return {"message": f"Copied to {destination}" if copied else f"{destination} is already up to date"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Copy failed: {str(e)}")
     
 @router.post("/save-db-config")
 async def save_db_config(config: dict):
-    env_path = Path(".env")
-    env_lines = []
-
-    if env_path.exists():
-        with env_path.open("r", encoding="utf-8") as f:
-            env_lines = f.readlines()
-
     updated_keys = {
         "USE_SQL": str(config.get("use_sql", False)),
         "SQL_SERVER": config.get("sql_server", ""),
@@ -754,96 +1193,239 @@ async def save_db_config(config: dict):
         "SQL_TRUSTED": str(config.get("sql_trusted", False))
     }
 
-    # Keep existing lines that are not being overwritten
-    new_lines = []
-    existing_keys = set()
-
-    for line in env_lines:
-        key = line.split("=", 1)[0].strip()
-        if key in updated_keys:
-            new_lines.append(f"{key}={updated_keys[key]}\n")
-            existing_keys.add(key)
-        else:
-            new_lines.append(line)
-
-    for key, val in updated_keys.items():
-        if key not in existing_keys:
-            new_lines.append(f"{key}={val}\n")
-
-    with env_path.open("w", encoding="utf-8") as f:
-        f.writelines(new_lines)
-
-    # Refresh env vars after writing
-    from dotenv import load_dotenv
-    load_dotenv(dotenv_path=env_path, override=True)
+    # Atomic rewrite of .env; the new settings snapshot is live when this returns
+    settings = await run_io(write_env_values, updated_keys)
 
     # After save - create table, if USE_SQL = true
-    if updated_keys["USE_SQL"].lower() == "true":
-        from app.utils.db import get_sql_connection
-        conn = get_sql_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute(TASKS_TABLE_DDL)
-                conn.commit()
-                print("[DB] Tasks table created (if not exists)")
-            except Exception as e:
-                print("[DB] Failed to create Tasks table:", e)
-            finally:
-                conn.close()
+    if settings.use_sql:
+        await run_io(create_sql_tasks_table, TASKS_TABLE_DDL)
 
     return {"status": "ok"}
 
 
 @router.post("/debug-sql")
 async def debug_sql_connection(config: dict = Body(...)):
-    from app.utils.db import get_sql_connection
-    import pyodbc
-
     cleaned_config = {k: v for k, v in config.items() if k != "use_sql"}
     # print("[DEBUG] SQL config received:", cleaned_config)
 
-    os.environ["SQL_SERVER"] = config.get("sql_server", "")
-    os.environ["SQL_DATABASE"] = config.get("sql_database", "")
-    os.environ["SQL_USER"] = config.get("sql_user", "")
-    os.environ["SQL_PASSWORD"] = config.get("sql_password", "")
-    os.environ["SQL_DRIVER"] = config.get("sql_driver", "")
-    os.environ["SQL_TRUSTED"] = str(config.get("sql_trusted", False))
+    # Test the submitted values on a private copy; the live settings stay as they are
+    candidate = get_settings().with_sql(config)
 
     try:
-        conn = get_sql_connection(use_env_override=True)
-        if not conn:
-            raise ConnectionError("get_sql_connection() returned None — possibly invalid driver or connection string.")
+        exists = await run_io(check_sql_tasks_table, candidate)
+    except ConnectionError as e:
+        return {"status": "error", "message": f"Unhandled connection error: {str(e)}"}
+    except Exception as e:
+        return {"status": "error", "message": f"Connected, but failed to query table: {str(e)}"}
 
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
-                WHERE TABLE_NAME = 'Tasks'
-            """)
-            exists = cursor.fetchone()[0] > 0
-            message = "Connected successfully." if exists else "Connected. Table 'Tasks' not found and will be created on save."
-            return {"status": "connected", "message": message}
-        except Exception as e:
-            return {"status": "error", "message": f"Connected, but failed to query table: {str(e)}"}
-        finally:
-            conn.close()
+    message = "Connected successfully." if exists else "Connected. Table 'Tasks' not found and will be created on save."
+    return {"status": "connected", "message": message}
+
+
+
+
+def start_scheduler(event_loop=None):
+    # Called from the lifespan: cron jobs run on scheduler threads and hand their
+    # bookkeeping to this loop, so it is captured before the first job can fire
+    global loop
+    loop = event_loop or asyncio.get_running_loop()
+    if not scheduler.running:
+        scheduler.start()
 
-    except pyodbc.Error as e:
-        err_msg = f"{e.__class__.__name__}: {'; '.join(str(x) for x in e.args)}"
-        return {"status": "error", "message": f"Connection failed: {err_msg}"}
 
+async def restore_runtime_state():
+    try:
+        state = await get_task_store().load_runtime_state()
     except Exception as e:
-        return {"status": "error", "message": f"Unhandled connection error: {str(e)}"}
+        print("[STATE] Failed to restore runtime state:", e)
+        return
 
+    for script_id, seconds in state.get("stopped_uptime_seconds", {}).items():
+        stopped_uptime_seconds[int(script_id)] = int(seconds)
+    if stopped_uptime_seconds:
+        print(f"[STATE] Restored uptime for {len(stopped_uptime_seconds)} task(s)")
 
 
+async def start_cluster():
+    global cluster
+    if not CLUSTER_MODE:
+        return
+
+    try:
+        store = await run_io(create_cluster_store)
+    except Exception as e:
+        print(f"[CLUSTER] Could not open cluster tables: {e}")
+        return
+    if store is None:
+        print("[CLUSTER] CLUSTER_MODE needs a shared store (USE_SQL or USE_SQLITE), running standalone")
+        return
+
+    cluster = ClusterCoordinator(store, launch_cluster_run)
+    cluster.start()
+
+
+async def finish_cluster_local_run(cluster_run_id, exit_code):
+    if cluster is None:
+        return
+    try:
+        await cluster.finish_local_run(cluster_run_id, exit_code)
+    except Exception as e:
+        print(f"[CLUSTER] Failed to finish run {cluster_run_id}: {e}")
+
+
+async def launch_cluster_run(run):
+    scripts = await load_scripts()
+    script = next((s for s in scripts if s.get("id") == run["task_id"]), None)
+    if script is None:
+        raise LookupError(f"task {run['task_id']} not found")
+
+    command = build_command(script)
+    os.makedirs("logs", exist_ok=True)
+    log_file_path = f"logs/{script['name']}.log"
+    artifact_run_id, env = await run_io(begin_artifact_run, script["name"], script["id"], f"cluster:{run['run_id']}")
+    with await run_io(open_run_output, log_file_path, artifact_run_id, "cluster") as log_handle:
+        process = subprocess.Popen(command, stdout=log_handle, stderr=subprocess.STDOUT, text=True, env=env)
+    follow_run_output(log_file_path, artifact_run_id, process)
+    append_to_limited_log(log_file_path, f"{get_timestamp()} [CLUSTER] Run {run['run_id']} started on node {cluster.node_id}, PID: {process.pid}")
+    # The coordinator watches the process under the run id; artifacts get their own watch
+    reaper.watch(f"artifacts:{artifact_run_id}", process, lambda p: collect_artifacts(artifact_run_id, script["name"], p.returncode))
+    if "scheduler" not in script.get("apps", []) and script["id"] not in running_processes:
+        # Long-running task started through the queue: shown and stoppable on the node running it
+        running_processes[script["id"]] = {
+            "process": process,
+            "start_time": datetime.utcnow(),
+            "is_cron_job": False,
+            "log_file_path": log_file_path,
+            "run_id": None,
+            "cluster_run_id": None
+        }
+        task_states.force(script["id"], "running")
+        reaper.watch(script["id"], process, lambda p: release_cluster_task(script["id"], script["name"], p))
+    return process
+
+
+async def release_cluster_task(script_id, script_name, process):
+    # A queued long-running run exited on its own; the node no longer runs the task
+    async with task_states.operation(script_id, "stop"):
+        info = running_processes.get(script_id)
+        if not info or info["process"] is not process:
+            return  # stopped through the dashboard in the meantime
+        running_processes.pop(script_id)
+        stopped_uptime_seconds[script_id] = int((datetime.utcnow() - info["start_time"]).total_seconds())
+        task_states.force(script_id, "stopped")
+    append_to_limited_log(f"logs/{script_name}.log", f"{get_timestamp()} [CLUSTER] Process {process.pid} exited (exit code {process.returncode}), task stopped on node {cluster.node_id}.")
+
+
+@router.get("/cluster")
+async def cluster_status():
+    if cluster is None:
+        return {"enabled": False, "node_id": NODE_ID}
+    return await cluster.status()
+
+
+async def shutdown_scripts(grace_seconds=SHUTDOWN_GRACE_SECONDS, mode=SHUTDOWN_MODE):
+    # Stop firing new cron runs first, then drain what is already running
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    if cluster is not None:
+        await cluster.stop()
+    reaper.close()
+
+    now = datetime.utcnow()
+    draining = list(running_processes.items())
+    running_processes.clear()
+
+    async def drain(script_id, info):
+        log_file_path = info["log_file_path"]
+        process = info["process"]
+        if isinstance(process, agents.RemoteProcess) and process.poll() is None:
+            # The agent connection is already gone at this point; the agent keeps the script running
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Dashboard shutdown, task left running on agent '{process.agent_name}'.")
+            return
+        if mode == "detach" and not info["is_cron_job"] and process and process.poll() is None:
+            # Left running and recorded in the PID registry; the next start re-adopts it
+            append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Dashboard shutdown, task detached (PID {process.pid}).")
+            return
+
+        stopped_uptime_seconds[script_id] = int((now - info["start_time"]).total_seconds())
+        if not info["is_cron_job"]:
+            await terminate_process(process, log_file_path, grace_seconds)
+            await run_io(unregister_process, script_id)
+            if info.get("cluster_run_id"):
+                await finish_cluster_local_run(info["cluster_run_id"], None)
+        # Task keeps its enabled flag, so autostart brings it back on the next start
+        append_to_limited_log(log_file_path, f"{get_timestamp()} [MANAGER] Dashboard shutdown, task interrupted.")
+
+    async def drain_task(script_id, info):
+        # Waits for a start/stop of the task that is still in flight
+        async with task_states.operation(script_id, "stop"):
+            try:
+                await drain(script_id, info)
+            finally:
+                task_states.force(script_id, "stopped")
+
+    await asyncio.gather(*(drain_task(script_id, info) for script_id, info in draining))
+    if structured_logs_enabled():
+        # Ingest what the drained runs wrote; spools of detached runs are resumed after adoption
+        await run_io(get_structured_log().close)
+
+    try:
+        await get_task_store().save_runtime_state({
+            "saved_at": now.isoformat(),
+            "stopped_uptime_seconds": stopped_uptime_seconds,
+        })
+        print(f"[SHUTDOWN] Drained {len(draining)} task(s) ({mode}), runtime state saved")
+    except Exception as e:
+        print("[SHUTDOWN] Failed to save runtime state:", e)
+
+
+async def adopt_running_processes():
+    registry = await run_io(load_registry)
+    if not registry:
+        return
+
+    scripts = {str(s["id"]): s for s in await load_scripts()}
+    kept = {}
+    for script_id, entry in registry.items():
+        script = scripts.get(script_id)
+        if script is None or not await run_io(verify_registered_process, entry):
+            print(f"[ADOPT] PID {entry.get('pid')} for task {entry.get('name')} is gone, dropping it")
+            continue
+
+        process = AdoptedProcess(entry["pid"], entry.get("proc_start_ticks"))
+        run_id = entry.get("run_id")
+        running_processes[script["id"]] = {
+            "process": process,
+            "start_time": registry_start_time(entry),
+            "is_cron_job": False,
+            "log_file_path": entry["log_file_path"],
+            "run_id": run_id
+        }
+        task_states.force(script["id"], "running")
+        kept[script_id] = entry
+        append_to_limited_log(entry["log_file_path"], f"{get_timestamp()} [MANAGER] Re-adopted running process PID: {process.pid}")
+        print(f"[ADOPT] Re-adopted {script['name']} (PID {process.pid})")
+
+        follow_run_output(entry["log_file_path"], run_id, process)
+        one_time = "1timerun" in script.get("apps", [])
+        if run_id or one_time:
+            reaper.watch(script["id"], process, lambda p, sid=script["id"], name=script["name"], rid=run_id, once=one_time: on_local_exit(sid, name, rid, once, p))
+
+    await run_io(replace_registry, kept)
+
 
 async def autostart_enabled_scripts():
     scripts = await load_scripts()
     for script in scripts:
-        if script.get("enabled", False):
-
+        if script.get("enabled", False) and script["id"] not in running_processes:
+            if cluster is not None and "scheduler" not in script.get("apps", []) and not script.get("agent", "").strip():
+                # Cluster mode: long-running tasks go through the run queue, so one node runs them
+                try:
+                    run_id = await cluster.enqueue_if_idle(script["id"], script["name"])
+                    print(f"[AUTO-START] {script['name']}: " + (f"queued cluster run {run_id}" if run_id else "already active in the cluster"))
+                except Exception as e:
+                    print(f"[AUTO-START FAIL] {script['name']}: {str(e)}")
+                continue
 
             try:
                 await start_script(script["name"])
@@ -854,17 +1436,23 @@ async def autostart_enabled_scripts():
 
 @router.post("/import-from-json")
 async def import_from_json_to_sql():
-    if not os.getenv("USE_SQL", "false").lower() == "true":
+    settings = get_settings()
+    if not settings.use_sql and not settings.use_sqlite:
         raise HTTPException(status_code=400, detail="SQL is not enabled.")
 
     if not os.path.exists(SCRIPTS_JSON_PATH):
         raise HTTPException(status_code=404, detail="scripts.json not found")
 
+    if not settings.use_sql:
+        try:
+            count = await run_io(migrate_json_to_sqlite, SCRIPTS_JSON_PATH)
+            return {"message": f"Imported {count} scripts into SQLite."}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+
     try:
-        with open(SCRIPTS_JSON_PATH, "r", encoding="utf-8") as f:
-            scripts = json.load(f)
-        from app.utils.db import save_sql_scripts
-        await asyncio.to_thread(save_sql_scripts, scripts)
+        scripts = await run_io(lambda: json.loads(read_text_file(SCRIPTS_JSON_PATH)))
+        await run_io(save_sql_scripts, scripts)
         return {"message": f"Imported {len(scripts)} scripts into SQL."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
@@ -883,28 +1471,24 @@ async def preview_json_script_count():
     
 @router.get("/db-config")
 async def get_db_config():
+    settings = get_settings()
     config = {
-        "use_sql": os.getenv("USE_SQL", "false").lower() == "true",
-        "sql_server": os.getenv("SQL_SERVER", ""),
-        "sql_database": os.getenv("SQL_DATABASE", ""),
-        "sql_user": os.getenv("SQL_USER", ""),
-        "sql_password": os.getenv("SQL_PASSWORD", ""),
-        "sql_driver": os.getenv("SQL_DRIVER", ""),
-        "sql_trusted": os.getenv("SQL_TRUSTED", "false").lower() == "true",
+        "use_sql": settings.use_sql,
+        "sql_server": settings.sql_server,
+        "sql_database": settings.sql_database,
+        "sql_user": settings.sql_user,
+        "sql_password": settings.sql_password,
+        "sql_driver": settings.sql_driver,
+        "sql_trusted": settings.sql_trusted,
     }
     # print("[DEBUG] SQL config received:", config)
     return JSONResponse(content=config)
 
 @router.on_event("startup")
 async def sync_sql_to_json_on_start():
-    from app.utils.db import load_sql_scripts
-    from dotenv import load_dotenv
-
-    load_dotenv(override=True)  # Ensure .env is loaded before use
-
-    if os.getenv("USE_SQL", "false").lower() == "true":
+    if get_settings().use_sql:
         try:
-            scripts = await asyncio.to_thread(lambda: load_sql_scripts(use_env_override=True))
+            scripts = await run_io(load_sql_scripts, use_env_override=True)
             if scripts:
                 with open("scripts.json", "w", encoding="utf-8") as f:
                     json.dump(scripts, f, indent=2, ensure_ascii=True)
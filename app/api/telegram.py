@@ -0,0 +1,78 @@
+# telegram.py
+import shutil
+import asyncio
+import tempfile
+from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Form
+from app.config_telegram import DEFAULT_BOT_NAME
+from app.utils.telegram_service import telegram_service
+from app.utils.store import run_io
+
+router = APIRouter()
+
+TELEGRAM_UPLOAD_CHUNK_BYTES = 256 * 1024
+
+
+async def deliver(future, wait):
+    if not wait:
+        return {"queued": True}
+    return await asyncio.wrap_future(future)
+
+
+@router.post("/send")
+async def send_message(
+    text: str = Body(...),
+    bot: str = Body(default=DEFAULT_BOT_NAME),
+    chat_id: str | None = Body(default=None),
+    parse_mode: str | None = Body(default=None),
+    batch: bool = Body(default=True),
+    wait: bool = Body(default=True)
+):
+    try:
+        future = telegram_service.send_message(bot, text, chat_id=chat_id, parse_mode=parse_mode, batch=batch)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return await deliver(future, wait)
+
+
+@router.post("/send_photo")
+async def send_photo(
+    photo: UploadFile = File(...),
+    caption: str = Form(default=""),
+    bot: str = Form(default=DEFAULT_BOT_NAME),
+    chat_id: str | None = Form(default=None),
+    parse_mode: str | None = Form(default=None),
+    wait: bool = Form(default=True)
+):
+    # The upload is passed on as a file, never read into memory. FastAPI closes it when the
+    # request ends, so without wait the sender gets its own temporary copy
+    fileobj = photo.file
+    if not wait:
+        fileobj = await run_io(copy_to_tempfile, photo.file)
+    try:
+        future = telegram_service.send_photo(
+            bot, fileobj, filename=photo.filename or "photo.jpg", caption=caption,
+            chat_id=chat_id, parse_mode=parse_mode, mime=photo.content_type or "image/jpeg"
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except RuntimeError as e:
+        if fileobj is not photo.file:
+            fileobj.close()
+        raise HTTPException(status_code=503, detail=str(e))
+    if fileobj is not photo.file:
+        future.add_done_callback(lambda _: fileobj.close())
+    return await deliver(future, wait)
+
+
+def copy_to_tempfile(source):
+    target = tempfile.TemporaryFile()
+    shutil.copyfileobj(source, target, TELEGRAM_UPLOAD_CHUNK_BYTES)
+    target.seek(0)
+    return target
+
+
+@router.get("/status")
+async def telegram_status():
+    return telegram_service.status()
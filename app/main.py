@@ -1,21 +1,64 @@
 # main.py
+import time
+_import_started = time.perf_counter()
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from dotenv import load_dotenv
-from app.api import scripts
+import asyncio
+from app.utils.settings import apply_env_file
+apply_env_file()
+from app.api import scripts, agents, pipelines, telegram, mail, artifacts, admin
+from app.utils.store import run_io
+from app.utils.telegram_service import telegram_service
+from app.utils.email_service import email_service
+from app.utils.request_timing import timing_middleware, SLOW_REQUEST_MS
 
-# Load environment variables
-load_dotenv()
+# .env is applied once, above, before the routers read their os.getenv defaults
+import_seconds = time.perf_counter() - _import_started
 
-# Lifespan handler: autostart enabled scripts
+
+class startup_step:
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = time.perf_counter() - self.started
+        return False
+
+
+# Lifespan handler: restore state and autostart enabled scripts, drain them on shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    timings = {"imports": import_seconds}
+    with startup_step(timings, "scheduler"):
+        scripts.start_scheduler()
+    with startup_step(timings, "restore_state"):
+        await scripts.restore_runtime_state()
+    with startup_step(timings, "adopt"):
+        await scripts.adopt_running_processes()
+    with startup_step(timings, "cluster"):
+        await scripts.start_cluster()
     print("[LIFESPAN] Autostarting enabled scripts...")
-    await scripts.autostart_enabled_scripts()
+    with startup_step(timings, "autostart"):
+        await scripts.autostart_enabled_scripts()
+    with startup_step(timings, "pipelines"):
+        await pipelines.start_pipeline_schedules()
+    log_maintenance = asyncio.create_task(scripts.log_maintenance_loop())
+    app.state.startup_timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+    print("[STARTUP] " + " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items())
+          + f" total={sum(timings.values()) * 1000:.0f}ms")
     yield
+    log_maintenance.cancel()
+    print("[LIFESPAN] Shutting down, stopping running scripts...")
+    await pipelines.shutdown_pipelines()
+    await scripts.shutdown_scripts()
+    await run_io(telegram_service.close)
+    await run_io(email_service.close)
 
 # Create FastAPI app
 app = FastAPI(
@@ -24,20 +67,38 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Slow-request log with per-phase timings (storage, log scan, serialization)
+if SLOW_REQUEST_MS > 0:
+    app.middleware("http")(timing_middleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Template setup
-templates = Jinja2Templates(directory="app/templates")
+# Template setup: jinja2 is loaded on the first dashboard request, not at startup
+templates = None
+
+
+def get_templates():
+    global templates
+    if templates is None:
+        from fastapi.templating import Jinja2Templates
+        templates = Jinja2Templates(directory="app/templates")
+    return templates
 
 # Include API routes
 app.include_router(scripts.router, prefix="/scripts", tags=["Scripts"])
+app.include_router(agents.router, prefix="/agents", tags=["Agents"])
+app.include_router(pipelines.router, prefix="/pipelines", tags=["Pipelines"])
+app.include_router(telegram.router, prefix="/telegram", tags=["Telegram"])
+app.include_router(mail.router, prefix="/email", tags=["Email"])
+app.include_router(artifacts.router, prefix="/artifacts", tags=["Artifacts"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
 # Web dashboard routes
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
     scripts_data = await scripts.load_scripts()
-    return templates.TemplateResponse("dashboard.html", {"request": request, "scripts": scripts_data})
+    return get_templates().TemplateResponse("dashboard.html", {"request": request, "scripts": scripts_data})
 
 @app.post("/dashboard/start/{script_name}")
 async def dashboard_start_script(script_name: str):
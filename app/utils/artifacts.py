@@ -0,0 +1,263 @@
+# app/utils/artifacts.py
+#
+# Run history and run outputs. Every local run gets a scratch directory
+# (PIPECRAB_ARTIFACT_DIR). When the run ends, its files are hashed into a
+# content-addressed object store: identical outputs across runs share one object
+# via hardlink (or reflink/copy across filesystems), and each task's share is
+# trimmed to its retention quota.
+import os
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: hardlink or copy only
+
+
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", "artifacts")
+ARTIFACT_QUOTA_MB = int(os.getenv("ARTIFACT_QUOTA_MB", "100"))
+ARTIFACT_KEEP_RUNS = int(os.getenv("ARTIFACT_KEEP_RUNS", "20"))
+RUN_HISTORY_PER_TASK = int(os.getenv("RUN_HISTORY_PER_TASK", "200"))
+# Per-task overrides: "NASA APOD image=500,Notify=10" (MB)
+ARTIFACT_QUOTAS = {
+    name.strip(): int(mb) for name, _, mb in
+    (item.rpartition("=") for item in os.getenv("ARTIFACT_QUOTAS", "").split(",") if "=" in item)
+}
+
+FICLONE = 0x40049409  # Linux ioctl: share extents copy-on-write (btrfs, XFS)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Runs (
+    RunId TEXT PRIMARY KEY,
+    TaskId INTEGER,
+    TaskName TEXT NOT NULL,
+    RunTrigger TEXT NOT NULL,
+    StartedAt TEXT NOT NULL,
+    FinishedAt TEXT,
+    ExitCode INTEGER,
+    ScratchDir TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_Runs_Task ON Runs(TaskName, StartedAt);
+CREATE TABLE IF NOT EXISTS Artifacts (
+    RunId TEXT NOT NULL,
+    Name TEXT NOT NULL,
+    Hash TEXT NOT NULL,
+    Size INTEGER NOT NULL,
+    PRIMARY KEY (RunId, Name)
+);
+CREATE INDEX IF NOT EXISTS IX_Artifacts_Hash ON Artifacts(Hash);
+"""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_object(path):
+    # Objects are read-only; on Windows os.remove refuses those until the flag is cleared
+    try:
+        os.chmod(path, 0o644)
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[ARTIFACTS] Could not remove object {path}: {e}")
+
+
+def link_or_copy(src, dst):
+    # Hardlink when on the same filesystem, else reflink, else a plain copy
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_ROOT):
+        self.root = root
+        self.scratch_root = os.path.join(root, "scratch")
+        self.object_root = os.path.join(root, "objects")
+        os.makedirs(self.scratch_root, exist_ok=True)
+        os.makedirs(self.object_root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, "artifacts.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA_SQL)
+
+    def object_path(self, content_hash):
+        return os.path.join(self.object_root, content_hash[:2], content_hash)
+
+    def begin_run(self, task_name, task_id=None, trigger="manual"):
+        run_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        scratch_dir = os.path.abspath(os.path.join(self.scratch_root, run_id))
+        os.makedirs(scratch_dir)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO Runs (RunId, TaskId, TaskName, RunTrigger, StartedAt, ScratchDir) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, task_id, task_name, trigger, datetime.utcnow().isoformat(), scratch_dir)
+            )
+        return run_id, scratch_dir
+
+    def _store_object(self, path, content_hash):
+        # Caller holds self._lock, so enforce_quota cannot drop the object before its row exists
+        target = self.object_path(content_hash)
+        if os.path.exists(target):
+            # Already stored: point the scratch copy at the shared object
+            if not os.path.samefile(path, target):
+                os.remove(path)
+                link_or_copy(target, path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_target = f"{target}.{uuid.uuid4().hex[:6]}.tmp"
+            link_or_copy(path, tmp_target)
+            os.chmod(tmp_target, 0o444)  # shared between runs, so never modified in place
+            os.replace(tmp_target, target)
+        return content_hash
+
+    def finish_run(self, run_id, exit_code, keep_scratch=False):
+        # Idempotent: a run is collected once, whoever notices the exit first
+        with self._lock:
+            row = self._db.execute("SELECT TaskName, ScratchDir, FinishedAt FROM Runs WHERE RunId = ?", (run_id,)).fetchone()
+            if row is None or row[2] is not None:
+                return []
+            self._db.execute("UPDATE Runs SET FinishedAt = ?, ExitCode = ? WHERE RunId = ?",
+                             (datetime.utcnow().isoformat(), exit_code, run_id))
+        task_name, scratch_dir = row[0], row[1]
+
+        collected = []
+        if scratch_dir and os.path.isdir(scratch_dir):
+            for dirpath, _, filenames in os.walk(scratch_dir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if os.path.islink(path) or not os.path.isfile(path):
+                        continue
+                    name = os.path.relpath(path, scratch_dir).replace(os.sep, "/")
+                    content_hash = file_sha256(path)  # hashing needs no lock
+                    with self._lock:
+                        self._store_object(path, content_hash)
+                        size = os.path.getsize(path)
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO Artifacts (RunId, Name, Hash, Size) VALUES (?, ?, ?, ?)",
+                            (run_id, name, content_hash, size)
+                        )
+                    collected.append({"name": name, "sha256": content_hash, "size": size})
+            if not keep_scratch:
+                self.remove_scratch(run_id)
+
+        self.enforce_quota(task_name)
+        return collected
+
+    def remove_scratch(self, run_id):
+        with self._lock:
+            row = self._db.execute("SELECT ScratchDir FROM Runs WHERE RunId = ?", (run_id,)).fetchone()
+            self._db.execute("UPDATE Runs SET ScratchDir = NULL WHERE RunId = ?", (run_id,))
+        if row and row[0]:
+            shutil.rmtree(row[0], ignore_errors=True)
+
+    def enforce_quota(self, task_name):
+        quota = ARTIFACT_QUOTAS.get(task_name, ARTIFACT_QUOTA_MB) * 1024 * 1024
+        with self._lock:
+            runs = self._db.execute(
+                "SELECT r.RunId, COALESCE(SUM(a.Size), 0), COUNT(a.Name) FROM Runs r "
+                "LEFT JOIN Artifacts a ON a.RunId = r.RunId WHERE r.TaskName = ? AND r.FinishedAt IS NOT NULL "
+                "GROUP BY r.RunId ORDER BY r.StartedAt DESC", (task_name,)
+            ).fetchall()
+
+            # Newest runs keep their outputs until the quota or the run count is used up
+            expired, used, kept = [], 0, 0
+            for run_id, size, count in runs:
+                if count == 0:
+                    continue
+                if kept >= ARTIFACT_KEEP_RUNS or used + size > quota:
+                    expired.append(run_id)
+                else:
+                    used += size
+                    kept += 1
+
+            hashes = set()
+            for run_id in expired:
+                hashes.update(h for (h,) in self._db.execute("SELECT Hash FROM Artifacts WHERE RunId = ?", (run_id,)))
+                self._db.execute("DELETE FROM Artifacts WHERE RunId = ?", (run_id,))
+
+            # Run history itself is small, but still bounded
+            self._db.execute(
+                "DELETE FROM Runs WHERE TaskName = ? AND RunId NOT IN "
+                "(SELECT RunId FROM Runs WHERE TaskName = ? ORDER BY StartedAt DESC LIMIT ?) "
+                "AND RunId NOT IN (SELECT RunId FROM Artifacts)",
+                (task_name, task_name, RUN_HISTORY_PER_TASK)
+            )
+
+            for content_hash in hashes:
+                if self._db.execute("SELECT 1 FROM Artifacts WHERE Hash = ? LIMIT 1", (content_hash,)).fetchone() is None:
+                    remove_object(self.object_path(content_hash))
+        return len(expired)
+
+    def list_runs(self, task_name=None, limit=50):
+        query = ("SELECT r.RunId, r.TaskId, r.TaskName, r.RunTrigger, r.StartedAt, r.FinishedAt, r.ExitCode, "
+                 "COUNT(a.Name), COALESCE(SUM(a.Size), 0) FROM Runs r LEFT JOIN Artifacts a ON a.RunId = r.RunId ")
+        params = []
+        if task_name:
+            query += "WHERE r.TaskName = ? "
+            params.append(task_name)
+        query += "GROUP BY r.RunId ORDER BY r.StartedAt DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        columns = ["run_id", "task_id", "task_name", "trigger", "started_at", "finished_at", "exit_code", "artifact_count", "artifact_bytes"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_run(self, run_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT RunId, TaskId, TaskName, RunTrigger, StartedAt, FinishedAt, ExitCode FROM Runs WHERE RunId = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            artifacts = self._db.execute("SELECT Name, Hash, Size FROM Artifacts WHERE RunId = ? ORDER BY Name", (run_id,)).fetchall()
+        run = dict(zip(["run_id", "task_id", "task_name", "trigger", "started_at", "finished_at", "exit_code"], row))
+        run["artifacts"] = [{"name": name, "sha256": content_hash, "size": size} for name, content_hash, size in artifacts]
+        return run
+
+    def find_artifact(self, run_id, name):
+        with self._lock:
+            row = self._db.execute("SELECT Hash FROM Artifacts WHERE RunId = ? AND Name = ?", (run_id, name)).fetchone()
+        return self.object_path(row[0]) if row else None
+
+    def stats(self):
+        with self._lock:
+            logical, count = self._db.execute("SELECT COALESCE(SUM(Size), 0), COUNT(*) FROM Artifacts").fetchone()
+            stored, objects = self._db.execute(
+                "SELECT COALESCE(SUM(Size), 0), COUNT(*) FROM (SELECT Hash, MAX(Size) AS Size FROM Artifacts GROUP BY Hash)"
+            ).fetchone()
+        return {"artifacts": count, "objects": objects, "logical_bytes": logical, "stored_bytes": stored}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
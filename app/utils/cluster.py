@@ -0,0 +1,502 @@
+# app/utils/cluster.py
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+
+from app.utils.reaper import reaper
+from app.utils.store import run_io, get_store_kind
+
+
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "false").lower() == "true"
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+NODE_CAPACITY = int(os.getenv("NODE_CAPACITY", "4"))
+CLUSTER_LEASE_SECONDS = float(os.getenv("CLUSTER_LEASE_SECONDS", "15"))
+CLUSTER_POLL_INTERVAL = float(os.getenv("CLUSTER_POLL_INTERVAL", "2"))
+
+LEASE_NAME = "scheduler"
+
+SQLITE_CLUSTER_DDL = """
+CREATE TABLE IF NOT EXISTS ClusterLease (
+    Name TEXT PRIMARY KEY,
+    Holder TEXT NOT NULL,
+    ExpiresAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ClusterNodes (
+    NodeId TEXT PRIMARY KEY,
+    Capacity INTEGER NOT NULL,
+    Active INTEGER NOT NULL,
+    HeartbeatAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS TaskRuns (
+    RunId INTEGER PRIMARY KEY AUTOINCREMENT,
+    TaskId INTEGER NOT NULL,
+    TaskName TEXT NOT NULL,
+    Status TEXT NOT NULL DEFAULT 'queued',
+    NodeId TEXT NULL,
+    ScheduledAt REAL NOT NULL,
+    ClaimedAt REAL NULL,
+    FinishedAt REAL NULL,
+    ExitCode INTEGER NULL,
+    FireKey TEXT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_TaskRuns_Status ON TaskRuns (Status, ScheduledAt);
+"""
+# Every node that sees a cron fire queues it; the fire key lets only the first one in
+SQLITE_FIRE_KEY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS UX_TaskRuns_FireKey ON TaskRuns (FireKey)"
+
+SQL_CLUSTER_DDL = """
+IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'ClusterLease')
+    CREATE TABLE ClusterLease (
+        Name NVARCHAR(50) PRIMARY KEY,
+        Holder NVARCHAR(255) NOT NULL,
+        ExpiresAt FLOAT NOT NULL
+    );
+IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'ClusterNodes')
+    CREATE TABLE ClusterNodes (
+        NodeId NVARCHAR(255) PRIMARY KEY,
+        Capacity INT NOT NULL,
+        Active INT NOT NULL,
+        HeartbeatAt FLOAT NOT NULL
+    );
+IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'TaskRuns')
+    CREATE TABLE TaskRuns (
+        RunId INT IDENTITY PRIMARY KEY,
+        TaskId INT NOT NULL,
+        TaskName NVARCHAR(255) NOT NULL,
+        Status NVARCHAR(20) NOT NULL DEFAULT 'queued',
+        NodeId NVARCHAR(255) NULL,
+        ScheduledAt FLOAT NOT NULL,
+        ClaimedAt FLOAT NULL,
+        FinishedAt FLOAT NULL,
+        ExitCode INT NULL,
+        FireKey NVARCHAR(200) NULL,
+        INDEX IX_TaskRuns_Status (Status, ScheduledAt)
+    );
+"""
+
+# Separate batches: the index cannot be compiled in the batch that adds the column
+SQL_CLUSTER_MIGRATIONS = [
+    "IF COL_LENGTH('TaskRuns', 'FireKey') IS NULL ALTER TABLE TaskRuns ADD FireKey NVARCHAR(200) NULL",
+    "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'UX_TaskRuns_FireKey') "
+    "CREATE UNIQUE INDEX UX_TaskRuns_FireKey ON TaskRuns (FireKey) WHERE FireKey IS NOT NULL",
+]
+
+RUN_COLUMNS = ("RunId", "TaskId", "TaskName", "Status", "NodeId", "ScheduledAt", "ClaimedAt", "FinishedAt", "ExitCode", "FireKey")
+NODE_COLUMNS = ("NodeId", "Capacity", "Active", "HeartbeatAt")
+
+
+class SqliteClusterStore:
+    # Cluster tables live next to the tasks in the SQLite file; with the file on
+    # shared storage every node sees the same lease and run queue.
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("SQLITE_PATH", "pipecrab.db")
+        with self._connect() as conn:
+            conn.executescript(SQLITE_CLUSTER_DDL)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(TaskRuns)")]
+            if "FireKey" not in columns:
+                conn.execute("ALTER TABLE TaskRuns ADD COLUMN FireKey TEXT NULL")
+            conn.execute(SQLITE_FIRE_KEY_INDEX)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    def _transaction(self, work):
+        # BEGIN IMMEDIATE takes the write lock up front, which makes the read-then-update atomic
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = work(conn)
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def try_acquire_lease(self, node_id, ttl):
+        def work(conn):
+            now = time.time()
+            row = conn.execute("SELECT Holder, ExpiresAt FROM ClusterLease WHERE Name = ?", (LEASE_NAME,)).fetchone()
+            if row and row[0] != node_id and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT INTO ClusterLease (Name, Holder, ExpiresAt) VALUES (?, ?, ?) "
+                "ON CONFLICT (Name) DO UPDATE SET Holder = excluded.Holder, ExpiresAt = excluded.ExpiresAt",
+                (LEASE_NAME, node_id, now + ttl)
+            )
+            return True
+        return self._transaction(work)
+
+    def release_lease(self, node_id):
+        self._transaction(lambda conn: conn.execute("DELETE FROM ClusterLease WHERE Name = ? AND Holder = ?", (LEASE_NAME, node_id)))
+
+    def heartbeat(self, node_id, capacity, active):
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO ClusterNodes (NodeId, Capacity, Active, HeartbeatAt) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (NodeId) DO UPDATE SET Capacity = excluded.Capacity, Active = excluded.Active, HeartbeatAt = excluded.HeartbeatAt",
+            (node_id, capacity, active, time.time())
+        ))
+
+    def enqueue_run(self, task_id, task_name, fire_key=None):
+        # None when another node already queued the same fire
+        def work(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO TaskRuns (TaskId, TaskName, ScheduledAt, FireKey) VALUES (?, ?, ?, ?)",
+                (task_id, task_name, time.time(), fire_key)
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+        return self._transaction(work)
+
+    def enqueue_if_idle(self, task_id, task_name, stale_after):
+        # For long-running tasks: queue a run only if none is queued or running anywhere.
+        # Local runs count while their node is alive; a dead node's runs are requeued or dropped.
+        def work(conn):
+            active = conn.execute(
+                "SELECT 1 FROM TaskRuns WHERE TaskId = ? AND (Status IN ('queued', 'running') OR "
+                "(Status = 'local' AND NodeId IN (SELECT NodeId FROM ClusterNodes WHERE HeartbeatAt >= ?))) LIMIT 1",
+                (task_id, time.time() - stale_after)
+            ).fetchone()
+            if active:
+                return None
+            cursor = conn.execute("INSERT INTO TaskRuns (TaskId, TaskName, ScheduledAt) VALUES (?, ?, ?)", (task_id, task_name, time.time()))
+            return cursor.lastrowid
+        return self._transaction(work)
+
+    def record_local_run(self, task_id, task_name, node_id):
+        # A run started by hand on one node, so other nodes see the task as active
+        def work(conn):
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO TaskRuns (TaskId, TaskName, Status, NodeId, ScheduledAt, ClaimedAt) VALUES (?, ?, 'local', ?, ?, ?)",
+                (task_id, task_name, node_id, now, now)
+            )
+            return cursor.lastrowid
+        return self._transaction(work)
+
+    def claim_run(self, node_id):
+        def work(conn):
+            row = conn.execute(
+                "SELECT RunId, TaskId, TaskName FROM TaskRuns WHERE Status = 'queued' ORDER BY ScheduledAt, RunId LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE TaskRuns SET Status = 'running', NodeId = ?, ClaimedAt = ? WHERE RunId = ? AND Status = 'queued'",
+                (node_id, time.time(), row[0])
+            )
+            return {"run_id": row[0], "task_id": row[1], "task_name": row[2]}
+        return self._transaction(work)
+
+    def finish_run(self, run_id, exit_code):
+        status = "succeeded" if exit_code == 0 else ("stopped" if exit_code is None else "failed")
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE TaskRuns SET Status = ?, ExitCode = ?, FinishedAt = ? WHERE RunId = ?",
+            (status, exit_code, time.time(), run_id)
+        ))
+
+    def requeue_orphaned_runs(self, stale_after):
+        # Runs held by nodes that stopped heartbeating go back to the queue
+        def work(conn):
+            cursor = conn.execute(
+                "UPDATE TaskRuns SET Status = 'queued', NodeId = NULL, ClaimedAt = NULL "
+                "WHERE Status = 'running' AND NodeId NOT IN (SELECT NodeId FROM ClusterNodes WHERE HeartbeatAt >= ?)",
+                (time.time() - stale_after,)
+            )
+            return cursor.rowcount
+        return self._transaction(work)
+
+    def list_nodes(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT {', '.join(NODE_COLUMNS)} FROM ClusterNodes ORDER BY NodeId").fetchall()
+            return [dict(zip(NODE_COLUMNS, row)) for row in rows]
+        finally:
+            conn.close()
+
+    def list_runs(self, limit=50):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM TaskRuns ORDER BY RunId DESC LIMIT ?", (limit,)).fetchall()
+            return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+        finally:
+            conn.close()
+
+    def get_lease_holder(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT Holder, ExpiresAt FROM ClusterLease WHERE Name = ?", (LEASE_NAME,)).fetchone()
+            return row[0] if row and row[1] > time.time() else None
+        finally:
+            conn.close()
+
+
+class SqlServerClusterStore:
+    # Same contract on the shared SQL Server database, using row locks with
+    # READPAST so concurrent claimers skip rows another node is taking.
+
+    def __init__(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(SQL_CLUSTER_DDL)
+            for statement in SQL_CLUSTER_MIGRATIONS:
+                cursor.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        from app.utils.db import get_sql_connection
+        conn = get_sql_connection()
+        if conn is None:
+            raise ConnectionError("SQL connection failed")
+        return conn
+
+    def _execute(self, sql, params=(), fetch=None):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            result = None
+            if fetch == "one":
+                result = cursor.fetchone()
+            elif fetch == "all":
+                result = cursor.fetchall()
+            elif fetch == "rowcount":
+                result = cursor.rowcount
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    def try_acquire_lease(self, node_id, ttl):
+        now = time.time()
+        updated = self._execute(
+            "UPDATE ClusterLease SET Holder = ?, ExpiresAt = ? WHERE Name = ? AND (Holder = ? OR ExpiresAt < ?)",
+            (node_id, now + ttl, LEASE_NAME, node_id, now), fetch="rowcount"
+        )
+        if updated:
+            return True
+        try:
+            self._execute("INSERT INTO ClusterLease (Name, Holder, ExpiresAt) VALUES (?, ?, ?)", (LEASE_NAME, node_id, now + ttl))
+            return True
+        except Exception:
+            return False  # another node holds it (primary key violation)
+
+    def release_lease(self, node_id):
+        self._execute("DELETE FROM ClusterLease WHERE Name = ? AND Holder = ?", (LEASE_NAME, node_id))
+
+    def heartbeat(self, node_id, capacity, active):
+        self._execute("""
+            MERGE ClusterNodes AS target
+            USING (SELECT ? AS NodeId, ? AS Capacity, ? AS Active, ? AS HeartbeatAt) AS source
+            ON target.NodeId = source.NodeId
+            WHEN MATCHED THEN UPDATE SET Capacity = source.Capacity, Active = source.Active, HeartbeatAt = source.HeartbeatAt
+            WHEN NOT MATCHED THEN INSERT (NodeId, Capacity, Active, HeartbeatAt) VALUES (source.NodeId, source.Capacity, source.Active, source.HeartbeatAt);
+        """, (node_id, capacity, active, time.time()))
+
+    def enqueue_run(self, task_id, task_name, fire_key=None):
+        # HOLDLOCK keeps the key range locked until the insert, so two nodes cannot both pass the check
+        try:
+            row = self._execute("""
+                INSERT INTO TaskRuns (TaskId, TaskName, ScheduledAt, FireKey)
+                OUTPUT INSERTED.RunId
+                SELECT ?, ?, ?, ?
+                WHERE ? IS NULL OR NOT EXISTS (SELECT 1 FROM TaskRuns WITH (UPDLOCK, HOLDLOCK) WHERE FireKey = ?)
+            """, (task_id, task_name, time.time(), fire_key, fire_key, fire_key), fetch="one")
+        except Exception as e:
+            if "UX_TaskRuns_FireKey" in str(e):
+                return None
+            raise
+        return row[0] if row else None
+
+    def enqueue_if_idle(self, task_id, task_name, stale_after):
+        row = self._execute("""
+            INSERT INTO TaskRuns (TaskId, TaskName, ScheduledAt)
+            OUTPUT INSERTED.RunId
+            SELECT ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM TaskRuns WITH (UPDLOCK, HOLDLOCK) WHERE TaskId = ? AND (Status IN ('queued', 'running') OR
+                (Status = 'local' AND NodeId IN (SELECT NodeId FROM ClusterNodes WHERE HeartbeatAt >= ?)))
+            )
+        """, (task_id, task_name, time.time(), task_id, time.time() - stale_after), fetch="one")
+        return row[0] if row else None
+
+    def record_local_run(self, task_id, task_name, node_id):
+        now = time.time()
+        row = self._execute(
+            "INSERT INTO TaskRuns (TaskId, TaskName, Status, NodeId, ScheduledAt, ClaimedAt) OUTPUT INSERTED.RunId VALUES (?, ?, 'local', ?, ?, ?)",
+            (task_id, task_name, node_id, now, now), fetch="one"
+        )
+        return row[0]
+
+    def claim_run(self, node_id):
+        row = self._execute("""
+            WITH next_run AS (
+                SELECT TOP (1) * FROM TaskRuns WITH (ROWLOCK, READPAST, UPDLOCK)
+                WHERE Status = 'queued'
+                ORDER BY ScheduledAt, RunId
+            )
+            UPDATE next_run SET Status = 'running', NodeId = ?, ClaimedAt = ?
+            OUTPUT INSERTED.RunId, INSERTED.TaskId, INSERTED.TaskName
+        """, (node_id, time.time()), fetch="one")
+        if not row:
+            return None
+        return {"run_id": row[0], "task_id": row[1], "task_name": row[2]}
+
+    def finish_run(self, run_id, exit_code):
+        status = "succeeded" if exit_code == 0 else ("stopped" if exit_code is None else "failed")
+        self._execute(
+            "UPDATE TaskRuns SET Status = ?, ExitCode = ?, FinishedAt = ? WHERE RunId = ?",
+            (status, exit_code, time.time(), run_id)
+        )
+
+    def requeue_orphaned_runs(self, stale_after):
+        return self._execute(
+            "UPDATE TaskRuns SET Status = 'queued', NodeId = NULL, ClaimedAt = NULL "
+            "WHERE Status = 'running' AND NodeId NOT IN (SELECT NodeId FROM ClusterNodes WHERE HeartbeatAt >= ?)",
+            (time.time() - stale_after,), fetch="rowcount"
+        )
+
+    def list_nodes(self):
+        rows = self._execute(f"SELECT {', '.join(NODE_COLUMNS)} FROM ClusterNodes ORDER BY NodeId", fetch="all")
+        return [dict(zip(NODE_COLUMNS, row)) for row in rows]
+
+    def list_runs(self, limit=50):
+        rows = self._execute(f"SELECT TOP ({int(limit)}) {', '.join(RUN_COLUMNS)} FROM TaskRuns ORDER BY RunId DESC", fetch="all")
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+    def get_lease_holder(self):
+        row = self._execute("SELECT Holder, ExpiresAt FROM ClusterLease WHERE Name = ?", (LEASE_NAME,), fetch="one")
+        return row[0] if row and row[1] > time.time() else None
+
+
+def create_cluster_store():
+    kind = get_store_kind()
+    if kind == "sqlite":
+        return SqliteClusterStore()
+    if kind == "sql":
+        return SqlServerClusterStore()
+    return None
+
+
+class ClusterCoordinator:
+    # One per dashboard instance. Every node heartbeats and claims queued runs while
+    # it has free slots. Every node queues the cron fires it sees, deduplicated by fire
+    # key, so a task scheduled through any node runs once; the node holding the lease
+    # requeues work from dead nodes.
+
+    def __init__(self, store, launch_run, node_id=NODE_ID, capacity=NODE_CAPACITY,
+                 lease_seconds=CLUSTER_LEASE_SECONDS, poll_interval=CLUSTER_POLL_INTERVAL):
+        self.store = store
+        self.launch_run = launch_run
+        self.node_id = node_id
+        self.capacity = capacity
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.is_leader = False
+        self.active_runs = {}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        print(f"[CLUSTER] Node {self.node_id} joined (capacity {self.capacity})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            await run_io(self.store.release_lease, self.node_id)
+            self.is_leader = False
+
+    def enqueue(self, task_id, task_name, fire_key=None):
+        # Called from APScheduler threads; None when another node queued this fire first
+        return self.store.enqueue_run(task_id, task_name, fire_key)
+
+    async def enqueue_if_idle(self, task_id, task_name):
+        return await run_io(self.store.enqueue_if_idle, task_id, task_name, self.lease_seconds * 2)
+
+    async def record_local_run(self, task_id, task_name):
+        return await run_io(self.store.record_local_run, task_id, task_name, self.node_id)
+
+    async def finish_local_run(self, run_id, exit_code):
+        await run_io(self.store.finish_run, run_id, exit_code)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[CLUSTER] Coordinator error: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def tick(self):
+        await run_io(self.store.heartbeat, self.node_id, self.capacity, len(self.active_runs))
+
+        was_leader = self.is_leader
+        self.is_leader = await run_io(self.store.try_acquire_lease, self.node_id, self.lease_seconds)
+        if self.is_leader != was_leader:
+            print(f"[CLUSTER] Node {self.node_id} {'is now' if self.is_leader else 'is no longer'} the scheduling leader")
+        if self.is_leader:
+            requeued = await run_io(self.store.requeue_orphaned_runs, self.lease_seconds * 2)
+            if requeued:
+                print(f"[CLUSTER] Requeued {requeued} run(s) from unresponsive nodes")
+
+        while len(self.active_runs) < self.capacity and await self._has_most_headroom():
+            run = await run_io(self.store.claim_run, self.node_id)
+            if not run:
+                break
+            await self._start_run(run)
+
+    async def _has_most_headroom(self):
+        # Spread by capacity: only the live node(s) with the largest free share claim next
+        nodes = await run_io(self.store.list_nodes)
+        now = time.time()
+        my_share = (self.capacity - len(self.active_runs)) / max(self.capacity, 1)
+        for node in nodes:
+            if node["NodeId"] == self.node_id or node["HeartbeatAt"] < now - self.lease_seconds:
+                continue
+            if (node["Capacity"] - node["Active"]) / max(node["Capacity"], 1) > my_share + 1e-9:
+                return False
+        return True
+
+    async def _start_run(self, run):
+        try:
+            process = await self.launch_run(run)
+        except Exception as e:
+            print(f"[CLUSTER] Run {run['run_id']} failed to launch: {e}")
+            await run_io(self.store.finish_run, run["run_id"], -1)
+            return
+
+        self.active_runs[run["run_id"]] = process
+        reaper.watch(f"run:{run['run_id']}", process, lambda p, run_id=run["run_id"]: self._finish_run(run_id, p))
+
+    async def _finish_run(self, run_id, process):
+        self.active_runs.pop(run_id, None)
+        await run_io(self.store.finish_run, run_id, process.returncode)
+        await run_io(self.store.heartbeat, self.node_id, self.capacity, len(self.active_runs))
+
+    async def status(self):
+        nodes, runs, holder = await asyncio.gather(
+            run_io(self.store.list_nodes), run_io(self.store.list_runs), run_io(self.store.get_lease_holder)
+        )
+        return {
+            "enabled": True,
+            "node_id": self.node_id,
+            "leader": holder,
+            "is_leader": self.is_leader,
+            "capacity": self.capacity,
+            "active_runs": list(self.active_runs),
+            "nodes": nodes,
+            "recent_runs": runs,
+        }
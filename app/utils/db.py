@@ -1,21 +1,42 @@
 # app/utils/db.py
-import os
-import pyodbc
-from dotenv import load_dotenv
 import json
-from pathlib import Path
+from app.utils.settings import get_settings
 
+TASKS_TABLE_DDL = """
+IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'Tasks')
+                    CREATE TABLE Tasks (
+                        Id INT IDENTITY PRIMARY KEY,
+                        Name NVARCHAR(255) NOT NULL,
+                        Path NVARCHAR(255) NOT NULL,
+                        Description NVARCHAR(255),
+                        Tags NVARCHAR(100),
+                        IsEnabled BIT NOT NULL,
+                        UseScheduler BIT NOT NULL DEFAULT 0,
+                        CronExpr NVARCHAR(50),
+                        CronExprParse NVARCHAR(255),
+                        Apps NVARCHAR(255),
+                        EmailRecipients NVARCHAR(1000),
+                        BotName NVARCHAR(100),
+                        PassBotParam BIT NOT NULL DEFAULT 0,
+                        PassPushParam BIT NOT NULL DEFAULT 0,
+                        PushText NVARCHAR(255),
+                        LastUpTime INT NULL,
+                        LastLaunchCount INT NULL,
+                        ScriptJson NVARCHAR(MAX) CHECK (ISJSON(ScriptJson) > 0),
+                        LastUpdated DATETIME DEFAULT GETDATE()
+                    )
+"""
 
-load_dotenv(dotenv_path=Path(".env"), override=True)
-
-def get_sql_connection(use_env_override=False):
-    server = os.getenv("SQL_SERVER")
-    database = os.getenv("SQL_DATABASE")
-    username = os.getenv("SQL_USER")
-    password = os.getenv("SQL_PASSWORD")
-    driver = os.getenv("SQL_DRIVER")
-    trusted = os.getenv("SQL_TRUSTED", "false").lower() == "true"
-    use_sql = os.getenv("USE_SQL", "false").lower() == "true"
+def get_sql_connection(use_env_override=False, settings=None):
+    # One snapshot for all parameters, so a concurrent .env reload cannot mix old and new values
+    settings = settings or get_settings()
+    server = settings.sql_server
+    database = settings.sql_database
+    username = settings.sql_user
+    password = settings.sql_password
+    driver = settings.sql_driver
+    trusted = settings.sql_trusted
+    use_sql = settings.use_sql
 
     # ⚠️ Only abort if not in override mode and USE_SQL is false
     if not use_env_override and not use_sql:
@@ -38,6 +59,8 @@ def get_sql_connection(use_env_override=False):
         )
 
     try:
+        # Imported on first use, so hosts without an ODBC driver manager run fine on JSON/SQLite
+        import pyodbc
         # print("[SQL] Trying connection string:", conn_str)
         return pyodbc.connect(conn_str)
     except Exception as e:
@@ -126,7 +149,7 @@ def save_sql_scripts(scripts, original_id=None):
     conn.close()
 
     # Optional: one-way sync SQL - scripts.json
-    if os.getenv("USE_SQL", "false").lower() == "true":
+    if get_settings().use_sql:
         try:
             scripts_for_json = load_sql_scripts() 
             with open("scripts.json", "w", encoding="utf-8") as f:
@@ -166,3 +189,145 @@ def load_sql_scripts(use_env_override=False):
         cursor.close()
         conn.close()
 
+
+
+TASK_COLUMNS_SQL = "SELECT Id, Name, Path, Description, Tags, IsEnabled, UseScheduler, CronExpr, CronExprParse, Apps,EmailRecipients, BotName, PassBotParam, PassPushParam, PushText, ScriptJson FROM Tasks"
+
+
+def list_sql_task_rows():
+    conn = get_sql_connection()
+    if conn is None:
+        raise ConnectionError("SQL connection failed")
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(TASK_COLUMNS_SQL)
+        scripts = []
+        for row in cursor.fetchall():
+            # Fields without a column of their own (agent, cron_jitter, urgent, profile, ...) only
+            # live in ScriptJson; the columns win for everything they hold
+            script = json.loads(row.ScriptJson) if row.ScriptJson else {}
+            script.update({
+                "id": row.Id,
+                "name": row.Name,
+                "enabled": row.IsEnabled == 1,
+                "path": row.Path,
+                "description": row.Description,
+                "tags": row.Tags or "",
+                "apps": json.loads(row.Apps or "[]"),
+                "email_recipients": row.EmailRecipients or "",
+                "schedule_expression": row.CronExpr,
+                "cron_expr_parse": row.CronExprParse,
+                "bot_name": row.BotName,
+                "pass_bot_param": row.PassBotParam,
+                "pass_push_param": getattr(row, "PassPushParam", False),
+                "push_text": getattr(row, "PushText", ""),
+            })
+            scripts.append(script)
+        return scripts
+    finally:
+        conn.close()
+
+
+def update_sql_script_state(script_id, enabled, last_uptime=None, last_launch_count=None):
+    conn = get_sql_connection()
+    if not conn:
+        return
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE Tasks
+            SET IsEnabled = ?,
+                LastUpTime = ?,
+                LastLaunchCount = ?
+            WHERE Id = ?
+        """, (
+            int(bool(enabled)),
+            last_uptime,
+            last_launch_count,
+            script_id
+        ))
+        conn.commit()
+    except Exception as e:
+        print("[DB] Failed to update script state:", e)
+    finally:
+        conn.close()
+
+
+def delete_sql_script(script_id):
+    conn = get_sql_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Name FROM Tasks WHERE Id = ?", script_id)
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM Tasks WHERE Id = ?", script_id)
+        conn.commit()
+        print(f"[DB] Deleted task with ID: {script_id}")
+        return row.Name if row else None
+    finally:
+        conn.close()
+
+
+def create_sql_tasks_table(ddl):
+    conn = get_sql_connection()
+    if not conn:
+        return
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(ddl)
+        conn.commit()
+        print("[DB] Tasks table created (if not exists)")
+    except Exception as e:
+        print("[DB] Failed to create Tasks table:", e)
+    finally:
+        conn.close()
+
+
+def check_sql_tasks_table(settings=None):
+    conn = get_sql_connection(use_env_override=True, settings=settings)
+    if not conn:
+        raise ConnectionError("get_sql_connection() returned None — possibly invalid driver or connection string.")
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_NAME = 'Tasks'
+        """)
+        return cursor.fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+def save_sql_uptimes(uptimes):
+    conn = get_sql_connection()
+    if not conn:
+        return
+
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE Tasks SET LastUpTime = ? WHERE Id = ?",
+            [(int(seconds), int(script_id)) for script_id, seconds in uptimes.items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_sql_uptimes():
+    conn = get_sql_connection()
+    if not conn:
+        return {}
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Id, LastUpTime FROM Tasks WHERE LastUpTime IS NOT NULL")
+        return {row.Id: row.LastUpTime for row in cursor.fetchall()}
+    finally:
+        conn.close()
@@ -0,0 +1,39 @@
+# app/utils/email_client.py
+#
+# Used by task scripts: queues mail on the dashboard's email service, which keeps
+# one authenticated SMTP session and batches/deduplicates alerts. Falls back to
+# an in-process service when the dashboard is not reachable.
+import os
+import requests
+
+
+PIPECRAB_API_URL = os.getenv("PIPECRAB_API_URL", "http://127.0.0.1:8000").rstrip("/")
+EMAIL_CLIENT_TIMEOUT = float(os.getenv("EMAIL_CLIENT_TIMEOUT", "300"))
+
+_session = requests.Session()
+
+
+def send_email(recipients, subject, body):
+    try:
+        response = _session.post(
+            f"{PIPECRAB_API_URL}/email/send",
+            json={"recipients": list(recipients), "subject": subject, "body": body},
+            timeout=EMAIL_CLIENT_TIMEOUT
+        )
+    except requests.ConnectionError:
+        from app.utils.email_service import EmailService
+        service = EmailService(batch_window=0)
+        try:
+            return service.send(recipients, subject, body).result()
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        finally:
+            service.close()
+
+    try:
+        result = response.json()
+    except ValueError:
+        return {"ok": False, "error": f"{response.status_code} {response.text[:300]}"}
+    if response.status_code != 200:
+        return {"ok": False, "error": result.get("detail", "")}
+    return result
@@ -0,0 +1,233 @@
+# app/utils/email_service.py
+import os
+import time
+import smtplib
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from email.mime.text import MIMEText
+
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# An authenticated connection is kept open this long after the last message
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+EMAIL_FROM = os.getenv("EMAIL_FROM") or EMAIL_USER or "pipecrab@localhost"
+# Messages to the same recipients within this window go out as one email
+EMAIL_BATCH_WINDOW = float(os.getenv("EMAIL_BATCH_WINDOW", "2"))
+EMAIL_MAX_BATCH = int(os.getenv("EMAIL_MAX_BATCH", "20"))
+# Identical alerts (same recipients, subject and body) inside this window are sent once
+EMAIL_DEDUPE_WINDOW = float(os.getenv("EMAIL_DEDUPE_WINDOW", "300"))
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "4"))
+
+
+class TransientEmailError(Exception):
+    pass
+
+
+class EmailService:
+    # One worker thread, one reused SMTP session. Messages are grouped by recipient
+    # set, so a burst of alerts becomes one digest per group instead of one
+    # connection + STARTTLS + login per alert.
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, user=EMAIL_USER, password=EMAIL_PASS,
+                 starttls=SMTP_STARTTLS, batch_window=EMAIL_BATCH_WINDOW, dedupe_window=EMAIL_DEDUPE_WINDOW):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.batch_window = batch_window
+        self.dedupe_window = dedupe_window
+        self.pending = OrderedDict()
+        self.recent = {}
+        self.cond = threading.Condition()
+        self.thread = None
+        self.closing = False
+        self.connection = None
+        self.last_used = 0
+        self.stats = {"sent": 0, "failed": 0, "batched": 0, "deduplicated": 0, "retries": 0, "connections": 0}
+
+    def send(self, recipients, subject, body):
+        recipients = tuple(sorted({r.strip().lower() for r in recipients if r.strip()}))
+        if not recipients:
+            raise ValueError("No recipients")
+        digest = hashlib.sha256("\0".join([",".join(recipients), subject, body]).encode("utf-8")).hexdigest()
+
+        with self.cond:
+            if self.closing:
+                raise RuntimeError("Email service is shutting down")
+            now = time.monotonic()
+            self.recent = {k: v for k, v in self.recent.items() if now - v[0] < self.dedupe_window}
+            # Only pending and delivered messages are deduplicated, so a failed send can be retried at once
+            if digest in self.recent and not self._failed(self.recent[digest][1]):
+                self.stats["deduplicated"] += 1
+                return self.recent[digest][1]
+
+            future = Future()
+            self.recent[digest] = (now, future)
+            group = self.pending.setdefault(recipients, {"first_at": now, "items": []})
+            group["items"].append((subject, body, future))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name="email-queue", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return future
+
+    @staticmethod
+    def _failed(future):
+        if not future.done():
+            return False
+        return future.exception() is not None or not future.result().get("ok")
+
+    def pending_count(self):
+        with self.cond:
+            return sum(len(group["items"]) for group in self.pending.values())
+
+    def _next_group(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                wait = None
+                for recipients, group in self.pending.items():
+                    due = group["first_at"] + self.batch_window - now
+                    if self.closing or due <= 0 or len(group["items"]) >= EMAIL_MAX_BATCH:
+                        items = group["items"][:EMAIL_MAX_BATCH]
+                        del group["items"][:EMAIL_MAX_BATCH]
+                        if not group["items"]:
+                            del self.pending[recipients]
+                        return recipients, items
+                    wait = due if wait is None else min(wait, due)
+                if self.closing:
+                    return None
+
+                idle = self.last_used + SMTP_IDLE_TIMEOUT - now
+                if self.connection is not None:
+                    if idle <= 0:
+                        self._disconnect()
+                    else:
+                        wait = idle if wait is None else min(wait, idle)
+                self.cond.wait(wait)
+
+    def _worker(self):
+        while True:
+            group = self._next_group()
+            if group is None:
+                self._disconnect()
+                return
+            try:
+                self._deliver(*group)
+            except Exception as e:
+                # Anything unexpected (bad address, MIME error) fails this batch only; the worker keeps going
+                print(f"[EMAIL] Delivery to {', '.join(group[0])} failed: {e}")
+                with self.cond:
+                    self.stats["failed"] += 1
+                for _, _, future in group[1]:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _build_message(self, recipients, items):
+        if len(items) == 1:
+            subject, body, _ = items[0]
+        else:
+            subject = f"[{len(items)} notifications] {items[0][0]}"
+            body = "\n\n----------------------------------------\n\n".join(f"{s}\n\n{b}" for s, b, _ in items)
+        msg = MIMEText(body, "plain", "utf-8")
+        msg["From"] = EMAIL_FROM
+        msg["To"] = ", ".join(recipients)
+        msg["Subject"] = subject
+        return msg
+
+    def _deliver(self, recipients, items):
+        msg = self._build_message(recipients, items).as_string()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                refused = self._connect().sendmail(EMAIL_FROM, list(recipients), msg)
+                self.last_used = time.monotonic()
+                result = {"ok": True, "attempts": attempts, "batched": len(items), "refused": sorted(refused)}
+                break
+            except TransientEmailError as e:
+                error = str(e)
+            except smtplib.SMTPResponseException as e:
+                error = f"{e.smtp_code} {e.smtp_error.decode(errors='replace') if isinstance(e.smtp_error, bytes) else e.smtp_error}"
+                if not 400 <= e.smtp_code < 500:
+                    result = {"ok": False, "attempts": attempts, "batched": len(items), "error": error}
+                    break
+            except smtplib.SMTPRecipientsRefused as e:
+                result = {"ok": False, "attempts": attempts, "batched": len(items), "error": f"recipients refused: {sorted(e.recipients)}"}
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                error = str(e) or type(e).__name__
+                self._disconnect()
+
+            if attempts > EMAIL_MAX_RETRIES:
+                result = {"ok": False, "attempts": attempts, "batched": len(items), "error": error}
+                break
+            with self.cond:
+                self.stats["retries"] += 1
+            time.sleep(min(2 ** (attempts - 1), 30))
+
+        with self.cond:
+            self.stats["sent" if result["ok"] else "failed"] += 1
+            self.stats["batched"] += len(items) - 1
+        if not result["ok"]:
+            print(f"[EMAIL] Delivery to {', '.join(recipients)} failed: {result['error']}")
+        for _, _, future in items:
+            future.set_result(result)
+
+    def _connect(self):
+        if self.connection is not None:
+            try:
+                if self.connection.noop()[0] == 250:
+                    return self.connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+
+        try:
+            connection = smtplib.SMTP(self.server, self.port, timeout=SMTP_TIMEOUT)
+        except OSError as e:
+            raise TransientEmailError(f"connect to {self.server}:{self.port} failed: {e}")
+        try:
+            if self.starttls:
+                connection.starttls()
+            if self.user and self.password:
+                connection.login(self.user, self.password)
+        except Exception:
+            connection.close()
+            raise
+        self.connection = connection
+        with self.cond:
+            self.stats["connections"] += 1
+        return connection
+
+    def _disconnect(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+    def status(self):
+        with self.cond:
+            return dict(self.stats, pending=sum(len(group["items"]) for group in self.pending.values()), connected=self.connection is not None)
+
+    def close(self, timeout=10):
+        # Flushes everything still queued without waiting for the batch window
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+email_service = EmailService()
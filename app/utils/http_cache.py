@@ -0,0 +1,257 @@
+# app/utils/http_cache.py
+#
+# On-disk HTTP cache for task scripts. Responses are revalidated with
+# ETag/Last-Modified, bodies are stored once per sha256 (two URLs serving the same
+# image share one file), total size is capped with LRU eviction, and a ledger
+# records which items were already posted so re-runs do not post twice.
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import requests
+from requests.adapters import HTTPAdapter
+
+
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "cache")
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Responses (
+    Url TEXT PRIMARY KEY,
+    ETag TEXT,
+    LastModified TEXT,
+    ContentType TEXT,
+    BlobHash TEXT NOT NULL,
+    FetchedAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Blobs (
+    Hash TEXT PRIMARY KEY,
+    Size INTEGER NOT NULL,
+    LastUsed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Blobs_LastUsed ON Blobs(LastUsed);
+CREATE TABLE IF NOT EXISTS Posted (
+    Ledger TEXT NOT NULL,
+    ItemId TEXT NOT NULL,
+    PostedAt REAL NOT NULL,
+    Info TEXT,
+    PRIMARY KEY (Ledger, ItemId)
+);
+"""
+
+
+class CachedResponse:
+    def __init__(self, url, status_code, content, headers=None, from_cache=False, content_hash=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache  # True when the body came from disk (304 revalidation)
+        self.content_hash = content_hash
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}")
+
+
+class CachedFile:
+    # Result of HttpCache.download(): the body lives on disk, never fully in memory
+    def __init__(self, url, status_code, path, size, from_cache=False, content_hash=None):
+        self.url = url
+        self.status_code = status_code
+        self.path = path
+        self.size = size
+        self.from_cache = from_cache
+        self.content_hash = content_hash
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}")
+
+
+class HttpCache:
+    def __init__(self, path=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(path, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        # Several scripts may share the cache at once; WAL + busy timeout handle that
+        self.db = sqlite3.connect(os.path.join(path, "index.db"), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA_SQL)
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+    # --- blobs ---
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blob_dir, content_hash[:2], content_hash)
+
+    def _read_blob(self, content_hash):
+        try:
+            with open(self._blob_path(content_hash), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store_blob(self, content):
+        content_hash = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, blob_path)
+        self._record_blob(content_hash, len(content))
+        return content_hash
+
+    def _record_blob(self, content_hash, size):
+        self.db.execute(
+            "INSERT INTO Blobs (Hash, Size, LastUsed) VALUES (?, ?, ?) ON CONFLICT(Hash) DO UPDATE SET LastUsed = excluded.LastUsed",
+            (content_hash, size, time.time())
+        )
+
+    def _stream_blob(self, response, max_bytes):
+        # Hash while writing chunks to a temp file, then move it into place
+        length = response.headers.get("Content-Length")
+        if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Response is {int(length)} bytes, limit is {max_bytes}")
+
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.blob_dir, f"download.{os.getpid()}.{time.monotonic_ns()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise ValueError(f"Response exceeded the limit of {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            content_hash = digest.hexdigest()
+            blob_path = self._blob_path(content_hash)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._record_blob(content_hash, size)
+        return content_hash, size
+
+    def _save_response(self, url, response, content_hash):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.db.execute(
+                "INSERT INTO Responses (Url, ETag, LastModified, ContentType, BlobHash, FetchedAt) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(Url) DO UPDATE SET ETag = excluded.ETag, LastModified = excluded.LastModified, "
+                "ContentType = excluded.ContentType, BlobHash = excluded.BlobHash, FetchedAt = excluded.FetchedAt",
+                (url, etag, last_modified, response.headers.get("Content-Type"), content_hash, time.time())
+            )
+
+    def _evict(self, keep=None):
+        total = self.db.execute("SELECT COALESCE(SUM(Size), 0) FROM Blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for content_hash, size in self.db.execute("SELECT Hash, Size FROM Blobs ORDER BY LastUsed").fetchall():
+            if total <= self.max_bytes:
+                break
+            if content_hash == keep:
+                continue  # the caller is about to read this one
+            self.db.execute("DELETE FROM Responses WHERE BlobHash = ?", (content_hash,))
+            self.db.execute("DELETE FROM Blobs WHERE Hash = ?", (content_hash,))
+            try:
+                os.remove(self._blob_path(content_hash))
+            except OSError:
+                pass
+            total -= size
+
+    # --- requests ---
+    def get(self, url, params=None, timeout=30, **kwargs):
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        row = self.db.execute(
+            "SELECT ETag, LastModified, ContentType, BlobHash FROM Responses WHERE Url = ?", (full_url,)
+        ).fetchone()
+
+        headers = dict(kwargs.pop("headers", {}) or {})
+        if row:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+
+        response = self.session.get(full_url, headers=headers, timeout=timeout, **kwargs)
+
+        if response.status_code == 304 and row:
+            content = self._read_blob(row[3])
+            if content is not None:
+                self.db.execute("UPDATE Blobs SET LastUsed = ? WHERE Hash = ?", (time.time(), row[3]))
+                return CachedResponse(full_url, 200, content, {"Content-Type": row[2] or ""}, from_cache=True, content_hash=row[3])
+            # Blob went missing: fetch again without validators
+            response = self.session.get(full_url, timeout=timeout, **kwargs)
+
+        if response.status_code != 200:
+            return CachedResponse(full_url, response.status_code, response.content, dict(response.headers))
+
+        content_hash = self._store_blob(response.content)
+        self._save_response(full_url, response, content_hash)
+        self._evict()
+        return CachedResponse(full_url, 200, response.content, dict(response.headers), content_hash=content_hash)
+
+    def download(self, url, max_bytes=None, timeout=30, **kwargs):
+        # Like get(), but streams the body to disk in chunks and returns its path.
+        # Raises ValueError once the body grows past max_bytes.
+        full_url = requests.Request("GET", url, params=kwargs.pop("params", None)).prepare().url
+        row = self.db.execute("SELECT ETag, LastModified, BlobHash FROM Responses WHERE Url = ?", (full_url,)).fetchone()
+
+        headers = {}
+        if row and os.path.exists(self._blob_path(row[2])):
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+
+        with self.session.get(full_url, headers=headers, timeout=timeout, stream=True, **kwargs) as response:
+            if response.status_code == 304 and headers:
+                blob_path = self._blob_path(row[2])
+                self.db.execute("UPDATE Blobs SET LastUsed = ? WHERE Hash = ?", (time.time(), row[2]))
+                return CachedFile(full_url, 200, blob_path, os.path.getsize(blob_path), from_cache=True, content_hash=row[2])
+            if response.status_code != 200:
+                return CachedFile(full_url, response.status_code, None, 0)
+            content_hash, size = self._stream_blob(response, max_bytes)
+            self._save_response(full_url, response, content_hash)
+
+        self._evict(keep=content_hash)
+        return CachedFile(full_url, 200, self._blob_path(content_hash), size, content_hash=content_hash)
+
+    # --- posted ledger ---
+    def already_posted(self, ledger, item_id):
+        return self.db.execute("SELECT 1 FROM Posted WHERE Ledger = ? AND ItemId = ?", (ledger, str(item_id))).fetchone() is not None
+
+    def mark_posted(self, ledger, item_id, info=None):
+        self.db.execute(
+            "INSERT OR REPLACE INTO Posted (Ledger, ItemId, PostedAt, Info) VALUES (?, ?, ?, ?)",
+            (ledger, str(item_id), time.time(), json.dumps(info) if info is not None else None)
+        )
+
+    def stats(self):
+        blobs, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(Size), 0) FROM Blobs").fetchone()
+        responses = self.db.execute("SELECT COUNT(*) FROM Responses").fetchone()[0]
+        posted = self.db.execute("SELECT COUNT(*) FROM Posted").fetchone()[0]
+        return {"responses": responses, "blobs": blobs, "bytes": size, "max_bytes": self.max_bytes, "posted": posted}
+
+    def close(self):
+        self.session.close()
+        self.db.close()
@@ -0,0 +1,29 @@
+# app/utils/image_pipeline.py
+import os
+import tempfile
+from PIL import Image
+
+
+# Telegram shows photos at up to 1280 px on the long side and recompresses anything larger
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1280"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+MAX_IMAGE_DOWNLOAD_MB = int(os.getenv("MAX_IMAGE_DOWNLOAD_MB", "50"))
+# Output stays in memory up to this size, then spills to a temp file
+SPOOL_MAX_BYTES = 2 * 1024 * 1024
+
+
+def prepare_photo(image_path, max_side=PHOTO_MAX_SIDE, quality=PHOTO_JPEG_QUALITY):
+    # Decodes from the file on disk. For JPEGs, draft() lets libjpeg decode at a
+    # scale of 1/2-1/8 straight away, so a 60 MP source is never materialised at
+    # full size. thumbnail() then does the final resize in place.
+    with Image.open(image_path) as img:
+        img.draft("RGB", (max_side, max_side))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        img.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+        size = img.size
+    output.seek(0)
+    return output, size
@@ -0,0 +1,92 @@
+# app/utils/log_reader.py
+#
+# Reads text task logs from the end without loading or decoding the whole file.
+# The log is memory-mapped and scanned backwards for newlines or a session marker
+# in fixed-size chunks, so the cost depends on how much is returned, not on the
+# size of the log. Offsets are byte offsets into the file and always fall on a
+# line start, so a reader can page backwards with before_offset.
+import os
+import mmap
+
+LOG_READ_CHUNK_BYTES = int(os.getenv("LOG_READ_CHUNK_KB", "64")) * 1024
+SESSION_MARKER = b"Task started."
+
+
+class MappedLog:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses empty files; an empty log simply has nothing to read
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.size:
+            self._map.close()
+        self._file.close()
+        return False
+
+    def clamp(self, offset):
+        # Bounds an offset to the file and moves it back to the start of its line
+        offset = self.size if offset is None else max(0, min(offset, self.size))
+        if 0 < offset < self.size and self._map[offset - 1:offset] != b"\n":
+            offset = self.line_start(offset)
+        return offset
+
+    def line_start(self, offset):
+        return self._map.rfind(b"\n", 0, offset) + 1 if offset else 0
+
+    def tail_offset(self, lines, end):
+        # Start of the last `lines` lines before `end`, counting newlines chunk by chunk
+        pos = end
+        if pos and self._map[pos - 1:pos] == b"\n":
+            pos -= 1  # the newline that ends the last line
+        remaining = lines
+        while pos > 0:
+            start = max(0, pos - LOG_READ_CHUNK_BYTES)
+            chunk = self._map[start:pos]
+            found = chunk.count(b"\n")
+            if found >= remaining:
+                index = len(chunk)
+                for _ in range(remaining):
+                    index = chunk.rfind(b"\n", 0, index)
+                return start + index + 1
+            remaining -= found
+            pos = start
+        return 0
+
+    def rfind_line(self, marker, end):
+        # Start of the last line before `end` that contains `marker`, or None
+        pos = end
+        while pos > 0:
+            start = max(0, pos - LOG_READ_CHUNK_BYTES)
+            # Overlap the chunks so a marker on a chunk border is still found
+            index = self._map.rfind(marker, max(0, start - len(marker) + 1), pos)
+            if index != -1:
+                return self.line_start(index)
+            pos = start
+        return None
+
+    def read(self, start, end):
+        return bytes(self._map[start:end])
+
+
+def read_log_window(path, tail=None, since_session=False, before_offset=None):
+    # Returns (text, start, end, size) for the requested slice of the log
+    with MappedLog(path) as log:
+        end = log.clamp(before_offset)
+        start = 0
+        if since_session:
+            start = log.rfind_line(SESSION_MARKER, end) or 0
+        if tail is not None:
+            start = max(start, log.tail_offset(tail, end))
+        return log.read(start, end).decode("utf-8", errors="replace"), start, end, log.size
+
+
+def read_last_session(path):
+    # Bytes from the last session marker to EOF, or None when there is no marker
+    with MappedLog(path) as log:
+        start = log.rfind_line(SESSION_MARKER, log.size)
+        return None if start is None else log.read(start, log.size)
@@ -0,0 +1,155 @@
+# app/utils/pid_registry.py
+import os
+import json
+import time
+import signal
+import hashlib
+import threading
+import subprocess
+from datetime import datetime
+
+
+PID_REGISTRY_PATH = os.getenv("PID_REGISTRY_PATH", "pids.json")
+
+_lock = threading.Lock()
+
+
+def detached_popen_kwargs():
+    # Children get their own session/process group, so a Ctrl+C or reload of
+    # uvicorn does not take them down and they can be re-adopted afterwards
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def command_hash(command):
+    # Same layout as /proc/<pid>/cmdline: NUL-separated arguments with a trailing NUL
+    return hashlib.sha256(("\0".join(command) + "\0").encode("utf-8", errors="surrogateescape")).hexdigest()
+
+
+def read_proc_start_ticks(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+        # comm may contain spaces, so split after its closing bracket; starttime is field 22
+        fields = stat[stat.rfind(")") + 2:].split()
+        if fields[0] == "Z":
+            return None
+        return int(fields[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def read_proc_cmdline_hash(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _read_registry():
+    if not os.path.exists(PID_REGISTRY_PATH):
+        return {}
+    try:
+        with open(PID_REGISTRY_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[PIDS] Failed to read {PID_REGISTRY_PATH}: {e}")
+        return {}
+
+
+def _write_registry(registry):
+    tmp_path = f"{PID_REGISTRY_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, PID_REGISTRY_PATH)
+
+
+def register_process(script_id, script_name, pid, command, start_time, log_file_path, run_id=None):
+    with _lock:
+        registry = _read_registry()
+        registry[str(script_id)] = {
+            "pid": pid,
+            "name": script_name,
+            "start_time": start_time.isoformat(),
+            "proc_start_ticks": read_proc_start_ticks(pid),
+            "cmdline_hash": command_hash(command),
+            "log_file_path": log_file_path,
+            "run_id": run_id,
+        }
+        _write_registry(registry)
+
+
+def unregister_process(script_id):
+    with _lock:
+        registry = _read_registry()
+        if registry.pop(str(script_id), None) is not None:
+            _write_registry(registry)
+
+
+def load_registry():
+    with _lock:
+        return _read_registry()
+
+
+def replace_registry(registry):
+    with _lock:
+        _write_registry(registry)
+
+
+def verify_registered_process(entry):
+    # A live pid is only ours if both the kernel start time and the exact command
+    # line match what we recorded at launch; anything else is pid reuse.
+    pid = entry.get("pid")
+    if not pid or not os.path.isdir(f"/proc/{pid}"):
+        return False
+    if entry.get("proc_start_ticks") is not None and read_proc_start_ticks(pid) != entry["proc_start_ticks"]:
+        return False
+    return read_proc_cmdline_hash(pid) == entry.get("cmdline_hash")
+
+
+class AdoptedProcess:
+    # Popen-like handle for a process started by a previous dashboard instance.
+    # It is not our child, so the exit code cannot be collected.
+    adopted = True
+
+    def __init__(self, pid, proc_start_ticks=None):
+        self.pid = pid
+        self.proc_start_ticks = proc_start_ticks
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            ticks = read_proc_start_ticks(self.pid)
+            if ticks is None or (self.proc_start_ticks is not None and ticks != self.proc_start_ticks):
+                self.returncode = -1
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                self.returncode = -1
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+def registry_start_time(entry):
+    try:
+        return datetime.fromisoformat(entry["start_time"])
+    except (KeyError, ValueError):
+        return datetime.utcnow()
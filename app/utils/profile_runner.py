@@ -0,0 +1,141 @@
+# app/utils/profile_runner.py
+#
+# Runs a task script under a profiler without changing the script:
+#
+#   python -u -m app.utils.profile_runner --mode cprofile --top 20 scripts/nasa_day_image.py --bot TestBot
+#
+# The profile is written to PIPECRAB_ARTIFACT_DIR (so it is stored with the run's
+# artifacts) and the hottest functions are printed at the end of the task log.
+#   cprofile: deterministic, profile.prof (pstats) + profile.json
+#   sample:   wall-clock stack sampling of all threads, profile.collapsed + profile.json;
+#             low overhead, and shows time spent waiting on the network
+import os
+import sys
+import json
+import time
+import runpy
+import signal
+import pstats
+import cProfile
+import argparse
+import threading
+from collections import Counter
+
+from app.utils.profiler import thread_stack, collapsed, summarize
+
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name="pipecrab-profiler", daemon=True)
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = thread_stack(frame)
+                # Main thread: drop the runner's own frames so the stack starts at the script
+                runpy_frames = [i for i, label in enumerate(stack) if "runpy" in label and label.endswith(":_run_code")]
+                if len(runpy_frames) > 1:
+                    stack = stack[runpy_frames[-1] + 1:]
+                if stack:
+                    self.counts[";".join([names.get(ident, str(ident))] + stack)] += 1
+            self.samples += 1
+
+
+def cprofile_summary(profile, top):
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (calls, _, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{'/'.join(filename.replace(chr(92), '/').split('/')[-2:])}:{name}",
+            "line": line,
+            "calls": calls,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        })
+    rows.sort(key=lambda row: row["tottime"], reverse=True)
+    return rows[:top]
+
+
+def write_profile(mode, out_dir, wall_seconds, functions, exit_code):
+    with open(os.path.join(out_dir, "profile.json"), "w", encoding="utf-8") as f:
+        json.dump({"mode": mode, "wall_seconds": round(wall_seconds, 3), "exit_code": exit_code, "functions": functions}, f, indent=2)
+
+
+def print_top(mode, wall_seconds, functions, limit=10):
+    print(f"[PROFILE] {mode} profile, {wall_seconds:.2f}s wall, hottest functions:")
+    for row in functions[:limit]:
+        if mode == "cprofile":
+            print(f"[PROFILE]   {row['tottime']:>9.3f}s self {row['cumtime']:>9.3f}s total {row['calls']:>8} calls  {row['function']}")
+        else:
+            print(f"[PROFILE]   {row['self']:>6} self {row['total']:>6} total samples  {row['function']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a script under cProfile or a stack sampler")
+    parser.add_argument("--mode", choices=["cprofile", "sample"], default="cprofile")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    out_dir = os.environ.get("PIPECRAB_ARTIFACT_DIR") or os.getcwd()
+    script = os.path.abspath(args.script)
+    sys.argv = [script] + args.args
+    sys.path.insert(0, os.path.dirname(script))
+
+    # Stopping the task sends SIGTERM; exit through the finally block so the profile is still written
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(128 + signal.SIGTERM))
+
+    profile = cProfile.Profile() if args.mode == "cprofile" else None
+    sampler = StackSampler(PROFILE_SAMPLE_INTERVAL) if args.mode == "sample" else None
+    exit_code = 0
+    started = time.perf_counter()
+    try:
+        if profile:
+            profile.enable()
+        else:
+            sampler.start()
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        exit_code = 1
+        raise
+    finally:
+        if profile:
+            profile.disable()
+        else:
+            sampler.stopped.set()
+            sampler.join()
+        wall_seconds = time.perf_counter() - started
+        sys.stdout.flush()
+
+        try:
+            if profile:
+                profile.dump_stats(os.path.join(out_dir, "profile.prof"))
+                functions = cprofile_summary(profile, args.top)
+            else:
+                with open(os.path.join(out_dir, "profile.collapsed"), "w", encoding="utf-8") as f:
+                    f.write(collapsed(sampler.counts))
+                functions = summarize(sampler.counts, sampler.samples, None)["top_functions"]
+                functions = sorted(functions, key=lambda row: row["self"], reverse=True)[:args.top]
+            write_profile(args.mode, out_dir, wall_seconds, functions, exit_code)
+            print_top(args.mode, wall_seconds, functions)
+        except Exception as e:
+            print(f"[PROFILE] Failed to write profile: {e}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
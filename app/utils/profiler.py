@@ -0,0 +1,104 @@
+# app/utils/profiler.py
+#
+# Time-boxed sampling profiler for the running dashboard. A background thread
+# reads every thread's Python stack (sys._current_frames) and the await chain of
+# every asyncio task at a fixed interval, and aggregates them as collapsed stacks
+# ("root;frame;frame count"), the input format of flamegraph.pl and speedscope.
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+
+
+# Leaf frames that mean "blocked, waiting for work" rather than using CPU
+IDLE_LEAVES = {"select", "poll", "wait", "_worker", "get", "sleep", "accept", "_wait_for_tstate_lock", "serve_forever"}
+
+_profile_lock = threading.Lock()
+
+
+def frame_label(code):
+    parts = code.co_filename.replace("\\", "/").split("/")
+    return f"{'/'.join(parts[-2:])}:{code.co_name}"
+
+
+def thread_stack(frame):
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def task_stack(task):
+    # Outermost coroutine first, following what each one is awaiting
+    stack, coro = [], task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(frame_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+def keep_stack(stack, include_idle, exclude):
+    if not stack or any(frame.endswith(marker) for frame in stack for marker in exclude):
+        return False
+    return include_idle or stack[-1].rsplit(":", 1)[-1] not in IDLE_LEAVES
+
+
+def sample_stacks(seconds, interval, loop=None, include_idle=False, exclude=()):
+    # exclude: frame labels whose stacks are dropped (e.g. the request that asked for the profile)
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        counts = Counter()
+        samples = 0
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = thread_stack(frame)
+                if keep_stack(stack, include_idle, exclude):
+                    counts[";".join([f"thread:{names.get(ident, ident)}"] + stack)] += 1
+
+            if loop is not None:
+                for task in list(asyncio.all_tasks(loop)):
+                    stack = task_stack(task)
+                    if keep_stack(stack, include_idle, exclude):
+                        counts[";".join([f"task:{task.get_name()}"] + stack)] += 1
+
+            samples += 1
+            time.sleep(interval)
+        return counts, samples
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(counts):
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+def summarize(counts, samples, top=20):
+    self_counts, total_counts, roots = Counter(), Counter(), Counter()
+    for stack, count in counts.items():
+        frames = stack.split(";")
+        roots[frames[0]] += count
+        self_counts[frames[-1]] += count
+        for frame in set(frames[1:]):
+            total_counts[frame] += count
+    return {
+        "samples": samples,
+        "distinct_stacks": len(counts),
+        "roots": dict(roots.most_common()),
+        "top_stacks": [{"stack": stack, "count": count} for stack, count in counts.most_common(top)],
+        "top_functions": [
+            {"function": name, "self": self_counts[name], "total": count}
+            for name, count in total_counts.most_common(top)
+        ],
+    }
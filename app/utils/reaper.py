@@ -0,0 +1,104 @@
+# app/utils/reaper.py
+import os
+import asyncio
+
+
+REAPER_POLL_INTERVAL = float(os.getenv("REAPER_POLL_INTERVAL", "0.5"))
+
+
+class ProcessReaper:
+    # Central exit watcher for child processes. On Linux each process gets a pidfd
+    # registered with the event loop, so exits are delivered without polling;
+    # elsewhere a single poll task checks every watched process.
+
+    def __init__(self, poll_interval=REAPER_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._watched = {}
+        self._poll_task = None
+        self._loop = None
+
+    def watch(self, key, process, callback):
+        # callback(process) is a coroutine function, awaited on the event loop once process exits
+        self.unwatch(key)
+        self._loop = asyncio.get_running_loop()
+
+        pidfd = self._open_pidfd(key, process)
+        self._watched[key] = (process, callback, pidfd)
+
+        if pidfd is None:
+            self._ensure_poll_task()
+        elif process.poll() is not None:
+            # Exited before the reader was registered
+            self._finish(key)
+
+    def unwatch(self, key):
+        entry = self._watched.pop(key, None)
+        if entry:
+            self._close_pidfd(entry[2])
+
+    def is_watching(self, key):
+        return key in self._watched
+
+    def watched_processes(self):
+        # Snapshot, safe to call from other threads; a process may be watched under several keys
+        return list({id(entry[0]): entry[0] for entry in list(self._watched.values())}.values())
+
+    def close(self):
+        for key in list(self._watched):
+            self.unwatch(key)
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def _open_pidfd(self, key, process):
+        # Remote handles carry a pid from another host and are polled instead
+        if not hasattr(os, "pidfd_open") or not getattr(process, "supports_pidfd", True):
+            return None
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError:
+            return None
+        try:
+            self._loop.add_reader(pidfd, self._finish, key)
+        except (NotImplementedError, RuntimeError):
+            os.close(pidfd)  # loop without reader support (Proactor)
+            return None
+        return pidfd
+
+    def _close_pidfd(self, pidfd):
+        if pidfd is None:
+            return
+        try:
+            self._loop.remove_reader(pidfd)
+        except Exception:
+            pass
+        os.close(pidfd)
+
+    def _finish(self, key):
+        entry = self._watched.pop(key, None)
+        if entry is None:
+            return
+        process, callback, pidfd = entry
+        self._close_pidfd(pidfd)
+        process.poll()  # reap the zombie and record the return code
+        self._loop.create_task(self._run_callback(key, callback, process))
+
+    async def _run_callback(self, key, callback, process):
+        try:
+            await callback(process)
+        except Exception as e:
+            print(f"[REAPER] Exit handler for {key} failed: {e}")
+
+    def _ensure_poll_task(self):
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = self._loop.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        while any(pidfd is None for _, _, pidfd in self._watched.values()):
+            await asyncio.sleep(self.poll_interval)
+            for key, (process, _, pidfd) in list(self._watched.items()):
+                if pidfd is None and process.poll() is not None:
+                    self._finish(key)
+
+
+reaper = ProcessReaper()
@@ -0,0 +1,50 @@
+# app/utils/request_timing.py
+#
+# Per-request phase timings. Handlers wrap their steps in `with phase("storage"):`;
+# the middleware logs requests slower than SLOW_REQUEST_MS with the breakdown and
+# adds a Server-Timing header, so browser dev tools show the same numbers.
+import os
+import time
+from contextvars import ContextVar
+
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables the middleware
+
+_phases = ContextVar("request_phases", default=None)
+
+
+class phase:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        phases = _phases.get()
+        if phases is not None:
+            phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+async def timing_middleware(request, call_next):
+    phases = {}
+    token = _phases.set(phases)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _phases.reset(token)
+    total_ms = (time.perf_counter() - started) * 1000
+
+    breakdown = {name: seconds * 1000 for name, seconds in phases.items()}
+    if breakdown:
+        breakdown["other"] = max(0.0, total_ms - sum(breakdown.values()))
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{name};dur={ms:.1f}" for name, ms in breakdown.items()] + [f"total;dur={total_ms:.1f}"]
+    )
+    if total_ms >= SLOW_REQUEST_MS:
+        details = " ".join(f"{name}={ms:.0f}ms" for name, ms in breakdown.items())
+        print(f"[SLOW] {request.method} {request.url.path} {total_ms:.0f}ms {details}".rstrip())
+    return response
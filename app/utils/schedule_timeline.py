@@ -0,0 +1,151 @@
+# app/utils/schedule_timeline.py
+#
+# Upcoming cron fire times for the scheduler's jobs, a per-minute histogram of
+# concurrent starts, and a suggestion that staggers colliding jobs.
+import os
+import bisect
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from apscheduler.triggers.cron import CronTrigger
+
+
+TIMELINE_CACHE_HOURS = int(os.getenv("TIMELINE_CACHE_HOURS", "48"))
+TIMELINE_CACHE_SIZE = int(os.getenv("TIMELINE_CACHE_SIZE", "256"))
+# More starts than this in one minute counts as a collision
+SCHEDULE_SPREAD_LIMIT = int(os.getenv("SCHEDULE_SPREAD_LIMIT", "1"))
+# How far (in minutes) a job may be moved by the spread suggestion
+SCHEDULE_SPREAD_WINDOW = int(os.getenv("SCHEDULE_SPREAD_WINDOW", "15"))
+MAX_FIRES_PER_EXPRESSION = 20000
+
+_fire_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def trigger_expression(trigger):
+    # CronTrigger.from_crontab keeps each field's text, so the crontab line can be rebuilt
+    fields = {field.name: str(field) for field in trigger.fields}
+    return f"{fields['minute']} {fields['hour']} {fields['day']} {fields['month']} {fields['day_of_week']}"
+
+
+def _compute_fire_times(expression, timezone, start, end):
+    trigger = CronTrigger.from_crontab(expression, timezone=timezone)
+    fires, previous, now = [], None, start
+    while len(fires) < MAX_FIRES_PER_EXPRESSION:
+        next_fire = trigger.get_next_fire_time(previous, now)
+        if next_fire is None or next_fire > end:
+            break
+        fires.append(next_fire)
+        previous = now = next_fire
+    return fires
+
+
+def fire_times(expression, timezone, start, end):
+    # Cached per expression: one computation covers TIMELINE_CACHE_HOURS and is sliced afterwards
+    key = (expression, str(timezone))
+    with _cache_lock:
+        cached = _fire_cache.get(key)
+        if cached:
+            _fire_cache.move_to_end(key)
+    if not cached or cached[0] > start or cached[1] < end:
+        until = max(end, start + timedelta(hours=TIMELINE_CACHE_HOURS))
+        cached = (start, until, _compute_fire_times(expression, timezone, start, until))
+        with _cache_lock:
+            _fire_cache[key] = cached
+            while len(_fire_cache) > TIMELINE_CACHE_SIZE:
+                _fire_cache.popitem(last=False)
+    fires = cached[2]
+    return fires[bisect.bisect_left(fires, start):bisect.bisect_right(fires, end)]
+
+
+def minute_key(moment, tz):
+    # Jobs may run in different time zones; bucket everything in the timeline's zone
+    return moment.astimezone(tz).strftime("%Y-%m-%dT%H:%M")
+
+
+def shifted_expressions(expression):
+    # Candidate expressions with only the minute field moved, nearest first
+    minute, rest = expression.split(" ", 1)
+    if minute.isdigit():
+        base = int(minute)
+        for delta in range(1, SCHEDULE_SPREAD_WINDOW + 1):
+            for candidate in (base + delta, base - delta):
+                if 0 <= candidate <= 59:
+                    yield candidate - base, f"{candidate} {rest}"
+    elif minute == "*" or (minute.startswith("*/") and minute[2:].isdigit()):
+        step = 1 if minute == "*" else int(minute[2:])
+        for offset in range(1, min(step, SCHEDULE_SPREAD_WINDOW + 1)):
+            yield offset, f"{offset}-59/{step} {rest}"
+
+
+def _overlap(load, minutes, limit):
+    return sum(max(0, load[m] + 1 - limit) for m in minutes)
+
+
+def suggest_spread(jobs, timezones, start, end, limit=SCHEDULE_SPREAD_LIMIT):
+    # Greedy placement: the most frequent jobs are placed first and keep their slot,
+    # each later job moves to the nearest minute where it overlaps least
+    load = Counter()
+    suggestions = []
+    for job in sorted(jobs, key=lambda job: -job["fires"]):
+        minutes = job["minutes"]
+        best = (_overlap(load, minutes, limit), 0, job["expression"], minutes)
+        if best[0] > 0:
+            for shift, candidate in shifted_expressions(job["expression"]):
+                candidate_minutes = [minute_key(t, start.tzinfo) for t in fire_times(candidate, timezones[job['job_id']], start, end)]
+                cost = _overlap(load, candidate_minutes, limit)
+                if cost < best[0]:
+                    best = (cost, shift, candidate, candidate_minutes)
+                    if cost == 0:
+                        break
+        load.update(best[3])
+        if best[1]:
+            suggestions.append({
+                "job_id": job["job_id"],
+                "name": job["name"],
+                "expression": job["expression"],
+                "suggested_expression": best[2],
+                "shift_minutes": best[1],
+            })
+    return suggestions, load
+
+
+def collision_summary(load, limit):
+    busy = sorted(m for m, count in load.items() if count > limit)
+    return {"peak_starts": max(load.values(), default=0), "collision_minutes": len(busy), "first_collisions": busy[:10]}
+
+
+def build_timeline(jobs, start, hours, next_runs=5, limit=SCHEDULE_SPREAD_LIMIT):
+    # jobs: [{"job_id", "name", "trigger"}] from the scheduler
+    end = start + timedelta(hours=hours)
+    entries, load, starts_by_minute = [], Counter(), {}
+    timezones = {}
+    for job in jobs:
+        expression = trigger_expression(job["trigger"])
+        timezones[job["job_id"]] = job["trigger"].timezone
+        fires = fire_times(expression, job["trigger"].timezone, start, end)
+        minutes = [minute_key(t, start.tzinfo) for t in fires]
+        load.update(minutes)
+        for m in minutes:
+            starts_by_minute.setdefault(m, []).append(job["name"])
+        entries.append(dict(job_id=job["job_id"], name=job["name"], expression=expression,
+                            jitter_seconds=job["trigger"].jitter or 0, fires=len(fires), next_runs=[t.isoformat() for t in fires[:next_runs]], minutes=minutes))
+
+    suggestions, load_after = suggest_spread(entries, timezones, start, end, limit)
+    histogram = [{"minute": m, "starts": load[m], "jobs": starts_by_minute[m]} for m in sorted(starts_by_minute)]
+    for entry in entries:
+        del entry["minutes"]
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "hours": hours,
+        "jobs": entries,
+        "histogram": histogram,
+        "collisions": collision_summary(load, limit),
+        "spread": {
+            "limit": limit,
+            "suggestions": suggestions,
+            "collisions_after": collision_summary(load_after, limit),
+        },
+    }
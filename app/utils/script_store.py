@@ -0,0 +1,215 @@
+# app/utils/script_store.py
+#
+# Task scripts, content-addressed. Uploads are streamed to disk in chunks and
+# hashed on the way, so an upload never sits in memory as a whole. Every saved
+# version is kept as an object named by its SHA-256 (shared with the artifact
+# store's layout), and each task keeps a bounded version history.
+# The working copy in scripts/ is only rewritten when its content differs.
+import os
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+from app.utils.artifacts import file_sha256, remove_object
+
+
+SCRIPT_STORE_ROOT = os.getenv("SCRIPT_STORE_ROOT", "script_store")
+SCRIPT_VERSIONS_PER_TASK = int(os.getenv("SCRIPT_VERSIONS_PER_TASK", "20"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "256")) * 1024
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Versions (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    TaskId INTEGER,
+    TaskName TEXT NOT NULL,
+    Path TEXT NOT NULL,
+    Hash TEXT NOT NULL,
+    Size INTEGER NOT NULL,
+    Source TEXT NOT NULL,
+    CreatedAt TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Versions_Task ON Versions(TaskId, Id);
+CREATE INDEX IF NOT EXISTS IX_Versions_Hash ON Versions(Hash);
+"""
+
+
+def same_content(path, content_hash, size):
+    # Size first, so a changed file is usually told apart without hashing it
+    try:
+        if os.path.getsize(path) != size:
+            return False
+    except OSError:
+        return False
+    return file_sha256(path) == content_hash
+
+
+class ScriptStore:
+    def __init__(self, root=SCRIPT_STORE_ROOT):
+        self.root = root
+        self.object_root = os.path.join(root, "objects")
+        os.makedirs(self.object_root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, "versions.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA_SQL)
+
+    def object_path(self, content_hash):
+        return os.path.join(self.object_root, content_hash[:2], content_hash)
+
+    def exclusive(self):
+        # Held across a sequence of calls (store, then write to scripts/ or record) so
+        # prune/forget_task cannot remove an object in between. Re-entrant.
+        return self._lock
+
+    def _commit_object(self, tmp_path, content_hash):
+        target = self.object_path(content_hash)
+        with self._lock:
+            if os.path.exists(target):
+                os.remove(tmp_path)  # same content stored before
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, target)
+        return target
+
+    def put_stream(self, fileobj):
+        # Copies an open binary file into the store chunk by chunk, hashing as it writes
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.object_root, f"upload-{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(UPLOAD_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            content_hash = digest.hexdigest()
+            self._commit_object(tmp_path, content_hash)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash, size
+
+    def put_file(self, path):
+        content_hash = file_sha256(path)
+        target = self.object_path(content_hash)
+        with self._lock:
+            if not os.path.exists(target):
+                # Copied, not hardlinked: objects are read-only and the working copy must stay editable
+                tmp_path = os.path.join(self.object_root, f"file-{uuid.uuid4().hex}.tmp")
+                shutil.copyfile(path, tmp_path)
+                self._commit_object(tmp_path, content_hash)
+            return content_hash, os.path.getsize(target)
+
+    def materialize(self, content_hash, size, dest_path):
+        # Writes an object to dest_path unless it already holds that content; True if written
+        if same_content(dest_path, content_hash, size):
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex[:6]}.tmp"
+        with self._lock:
+            shutil.copyfile(self.object_path(content_hash), tmp_path)
+        os.replace(tmp_path, dest_path)
+        return True
+
+    def sync_file(self, source_path, dest_path):
+        # Replaces shutil.copy2 for task scripts: store the source, copy only on change
+        with self._lock:
+            content_hash, size = self.put_file(source_path)
+            return content_hash, size, self.materialize(content_hash, size, dest_path)
+
+    def record_version(self, task_id, task_name, path, content_hash, size, source):
+        # Adds a history entry unless the task's latest version has the same content
+        with self._lock:
+            row = self._db.execute(
+                "SELECT Hash FROM Versions WHERE TaskId = ? ORDER BY Id DESC LIMIT 1", (task_id,)
+            ).fetchone()
+            if row and row[0] == content_hash:
+                return False
+            self._db.execute(
+                "INSERT INTO Versions (TaskId, TaskName, Path, Hash, Size, Source, CreatedAt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, task_name, path, content_hash, size, source, datetime.utcnow().isoformat())
+            )
+            self.prune(task_id)
+        return True
+
+    def record_path(self, task_id, task_name, path, source):
+        if not os.path.isfile(path):
+            return None
+        with self._lock:
+            content_hash, size = self.put_file(path)
+            self.record_version(task_id, task_name, path, content_hash, size, source)
+        return content_hash
+
+    def restore_version(self, task_id, task_name, version_id, path):
+        # Returns (hash, written) or None. The file on disk goes into the history as
+        # "replaced"; that may prune the restored version's object, so the "restore"
+        # entry is stored from the written working copy, not from the old object.
+        with self._lock:
+            row = self.get_version(task_id, version_id)
+            if row is None:
+                return None
+            content_hash, size = row
+            previous = self.put_file(path) if os.path.isfile(path) else None
+            written = self.materialize(content_hash, size, path)
+            if previous and previous[0] != content_hash:
+                self.record_version(task_id, task_name, path, previous[0], previous[1], "replaced")
+            self.record_path(task_id, task_name, path, "restore")
+        return content_hash, written
+
+    def prune(self, task_id):
+        with self._lock:
+            expired = self._db.execute(
+                "SELECT Id, Hash FROM Versions WHERE TaskId = ? ORDER BY Id DESC LIMIT -1 OFFSET ?",
+                (task_id, SCRIPT_VERSIONS_PER_TASK)
+            ).fetchall()
+            if not expired:
+                return 0
+            self._db.executemany("DELETE FROM Versions WHERE Id = ?", [(version_id,) for version_id, _ in expired])
+            self._remove_unreferenced({content_hash for _, content_hash in expired})
+        return len(expired)
+
+    def forget_task(self, task_id):
+        with self._lock:
+            hashes = {h for (h,) in self._db.execute("SELECT Hash FROM Versions WHERE TaskId = ?", (task_id,))}
+            self._db.execute("DELETE FROM Versions WHERE TaskId = ?", (task_id,))
+            self._remove_unreferenced(hashes)
+
+    def _remove_unreferenced(self, hashes):
+        # Drops objects no version points at any more. An upload never saved to a
+        # task has no version, so its object stays until removed by hand
+        for content_hash in hashes:
+            if self._db.execute("SELECT 1 FROM Versions WHERE Hash = ? LIMIT 1", (content_hash,)).fetchone() is None:
+                remove_object(self.object_path(content_hash))
+
+    def list_versions(self, task_id, limit=50):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT Id, TaskName, Path, Hash, Size, Source, CreatedAt FROM Versions WHERE TaskId = ? ORDER BY Id DESC LIMIT ?",
+                (task_id, limit)
+            ).fetchall()
+        columns = ["version", "task_name", "path", "sha256", "size", "source", "created_at"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_version(self, task_id, version_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT Hash, Size FROM Versions WHERE TaskId = ? AND Id = ?", (task_id, version_id)
+            ).fetchone()
+        return row
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_script_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ScriptStore()
+        return _store
@@ -0,0 +1,145 @@
+# app/utils/settings.py
+#
+# Storage and SQL connection settings as one immutable snapshot. Readers call
+# get_settings() and keep the object they got, so a connection is always built
+# from one consistent set of values even while .env is being rewritten. The
+# snapshot is rebuilt when .env changes on disk (mtime, checked at most every
+# SETTINGS_CHECK_SECONDS) or after write_env_values().
+import os
+import time
+import threading
+from dataclasses import dataclass, replace
+from dotenv import dotenv_values
+
+
+ENV_PATH = ".env"
+SETTINGS_CHECK_SECONDS = float(os.getenv("SETTINGS_CHECK_SECONDS", "2"))
+
+
+def env_flag(value):
+    return str(value or "false").strip().lower() == "true"
+
+
+@dataclass(frozen=True)
+class Settings:
+    use_sql: bool = False
+    use_sqlite: bool = False
+    sql_server: str = ""
+    sql_database: str = ""
+    sql_user: str = ""
+    sql_password: str = ""
+    sql_driver: str = ""
+    sql_trusted: bool = False
+
+    @property
+    def store_kind(self):
+        if self.use_sql:
+            return "sql"
+        return "sqlite" if self.use_sqlite else "json"
+
+    def with_sql(self, config):
+        # Copy with connection parameters from a dashboard form; the snapshot itself is untouched
+        return replace(
+            self,
+            sql_server=config.get("sql_server", ""),
+            sql_database=config.get("sql_database", ""),
+            sql_user=config.get("sql_user", ""),
+            sql_password=config.get("sql_password", ""),
+            sql_driver=config.get("sql_driver", ""),
+            sql_trusted=env_flag(config.get("sql_trusted", False)),
+        )
+
+
+def settings_from_env(env):
+    return Settings(
+        use_sql=env_flag(env.get("USE_SQL")),
+        use_sqlite=env_flag(env.get("USE_SQLITE")),
+        sql_server=env.get("SQL_SERVER") or "",
+        sql_database=env.get("SQL_DATABASE") or "",
+        sql_user=env.get("SQL_USER") or "",
+        sql_password=env.get("SQL_PASSWORD") or "",
+        sql_driver=env.get("SQL_DRIVER") or "",
+        sql_trusted=env_flag(env.get("SQL_TRUSTED")),
+    )
+
+
+_settings = None
+_env_mtime = None
+_next_check = 0.0
+_reload_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+
+def env_mtime(path=ENV_PATH):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload_settings(path=ENV_PATH):
+    global _settings, _env_mtime
+    with _reload_lock:
+        mtime = env_mtime(path)
+        # .env wins over the process environment, as with load_dotenv(override=True)
+        values = dict(os.environ)
+        if mtime is not None:
+            values.update({k: v for k, v in dotenv_values(path).items() if v is not None})
+        snapshot = settings_from_env(values)
+        if _settings is not None and snapshot != _settings:
+            print("[SETTINGS] Reloaded .env")
+        _settings, _env_mtime = snapshot, mtime  # readers switch over in one assignment
+        return snapshot
+
+
+def apply_env_file(path=ENV_PATH):
+    # Module-level os.getenv defaults (log format, limits, cluster) are read on import,
+    # so the app entry point copies .env into the environment before importing routers
+    if env_mtime(path) is None:
+        return 0
+    values = {k: v for k, v in dotenv_values(path).items() if v is not None}
+    os.environ.update(values)  # .env wins, as with load_dotenv(override=True)
+    return len(values)
+
+
+def get_settings():
+    global _next_check
+    now = time.monotonic()
+    if _settings is None:
+        return reload_settings()
+    if now >= _next_check:
+        _next_check = now + SETTINGS_CHECK_SECONDS
+        if env_mtime() != _env_mtime:
+            return reload_settings()
+    return _settings
+
+
+def write_env_values(updates, path=ENV_PATH):
+    # Rewrites only the given keys, via a temp file and os.replace so a reader never
+    # sees a half-written .env; other lines and comments are kept as they are
+    with _write_lock:
+        lines = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+
+        seen = set()
+        new_lines = []
+        for line in lines:
+            key = line.split("=", 1)[0].strip()
+            if "=" in line and key in updates:
+                new_lines.append(f"{key}={updates[key]}\n")
+                seen.add(key)
+            else:
+                new_lines.append(line)
+        if new_lines and not new_lines[-1].endswith("\n"):
+            new_lines[-1] += "\n"
+        new_lines.extend(f"{key}={value}\n" for key, value in updates.items() if key not in seen)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(new_lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return reload_settings(path)
@@ -0,0 +1,279 @@
+# app/utils/sqlite_db.py
+import os
+import json
+import sqlite3
+import threading
+
+
+SQLITE_SCHEMA_VERSION = 2
+
+SQLITE_TASKS_DDL = """
+CREATE TABLE IF NOT EXISTS Tasks (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Name TEXT NOT NULL,
+    Path TEXT NOT NULL,
+    Description TEXT,
+    Tags TEXT,
+    IsEnabled INTEGER NOT NULL DEFAULT 0,
+    UseScheduler INTEGER NOT NULL DEFAULT 0,
+    CronExpr TEXT,
+    CronExprParse TEXT,
+    Apps TEXT,
+    EmailRecipients TEXT,
+    BotName TEXT,
+    PassBotParam INTEGER NOT NULL DEFAULT 0,
+    PassPushParam INTEGER NOT NULL DEFAULT 0,
+    PushText TEXT,
+    LastUpTime INTEGER NULL,
+    LastLaunchCount INTEGER NULL,
+    ScriptJson TEXT,
+    LastUpdated TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS IX_Tasks_Name ON Tasks (Name);
+CREATE INDEX IF NOT EXISTS IX_Tasks_IsEnabled ON Tasks (IsEnabled);
+CREATE TABLE IF NOT EXISTS TaskTags (
+    TaskId INTEGER NOT NULL REFERENCES Tasks (Id) ON DELETE CASCADE,
+    Tag TEXT NOT NULL,
+    PRIMARY KEY (TaskId, Tag)
+);
+CREATE INDEX IF NOT EXISTS IX_TaskTags_Tag ON TaskTags (Tag);
+CREATE TABLE IF NOT EXISTS RuntimeState (
+    Key TEXT PRIMARY KEY,
+    Value TEXT NOT NULL,
+    LastUpdated TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Statements are kept as module constants: sqlite3 caches compiled statements
+# per connection keyed by SQL text, so every call reuses the prepared statement.
+INSERT_TASK_SQL = """
+    INSERT INTO Tasks (Name, Path, Description, Tags, IsEnabled, UseScheduler, CronExpr, CronExprParse, Apps, EmailRecipients, BotName, PassBotParam, PassPushParam, PushText, ScriptJson)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_TASK_SQL = """
+    INSERT INTO Tasks (Name, Path, Description, Tags, IsEnabled, UseScheduler, CronExpr, CronExprParse, Apps, EmailRecipients, BotName, PassBotParam, PassPushParam, PushText, ScriptJson, Id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (Id) DO UPDATE SET
+        Name = excluded.Name, Path = excluded.Path, Description = excluded.Description, Tags = excluded.Tags,
+        IsEnabled = excluded.IsEnabled, UseScheduler = excluded.UseScheduler, CronExpr = excluded.CronExpr,
+        CronExprParse = excluded.CronExprParse, Apps = excluded.Apps, EmailRecipients = excluded.EmailRecipients,
+        BotName = excluded.BotName, PassBotParam = excluded.PassBotParam, PassPushParam = excluded.PassPushParam,
+        PushText = excluded.PushText, ScriptJson = excluded.ScriptJson, LastUpdated = CURRENT_TIMESTAMP
+"""
+
+SELECT_TASKS_SQL = "SELECT Id, ScriptJson FROM Tasks ORDER BY Id"
+DELETE_TAGS_SQL = "DELETE FROM TaskTags WHERE TaskId = ?"
+INSERT_TAG_SQL = "INSERT OR IGNORE INTO TaskTags (TaskId, Tag) VALUES (?, ?)"
+UPDATE_STATE_SQL = """
+    UPDATE Tasks
+    SET IsEnabled = ?,
+        LastUpTime = ?,
+        LastLaunchCount = ?,
+        LastUpdated = CURRENT_TIMESTAMP
+    WHERE Id = ?
+"""
+
+_connection = None
+_connection_path = None
+_lock = threading.RLock()
+
+
+def get_sqlite_path():
+    return os.getenv("SQLITE_PATH", "pipecrab.db")
+
+
+def get_sqlite_connection():
+    # One shared connection guarded by a lock: callers come from asyncio.to_thread
+    # workers, and WAL mode keeps readers in other processes unblocked.
+    global _connection, _connection_path
+    path = get_sqlite_path()
+
+    with _lock:
+        if _connection is not None and _connection_path == path:
+            return _connection
+        if _connection is not None:
+            _connection.close()
+
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SQLITE_SCHEMA_VERSION:
+            conn.executescript(SQLITE_TASKS_DDL)
+            conn.execute(f"PRAGMA user_version={SQLITE_SCHEMA_VERSION}")
+            conn.commit()
+            print(f"[SQLITE] Schema ready at {path}")
+
+        _connection = conn
+        _connection_path = path
+
+        if version == 0:
+            migrate_json_to_sqlite()
+
+        return _connection
+
+
+def _task_params(script):
+    apps = script.get("apps", [])
+    script_json_str = json.dumps({k: v for k, v in script.items() if k != "script_json"})
+    return (
+        script["name"],
+        script["path"],
+        script.get("description", ""),
+        script.get("tags", ""),
+        int(bool(script.get("enabled", False))),
+        int("scheduler" in apps),
+        script.get("schedule_expression", "* * * * *"),
+        script.get("cron_expr_parse", ""),
+        json.dumps(apps),
+        script.get("email_recipients", ""),
+        script.get("bot_name", "DefaultBot"),
+        int(bool(script.get("pass_bot_param", True))),
+        int(bool(script.get("pass_push_param", False))),
+        script.get("push_text", ""),
+        script_json_str,
+    )
+
+
+def _write_tags(cursor, task_id, tags):
+    cursor.execute(DELETE_TAGS_SQL, (task_id,))
+    cursor.executemany(INSERT_TAG_SQL, [(task_id, tag) for tag in set((tags or "").split())])
+
+
+def _write_script(cursor, script):
+    if script.get("id") is None:
+        cursor.execute(INSERT_TASK_SQL, _task_params(script))
+        script["id"] = cursor.lastrowid
+        # ScriptJson has to carry the assigned id as well
+        cursor.execute("UPDATE Tasks SET ScriptJson = ? WHERE Id = ?", (
+            json.dumps({k: v for k, v in script.items() if k != "script_json"}),
+            script["id"]
+        ))
+    else:
+        cursor.execute(UPSERT_TASK_SQL, _task_params(script) + (script["id"],))
+    _write_tags(cursor, script["id"], script.get("tags", ""))
+    return script["id"]
+
+
+def load_sqlite_scripts():
+    conn = get_sqlite_connection()
+    with _lock:
+        rows = conn.execute(SELECT_TASKS_SQL).fetchall()
+
+    scripts = []
+    for row in rows:
+        try:
+            script = json.loads(row["ScriptJson"] or "{}")
+        except Exception as e:
+            print(f"[SQLITE] [FAIL] Bad ScriptJson for task {row['Id']}: {e}")
+            continue
+        script["id"] = row["Id"]
+        scripts.append(script)
+    return scripts
+
+
+def save_sqlite_scripts(scripts, original_id=None, prune=True):
+    conn = get_sqlite_connection()
+    ids = []
+
+    if original_id is not None:
+        scripts = [s for s in scripts if s.get("id") in (original_id, None)][:1]
+
+    with _lock:
+        try:
+            cursor = conn.cursor()
+            for script in scripts:
+                ids.append(_write_script(cursor, script))
+
+            # Full saves keep the scripts.json contract: the list replaces the table
+            if original_id is None and prune and ids:
+                placeholders = ",".join("?" for _ in ids)
+                cursor.execute(f"DELETE FROM Tasks WHERE Id NOT IN ({placeholders})", ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    if not ids:
+        return None
+    return ids if len(ids) > 1 else ids[0]
+
+
+def insert_sqlite_script(script):
+    conn = get_sqlite_connection()
+    with _lock:
+        try:
+            new_id = _write_script(conn.cursor(), script)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return new_id
+
+
+def update_sqlite_script_state(script_id, enabled, last_uptime=None, last_launch_count=None):
+    conn = get_sqlite_connection()
+    with _lock:
+        conn.execute(UPDATE_STATE_SQL, (int(bool(enabled)), last_uptime, last_launch_count, script_id))
+        conn.commit()
+
+
+def delete_sqlite_script(script_id):
+    conn = get_sqlite_connection()
+    with _lock:
+        row = conn.execute("SELECT Name FROM Tasks WHERE Id = ?", (script_id,)).fetchone()
+        conn.execute("DELETE FROM Tasks WHERE Id = ?", (script_id,))
+        conn.commit()
+    return row["Name"] if row else None
+
+
+def migrate_json_to_sqlite(json_path="scripts.json"):
+    if not os.path.exists(json_path):
+        return 0
+
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            scripts = json.load(f)
+    except Exception as e:
+        print(f"[SQLITE] [FAIL] Could not read {json_path} for migration: {e}")
+        return 0
+
+    if not isinstance(scripts, list):
+        return 0
+
+    conn = get_sqlite_connection()
+    with _lock:
+        try:
+            cursor = conn.cursor()
+            for script in scripts:
+                _write_script(cursor, {k: v for k, v in script.items() if k != "script_json"})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    print(f"[SQLITE] Migrated {len(scripts)} task(s) from {json_path}")
+    return len(scripts)
+
+
+def save_sqlite_runtime_state(state):
+    conn = get_sqlite_connection()
+    with _lock:
+        conn.execute(
+            "INSERT INTO RuntimeState (Key, Value) VALUES ('runtime', ?) "
+            "ON CONFLICT (Key) DO UPDATE SET Value = excluded.Value, LastUpdated = CURRENT_TIMESTAMP",
+            (json.dumps(state),)
+        )
+        conn.commit()
+
+
+def load_sqlite_runtime_state():
+    conn = get_sqlite_connection()
+    with _lock:
+        row = conn.execute("SELECT Value FROM RuntimeState WHERE Key = 'runtime'").fetchone()
+    return json.loads(row["Value"]) if row else {}
@@ -0,0 +1,273 @@
+# app/utils/store.py
+import os
+import json
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.settings import get_settings
+from app.utils.db import load_sql_scripts, save_sql_scripts, list_sql_task_rows, update_sql_script_state, delete_sql_script, save_sql_uptimes, load_sql_uptimes
+from app.utils.sqlite_db import load_sqlite_scripts, save_sqlite_scripts, insert_sqlite_script, update_sqlite_script_state, delete_sqlite_script, save_sqlite_runtime_state, load_sqlite_runtime_state
+
+
+# Every storage call runs on this bounded pool, so pyodbc/sqlite/file I/O never
+# blocks the event loop and a slow SQL Server cannot exhaust the default executor.
+STORE_MAX_WORKERS = int(os.getenv("STORE_MAX_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=STORE_MAX_WORKERS, thread_name_prefix="pipecrab-store")
+
+# Uptime and other in-memory runtime state survives restarts here (JSON store)
+RUNTIME_STATE_PATH = os.getenv("RUNTIME_STATE_PATH", "runtime_state.json")
+
+
+async def run_io(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class TaskStore:
+    kind = "base"
+
+    # --- blocking implementations, overridden per backend ---
+    def load_all_sync(self):
+        raise NotImplementedError
+
+    def list_all_sync(self):
+        return self.load_all_sync()
+
+    def save_sync(self, scripts, original_id=None):
+        raise NotImplementedError
+
+    def save_many_sync(self, scripts):
+        # Updates several existing tasks in one write; tasks not listed are left alone
+        raise NotImplementedError
+
+    def insert_sync(self, script):
+        raise NotImplementedError
+
+    def delete_sync(self, script_id):
+        raise NotImplementedError
+
+    def update_state_sync(self, script_id, enabled, last_uptime=None, last_launch_count=None):
+        pass
+
+    def save_runtime_state_sync(self, state):
+        tmp_path = f"{RUNTIME_STATE_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, RUNTIME_STATE_PATH)
+
+    def load_runtime_state_sync(self):
+        if not os.path.exists(RUNTIME_STATE_PATH):
+            return {}
+        with open(RUNTIME_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # --- non-blocking API used by the handlers ---
+    async def load_all(self):
+        return await run_io(self.load_all_sync)
+
+    async def list_all(self):
+        return await run_io(self.list_all_sync)
+
+    async def save(self, scripts, original_id=None):
+        return await run_io(self.save_sync, scripts, original_id)
+
+    async def save_many(self, scripts):
+        return await run_io(self.save_many_sync, scripts)
+
+    async def insert(self, script):
+        return await run_io(self.insert_sync, script)
+
+    async def delete(self, script_id):
+        return await run_io(self.delete_sync, script_id)
+
+    async def update_state(self, script_id, enabled, last_uptime=None, last_launch_count=None):
+        return await run_io(self.update_state_sync, script_id, enabled, last_uptime, last_launch_count)
+
+    async def save_runtime_state(self, state):
+        return await run_io(self.save_runtime_state_sync, state)
+
+    async def load_runtime_state(self):
+        return await run_io(self.load_runtime_state_sync)
+
+
+class JsonTaskStore(TaskStore):
+    kind = "json"
+
+    def __init__(self, path="scripts.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, scripts):
+        # Write to a temp file and swap it in, so readers never see a half-written list
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(scripts, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def load_all_sync(self):
+        try:
+            with self._lock:
+                scripts = self._read()
+            if not isinstance(scripts, list):
+                print("[LOAD] scripts.json is not a list")
+                return []
+            if len(scripts) <= 1:
+                print(f"[LOAD WARNING] scripts.json contains {len(scripts)} task(s). Watch for data loss.")
+            return scripts
+        except Exception as e:
+            print(f"[LOAD ERROR] Failed to load scripts.json: {e}")
+            return []
+
+    def save_sync(self, scripts, original_id=None):
+        if not isinstance(scripts, list) or not scripts:
+            print("[WARNING] Skipping save_scripts: scripts is empty or not a list")
+            return
+
+        with self._lock:
+            # Default: full overwrite
+            if original_id is None:
+                self._write(scripts)
+                return
+
+            # Updating one script
+            updated = []
+            found = False
+            for s in self._read():
+                if s.get("id") == original_id:
+                    updated.append(scripts[0])  # replace
+                    found = True
+                else:
+                    updated.append(s)
+
+            if not found:
+                updated.extend(scripts)
+
+            self._write(updated)
+
+    def save_many_sync(self, scripts):
+        by_id = {s["id"]: s for s in scripts}
+        with self._lock:
+            self._write([by_id.get(s.get("id"), s) for s in self._read()])
+
+    def insert_sync(self, script):
+        with self._lock:
+            existing = self._read()
+            script["id"] = max((s.get("id") or 0 for s in existing), default=0) + 1
+            script["script_json"] = json.dumps({k: v for k, v in script.items() if k != "script_json"})
+            existing.append(script)
+            self._write(existing)
+        return script["id"]
+
+    def delete_sync(self, script_id):
+        with self._lock:
+            existing = self._read()
+            script_name = next((s.get("name") for s in existing if s.get("id") == script_id), None)
+            self._write([s for s in existing if s.get("id") != script_id])
+        return script_name
+
+
+class SqliteTaskStore(TaskStore):
+    kind = "sqlite"
+
+    def load_all_sync(self):
+        try:
+            return load_sqlite_scripts()
+        except Exception as e:
+            print(f"[LOAD ERROR] Failed to load scripts from SQLite: {e}")
+            return []
+
+    def save_sync(self, scripts, original_id=None):
+        return save_sqlite_scripts(scripts, original_id)
+
+    def save_many_sync(self, scripts):
+        return save_sqlite_scripts(scripts, prune=False)
+
+    def insert_sync(self, script):
+        return insert_sqlite_script(script)
+
+    def delete_sync(self, script_id):
+        return delete_sqlite_script(script_id)
+
+    def update_state_sync(self, script_id, enabled, last_uptime=None, last_launch_count=None):
+        update_sqlite_script_state(script_id, enabled, last_uptime, last_launch_count)
+
+    def save_runtime_state_sync(self, state):
+        save_sqlite_runtime_state(state)
+
+    def load_runtime_state_sync(self):
+        return load_sqlite_runtime_state()
+
+
+class SqlServerTaskStore(TaskStore):
+    kind = "sql"
+
+    def load_all_sync(self):
+        return load_sql_scripts()
+
+    def list_all_sync(self):
+        return list_sql_task_rows()
+
+    def save_sync(self, scripts, original_id=None):
+        return save_sql_scripts(scripts, original_id)
+
+    def save_many_sync(self, scripts):
+        # Without original_id every row is updated in place under one commit
+        return save_sql_scripts(scripts)
+
+    def insert_sync(self, script):
+        new_id = save_sql_scripts([script])
+        script["id"] = new_id
+        # Second pass stores ScriptJson with the identity value assigned by SQL Server
+        script["script_json"] = json.dumps({k: v for k, v in script.items() if k != "script_json"})
+        save_sql_scripts([script], original_id=new_id)
+        return new_id
+
+    def delete_sync(self, script_id):
+        return delete_sql_script(script_id)
+
+    def update_state_sync(self, script_id, enabled, last_uptime=None, last_launch_count=None):
+        update_sql_script_state(script_id, enabled, last_uptime, last_launch_count)
+
+    def save_runtime_state_sync(self, state):
+        # Uptime goes to the existing LastUpTime column instead of a side file
+        save_sql_uptimes(state.get("stopped_uptime_seconds", {}))
+
+    def load_runtime_state_sync(self):
+        return {"stopped_uptime_seconds": load_sql_uptimes()}
+
+
+_stores = {}
+_store_override = None
+
+
+def get_store_kind():
+    return get_settings().store_kind
+
+
+def get_task_store():
+    if _store_override is not None:
+        return _store_override
+
+    kind = get_store_kind()
+    if kind not in _stores:
+        if kind == "sql":
+            _stores[kind] = SqlServerTaskStore()
+        elif kind == "sqlite":
+            _stores[kind] = SqliteTaskStore()
+        else:
+            _stores[kind] = JsonTaskStore()
+    return _stores[kind]
+
+
+def set_task_store(store):
+    # Pins a specific store instance (benchmarks, embedding); None restores env selection
+    global _store_override
+    _store_override = store
@@ -0,0 +1,469 @@
+# app/utils/structured_log.py
+#
+# Optional structured task logs (LOG_FORMAT=jsonl). Every line is stored as a
+# compact JSON record {"t": epoch, "r": run id, "s": stream, "l": level, "m": message}
+# in per-task append-only segment files:
+#
+#   logs/structured/<task>/000001.jsonl, 000002.jsonl, ...
+#
+# A sqlite index next to them records where each run starts, every warning/error
+# record, session starts ("Task started.") and a sparse time index, so "errors in
+# the last run" or "lines since 10:00" seek straight to the records instead of
+# scanning the log. The level is classified once, when the line is written.
+#
+# Children cannot write records themselves: their stdout goes to a per-run spool
+# file that a background thread turns into records. The spool survives dashboard
+# restarts, so adopted processes are picked up where ingestion stopped.
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+STRUCTURED_LOG_DIR = os.getenv("STRUCTURED_LOG_DIR", os.path.join("logs", "structured"))
+LOG_SEGMENT_BYTES = int(os.getenv("LOG_SEGMENT_KB", "1024")) * 1024
+LOG_SEGMENTS_PER_TASK = int(os.getenv("LOG_SEGMENTS_PER_TASK", "4"))
+LOG_TIME_INDEX_EVERY = int(os.getenv("LOG_TIME_INDEX_EVERY", "200"))
+LOG_INGEST_INTERVAL = float(os.getenv("LOG_INGEST_INTERVAL", "0.5"))
+
+TIMESTAMP_PREFIX = re.compile(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\] ?")
+ERROR_PATTERN = re.compile(r"(error|exception|traceback|failed|critical|fatal)", re.IGNORECASE)
+WARNING_PATTERN = re.compile(r"warning", re.IGNORECASE)
+LEVELS = {"error": ("error",), "warning": ("warning", "error")}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Segments (
+    Task TEXT NOT NULL,
+    Seq INTEGER NOT NULL,
+    FirstTs REAL NOT NULL,
+    PRIMARY KEY (Task, Seq)
+);
+CREATE TABLE IF NOT EXISTS Runs (
+    Task TEXT NOT NULL,
+    RunId TEXT NOT NULL,
+    RunTrigger TEXT,
+    StartedAt REAL NOT NULL,
+    EndedAt REAL,
+    ExitCode INTEGER,
+    StartSeq INTEGER NOT NULL,
+    StartOffset INTEGER NOT NULL,
+    Lines INTEGER NOT NULL DEFAULT 0,
+    Warnings INTEGER NOT NULL DEFAULT 0,
+    Errors INTEGER NOT NULL DEFAULT 0,
+    SpoolOffset INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (Task, RunId)
+);
+CREATE INDEX IF NOT EXISTS IX_Runs_Started ON Runs(Task, StartedAt);
+CREATE TABLE IF NOT EXISTS Marks (
+    Task TEXT NOT NULL,
+    Ts REAL NOT NULL,
+    Level TEXT NOT NULL,
+    RunId TEXT,
+    Seq INTEGER NOT NULL,
+    Offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Marks_Ts ON Marks(Task, Ts);
+CREATE INDEX IF NOT EXISTS IX_Marks_Run ON Marks(Task, RunId);
+CREATE TABLE IF NOT EXISTS Sessions (
+    Task TEXT NOT NULL,
+    Ts REAL NOT NULL,
+    Seq INTEGER NOT NULL,
+    Offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Sessions_Ts ON Sessions(Task, Ts);
+CREATE TABLE IF NOT EXISTS TimeIndex (
+    Task TEXT NOT NULL,
+    Ts REAL NOT NULL,
+    Seq INTEGER NOT NULL,
+    Offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_TimeIndex_Ts ON TimeIndex(Task, Ts);
+"""
+
+
+def structured_logs_enabled():
+    return LOG_FORMAT == "jsonl"
+
+
+def classify(message, stream):
+    if stream == "mgr":
+        # Manager lines are tagged by the dashboard itself
+        if "[ERROR]" in message:
+            return "error"
+        return "warning" if "WARNING" in message else "info"
+    if ERROR_PATTERN.search(message):
+        return "error"
+    return "warning" if WARNING_PATTERN.search(message) else "info"
+
+
+def render(record):
+    # Text form of a record, as it looks in a LOG_FORMAT=text log
+    if record["s"] == "mgr":
+        return f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['t']))}] {record['m']}"
+    return record["m"]
+
+
+class StructuredLog:
+    def __init__(self, root=STRUCTURED_LOG_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA_SQL)
+        self._writers = {}       # task -> open segment {"seq", "file", "size", "count"}
+        self._current_run = {}   # task -> run id that manager lines are attributed to
+        self._run_counts = {}    # (task, run id) -> [lines, warnings, errors] not yet in Runs
+        self._follows = {}       # (task, run id) -> spool being ingested
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # --- layout ---
+
+    def task_dir(self, task):
+        return os.path.join(self.root, task)
+
+    def segment_path(self, task, seq):
+        return os.path.join(self.task_dir(task), f"{seq:06d}.jsonl")
+
+    def spool_path(self, task, run_id):
+        return os.path.join(self.task_dir(task), f"spool-{run_id}.out")
+
+    def _segments(self, task):
+        return [row[0] for row in self._db.execute("SELECT Seq FROM Segments WHERE Task = ? ORDER BY Seq", (task,))]
+
+    def _writer(self, task):
+        writer = self._writers.get(task)
+        if writer is not None and writer["size"] < LOG_SEGMENT_BYTES:
+            return writer
+        if writer is not None:
+            writer["file"].close()
+            seq = writer["seq"] + 1
+        else:
+            segments = self._segments(task)
+            seq = segments[-1] if segments else 1
+            path = self.segment_path(task, seq)
+            if segments and os.path.exists(path) and os.path.getsize(path) >= LOG_SEGMENT_BYTES:
+                seq += 1
+
+        os.makedirs(self.task_dir(task), exist_ok=True)
+        handle = open(self.segment_path(task, seq), "ab")
+        self._db.execute("INSERT OR IGNORE INTO Segments (Task, Seq, FirstTs) VALUES (?, ?, ?)", (task, seq, time.time()))
+        writer = {"seq": seq, "file": handle, "size": handle.tell(), "count": 0}
+        self._writers[task] = writer
+        self._drop_old_segments(task)
+        return writer
+
+    def _drop_old_segments(self, task):
+        segments = self._segments(task)
+        for seq in segments[:max(0, len(segments) - LOG_SEGMENTS_PER_TASK)]:
+            try:
+                os.remove(self.segment_path(task, seq))
+            except OSError:
+                pass
+            for table in ("Segments", "Marks", "Sessions", "TimeIndex"):
+                self._db.execute(f"DELETE FROM {table} WHERE Task = ? AND Seq = ?", (task, seq))
+
+    # --- writing ---
+
+    def _append(self, task, message, stream, run_id, ts=None):
+        record = {"t": round(ts or time.time(), 3), "r": run_id, "s": stream, "l": classify(message, stream), "m": message}
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        writer = self._writer(task)
+        offset = writer["size"]
+        writer["file"].write(line)
+        writer["size"] += len(line)
+        writer["count"] += 1
+
+        if (writer["count"] - 1) % LOG_TIME_INDEX_EVERY == 0:
+            self._db.execute("INSERT INTO TimeIndex (Task, Ts, Seq, Offset) VALUES (?, ?, ?, ?)", (task, record["t"], writer["seq"], offset))
+        if record["l"] != "info":
+            self._db.execute("INSERT INTO Marks (Task, Ts, Level, RunId, Seq, Offset) VALUES (?, ?, ?, ?, ?, ?)",
+                             (task, record["t"], record["l"], run_id, writer["seq"], offset))
+        if stream == "mgr" and message == "Task started.":
+            self._db.execute("INSERT INTO Sessions (Task, Ts, Seq, Offset) VALUES (?, ?, ?, ?)", (task, record["t"], writer["seq"], offset))
+        if run_id:
+            counts = self._run_counts.setdefault((task, run_id), [0, 0, 0])
+            counts[0] += 1
+            counts[1] += record["l"] == "warning"
+            counts[2] += record["l"] == "error"
+
+    def write_text(self, task, text):
+        # Text as passed to append_to_limited_log: timestamped manager lines, or raw
+        # output relayed by a remote agent
+        with self._lock:
+            run_id = self._current_run.get(task)
+            for line in text.splitlines():
+                match = TIMESTAMP_PREFIX.match(line)
+                if match:
+                    self._append(task, line[match.end():], "mgr", run_id)
+                elif line.strip():
+                    self._append(task, line, "out", run_id)
+            self._flush_files()
+
+    def begin_run(self, task, run_id, trigger=None):
+        with self._lock:
+            writer = self._writer(task)
+            self._db.execute(
+                "INSERT OR REPLACE INTO Runs (Task, RunId, RunTrigger, StartedAt, StartSeq, StartOffset) VALUES (?, ?, ?, ?, ?, ?)",
+                (task, run_id, trigger, time.time(), writer["seq"], writer["size"])
+            )
+            self._current_run[task] = run_id
+
+    def end_run(self, task, run_id, exit_code=None):
+        with self._lock:
+            self._flush_counts()
+            self._db.execute("UPDATE Runs SET EndedAt = ?, ExitCode = ? WHERE Task = ? AND RunId = ?",
+                             (time.time(), exit_code, task, run_id))
+            if self._current_run.get(task) == run_id:
+                del self._current_run[task]
+
+    def open_spool(self, task, run_id):
+        os.makedirs(self.task_dir(task), exist_ok=True)
+        return open(self.spool_path(task, run_id), "ab")
+
+    def follow(self, task, run_id, process):
+        # Ingest the run's spool until the process has exited and the spool is drained
+        with self._lock:
+            row = self._db.execute("SELECT SpoolOffset FROM Runs WHERE Task = ? AND RunId = ?", (task, run_id)).fetchone()
+            self._follows[(task, run_id)] = {"process": process, "offset": row[0] if row else 0, "partial": b""}
+            self._current_run.setdefault(task, run_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._ingest_loop, name="structured-log-ingest", daemon=True)
+                self._thread.start()
+
+    def _ingest_loop(self):
+        while not self._stopped.wait(LOG_INGEST_INTERVAL):
+            try:
+                self.ingest()
+            except Exception as e:
+                print(f"[LOGGING] Structured log ingest failed: {e}")
+
+    def ingest(self):
+        with self._lock:
+            for (task, run_id), follow in list(self._follows.items()):
+                exited = follow["process"].poll() is not None
+                path = self.spool_path(task, run_id)
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(follow["offset"])
+                        data = f.read()
+                except FileNotFoundError:
+                    data = b""
+                follow["offset"] += len(data)
+
+                lines = (follow["partial"] + data).split(b"\n")
+                follow["partial"] = lines.pop()
+                if exited and follow["partial"]:
+                    lines.append(follow["partial"])
+                    follow["partial"] = b""
+                for line in lines:
+                    text = line.decode("utf-8", errors="replace").rstrip("\r")
+                    if text:
+                        self._append(task, text, "out", run_id)
+
+                # Only complete lines count as ingested, so a restart re-reads a partial one
+                self._db.execute("UPDATE Runs SET SpoolOffset = ? WHERE Task = ? AND RunId = ?",
+                                 (follow["offset"] - len(follow["partial"]), task, run_id))
+                if exited and not data:
+                    del self._follows[(task, run_id)]
+                    exit_code = None if getattr(follow["process"], "adopted", False) else follow["process"].returncode
+                    self.end_run(task, run_id, exit_code)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._flush_files()
+            self._flush_counts()
+
+    def _flush_files(self):
+        for writer in self._writers.values():
+            writer["file"].flush()
+
+    def _flush_counts(self):
+        for (task, run_id), (lines, warnings, errors) in self._run_counts.items():
+            self._db.execute(
+                "UPDATE Runs SET Lines = Lines + ?, Warnings = Warnings + ?, Errors = Errors + ? WHERE Task = ? AND RunId = ?",
+                (lines, warnings, errors, task, run_id)
+            )
+        self._run_counts.clear()
+
+    # --- reading ---
+
+    def _read_at(self, task, seq, offset):
+        try:
+            with open(self.segment_path(task, seq), "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def _scan_from(self, task, seq, offset):
+        for current in self._segments(task):
+            if current < seq:
+                continue
+            try:
+                with open(self.segment_path(task, current), "rb") as f:
+                    f.seek(offset if current == seq else 0)
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+
+    def _tail(self, task, limit):
+        records = []
+        for seq in reversed(self._segments(task)):
+            try:
+                with open(self.segment_path(task, seq), "rb") as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                continue
+            records[:0] = [json.loads(line) for line in lines[-(limit - len(records)):] if line]
+            if len(records) >= limit:
+                break
+        return records
+
+    def resolve_run(self, task, run):
+        if run != "last":
+            return run
+        row = self._db.execute("SELECT RunId FROM Runs WHERE Task = ? ORDER BY StartedAt DESC LIMIT 1", (task,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, task, run=None, level=None, since=None, until=None, limit=200):
+        with self._lock:
+            self._flush_files()
+            run_id = self.resolve_run(task, run) if run else None
+            if run and run_id is None:
+                return {"task": task, "run_id": None, "records": []}
+            until = until or float("inf")
+
+            if level:
+                # Warnings/errors are indexed: read only the matching records
+                sql = f"SELECT Seq, Offset FROM Marks WHERE Task = ? AND Level IN ({','.join('?' * len(LEVELS[level]))})"
+                params = [task, *LEVELS[level]]
+                if run_id:
+                    sql += " AND RunId = ?"
+                    params.append(run_id)
+                if since:
+                    sql += " AND Ts >= ?"
+                    params.append(since)
+                sql += " AND Ts <= ? ORDER BY Ts DESC LIMIT ?"
+                params += [until, limit]
+                rows = self._db.execute(sql, params).fetchall()
+                records = [r for r in (self._read_at(task, seq, offset) for seq, offset in reversed(rows)) if r]
+            elif run_id:
+                row = self._db.execute("SELECT StartSeq, StartOffset, EndedAt FROM Runs WHERE Task = ? AND RunId = ?", (task, run_id)).fetchone()
+                if row is None:
+                    return {"task": task, "run_id": run_id, "records": []}
+                seq, offset, ended = row
+                segments = self._segments(task)
+                if segments and seq < segments[0]:
+                    seq, offset = segments[0], 0  # start of the run already rotated out
+                records = []
+                for record in self._scan_from(task, seq, offset):
+                    if ended and record["t"] > ended + LOG_INGEST_INTERVAL * 4:
+                        break
+                    if record["r"] == run_id and (since is None or record["t"] >= since) and record["t"] <= until:
+                        records.append(record)
+                        if len(records) >= limit:
+                            break
+            elif since:
+                row = self._db.execute(
+                    "SELECT Seq, Offset FROM TimeIndex WHERE Task = ? AND Ts <= ? ORDER BY Ts DESC LIMIT 1", (task, since)
+                ).fetchone()
+                segments = self._segments(task)
+                seq, offset = row if row else (segments[0] if segments else 0, 0)
+                records = []
+                for record in self._scan_from(task, seq, offset):
+                    if record["t"] > until:
+                        break
+                    if record["t"] >= since:
+                        records.append(record)
+                        if len(records) >= limit:
+                            break
+            else:
+                records = [r for r in self._tail(task, limit) if r["t"] <= until]
+            return {"task": task, "run_id": run_id, "records": records}
+
+    def run_summary(self, task, run_id):
+        with self._lock:
+            self._flush_counts()
+            row = self._db.execute(
+                "SELECT RunId, RunTrigger, StartedAt, EndedAt, ExitCode, Lines, Warnings, Errors FROM Runs WHERE Task = ? AND RunId = ?",
+                (task, run_id)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("run_id", "trigger", "started_at", "ended_at", "exit_code", "lines", "warnings", "errors")
+        return dict(zip(keys, row))
+
+    def stats(self, task, cron_only=False):
+        # Same numbers as the text-mode log scan: runs and problems since the last "Task started."
+        with self._lock:
+            row = self._db.execute("SELECT MAX(Ts) FROM Sessions WHERE Task = ?", (task,)).fetchone()
+            session_start = row[0]
+            since = session_start or 0
+            trigger = " AND RunTrigger = 'cron'" if cron_only else ""
+            run_count = self._db.execute(f"SELECT COUNT(*) FROM Runs WHERE Task = ? AND StartedAt >= ?{trigger}", (task, since)).fetchone()[0]
+            has_errors = session_start is not None and self._db.execute(
+                "SELECT 1 FROM Marks WHERE Task = ? AND Ts >= ? LIMIT 1", (task, session_start)
+            ).fetchone() is not None
+        return run_count, has_errors
+
+    def text(self, task, limit):
+        with self._lock:
+            self._flush_files()
+            return "".join(render(record) + "\n" for record in self._tail(task, limit))
+
+    def exists(self, task):
+        with self._lock:
+            return bool(self._segments(task))
+
+    # --- maintenance ---
+
+    def clear(self, task):
+        # Drops the records and the index; spools of runs still being ingested stay
+        with self._lock:
+            writer = self._writers.pop(task, None)
+            if writer is not None:
+                writer["file"].close()
+            for seq in self._segments(task):
+                try:
+                    os.remove(self.segment_path(task, seq))
+                except OSError:
+                    pass
+            for table in ("Segments", "Marks", "Sessions", "TimeIndex"):
+                self._db.execute(f"DELETE FROM {table} WHERE Task = ?", (task,))
+            active = [run_id for t, run_id in self._follows if t == task]
+            self._db.execute(
+                f"DELETE FROM Runs WHERE Task = ? AND RunId NOT IN ({','.join('?' * len(active))})", (task, *active)
+            )
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LOG_INGEST_INTERVAL * 4)
+        with self._lock:
+            self.ingest()
+            for writer in self._writers.values():
+                writer["file"].close()
+            self._writers.clear()
+
+
+_structured_log = None
+_structured_log_lock = threading.Lock()
+
+
+def get_structured_log():
+    global _structured_log
+    with _structured_log_lock:
+        if _structured_log is None:
+            _structured_log = StructuredLog()
+        return _structured_log
@@ -0,0 +1,76 @@
+# app/utils/task_state.py
+#
+# Per-task lifecycle: stopped -> starting -> running -> stopping -> stopped.
+# Start and stop of the same task run one at a time under a per-task asyncio
+# lock, so a start racing a stop can no longer leave an untracked process behind.
+# A start waiting for an operation in flight shows as "queued". Everything here
+# belongs to the event loop thread; APScheduler threads hand their updates over
+# with loop.call_soon_threadsafe instead of touching the state directly.
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+
+
+TRANSITIONS = {
+    "stopped": {"starting"},
+    "starting": {"running", "stopped"},
+    "running": {"stopping"},
+    "stopping": {"stopped"},
+}
+
+
+class InvalidTransition(RuntimeError):
+    pass
+
+
+class TaskStates:
+    def __init__(self):
+        self._states = {}   # task id -> state; stopped tasks are not stored
+        self._locks = {}
+        self._queued = Counter()
+
+    def state(self, task_id):
+        state = self._states.get(task_id, "stopped")
+        if self._queued[task_id] and state in ("stopping", "stopped"):
+            return "queued"
+        return state
+
+    def transition(self, task_id, new_state):
+        current = self._states.get(task_id, "stopped")
+        if new_state not in TRANSITIONS[current]:
+            raise InvalidTransition(f"Task {task_id} cannot go from {current} to {new_state}")
+        self.force(task_id, new_state)
+
+    def force(self, task_id, state):
+        # For adoption and shutdown, where the process state is already known
+        if state == "stopped":
+            self._states.pop(task_id, None)
+        else:
+            self._states[task_id] = state
+
+    @asynccontextmanager
+    async def operation(self, task_id, kind):
+        lock = self._locks.setdefault(task_id, asyncio.Lock())
+        waiting = kind == "start" and lock.locked()
+        if waiting:
+            self._queued[task_id] += 1
+        try:
+            await lock.acquire()
+        finally:
+            if waiting:
+                self._queued[task_id] -= 1
+                if not self._queued[task_id]:
+                    del self._queued[task_id]
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def forget(self, task_id):
+        lock = self._locks.get(task_id)
+        if lock is not None and not lock.locked():
+            del self._locks[task_id]
+        self._states.pop(task_id, None)
+
+    def counts(self):
+        return Counter(self._states.values())
@@ -0,0 +1,63 @@
+# app/utils/telegram_client.py
+#
+# Used by task scripts: sends through the dashboard's Telegram service so all
+# scripts share its pooled connections and rate limits. When the dashboard is
+# not reachable (script started by hand) it falls back to an in-process service.
+import os
+import requests
+
+
+PIPECRAB_API_URL = os.getenv("PIPECRAB_API_URL", "http://127.0.0.1:8000").rstrip("/")
+TELEGRAM_CLIENT_TIMEOUT = float(os.getenv("TELEGRAM_CLIENT_TIMEOUT", "300"))
+
+_session = requests.Session()
+_local_service = None
+
+
+def _local():
+    global _local_service
+    if _local_service is None:
+        from app.utils.telegram_service import TelegramService
+        _local_service = TelegramService()
+    return _local_service
+
+
+def _post(path, **kwargs):
+    try:
+        response = _session.post(f"{PIPECRAB_API_URL}/telegram/{path}", timeout=TELEGRAM_CLIENT_TIMEOUT, **kwargs)
+    except requests.ConnectionError:
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        return {"ok": False, "status": response.status_code, "description": response.text[:300]}
+    if response.status_code != 200:
+        return {"ok": False, "status": response.status_code, "description": body.get("detail", "")}
+    return body
+
+
+def send_message(bot_name, text, parse_mode=None, chat_id=None):
+    result = _post("send", json={"bot": bot_name, "text": text, "parse_mode": parse_mode, "chat_id": chat_id})
+    if result is None:
+        result = _local().send_message(bot_name, text, chat_id=chat_id, parse_mode=parse_mode).result()
+    return result
+
+
+def send_photo(bot_name, photo, caption="", parse_mode=None, chat_id=None, filename="photo.jpg", mime="image/jpeg"):
+    # photo: bytes or an open binary file (e.g. the spooled output of prepare_photo), passed on unread
+    data = {"bot": bot_name, "caption": caption}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    if chat_id:
+        data["chat_id"] = chat_id
+    result = _post("send_photo", data=data, files={"photo": (filename, photo, mime)})
+    if result is None:
+        if hasattr(photo, "seek"):
+            photo.seek(0)  # the failed POST may have read part of it
+        result = _local().send_photo(bot_name, photo, filename=filename, caption=caption, chat_id=chat_id, parse_mode=parse_mode, mime=mime).result()
+    return result
+
+
+def close():
+    if _local_service is not None:
+        _local_service.close()
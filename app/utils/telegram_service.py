@@ -0,0 +1,268 @@
+# app/utils/telegram_service.py
+import os
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from app.config_telegram import TELEGRAM_BOTS
+
+
+# Point at a fake server for tests: TELEGRAM_API_URL=http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+# Telegram allows about 1 message/s per chat and 30 messages/s per bot
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "1"))
+TELEGRAM_BOT_RATE = float(os.getenv("TELEGRAM_BOT_RATE", "25"))
+TELEGRAM_BOT_BURST = float(os.getenv("TELEGRAM_BOT_BURST", "25"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+TELEGRAM_WORKERS_PER_BOT = int(os.getenv("TELEGRAM_WORKERS_PER_BOT", "2"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "30"))
+
+MESSAGE_LIMIT = 4096
+
+
+class TokenBucket:
+    # Not thread-safe on its own; used under the owning sender's lock
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self, now):
+        self._refill(now)
+        wait = max(0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class OutgoingMessage:
+    def __init__(self, method, chat_id, data, files=None, batchable=False):
+        self.method = method
+        self.chat_id = str(chat_id)
+        self.data = data
+        self.files = files
+        self.batchable = batchable
+        self.attempts = 0
+        self.followers = []  # messages merged into this one by batching
+        self.future = Future()
+
+
+class BotSender:
+    # One pooled keep-alive session and one queue per bot. Messages are queued per
+    # chat; a chat is only ever sent by one worker at a time, so order is kept.
+
+    def __init__(self, bot_name, token, api_url=TELEGRAM_API_URL, workers=TELEGRAM_WORKERS_PER_BOT):
+        self.bot_name = bot_name
+        self.base_url = f"{api_url}/bot{token}"
+        # requests is only loaded once a bot actually sends something
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        self.session.mount(api_url, HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0))
+        self.workers = workers
+        self.chats = OrderedDict()
+        self.chat_buckets = {}
+        self.bot_bucket = TokenBucket(TELEGRAM_BOT_RATE, TELEGRAM_BOT_BURST)
+        self.in_flight = set()
+        self.cond = threading.Condition()
+        self.threads = []
+        self.closing = False
+        self.stats = {"sent": 0, "failed": 0, "batched": 0, "retries": 0, "rate_limited": 0}
+
+    def submit(self, message):
+        with self.cond:
+            if self.closing:
+                raise RuntimeError("Telegram service is shutting down")
+            self.chats.setdefault(message.chat_id, deque()).append(message)
+            self.chat_buckets.setdefault(message.chat_id, TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST))
+            if not self.threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._worker, name=f"telegram-{self.bot_name}-{i}", daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            self.cond.notify()
+        return message.future
+
+    def pending(self):
+        with self.cond:
+            return sum(len(queue) for queue in self.chats.values()) + len(self.in_flight)
+
+    def _take_batch(self, queue):
+        message = queue.popleft()
+        if not message.batchable or message.followers:
+            return message
+        # Coalesce queued text messages for the same chat into one request
+        text = message.data["text"]
+        while queue and queue[0].batchable and queue[0].data.get("parse_mode") == message.data.get("parse_mode"):
+            joined = f"{text}\n\n{queue[0].data['text']}"
+            if len(joined) > MESSAGE_LIMIT:
+                break
+            text = joined
+            message.followers.append(queue.popleft())
+        if message.followers:
+            message.data = dict(message.data, text=text)
+        return message
+
+    def _next_message(self):
+        with self.cond:
+            while True:
+                if self.closing and not self.chats and not self.in_flight:
+                    return None
+                now = time.monotonic()
+                wait = None
+                for chat_id, queue in self.chats.items():
+                    if chat_id in self.in_flight:
+                        continue
+                    chat_wait = max(self.chat_buckets[chat_id].ready_in(now), self.bot_bucket.ready_in(now))
+                    if chat_wait <= 0:
+                        self.chat_buckets[chat_id].consume(now)
+                        self.bot_bucket.consume(now)
+                        self.in_flight.add(chat_id)
+                        message = self._take_batch(queue)
+                        if not queue:
+                            del self.chats[chat_id]
+                        else:
+                            self.chats.move_to_end(chat_id)  # round-robin between chats
+                        return message
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+                self.cond.wait(wait)
+
+    def _worker(self):
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+            retry_after = self._send(message)
+            with self.cond:
+                self.in_flight.discard(message.chat_id)
+                if retry_after is not None:
+                    self.chat_buckets[message.chat_id].block(retry_after, time.monotonic())
+                    self.chats.setdefault(message.chat_id, deque()).appendleft(message)
+                    self.chats.move_to_end(message.chat_id, last=False)
+                self.cond.notify_all()
+
+    def _send(self, message):
+        # Returns a delay in seconds if the message should be requeued, None once settled
+        import requests
+        message.attempts += 1
+        try:
+            for _, fileobj, _ in (message.files or {}).values():
+                if hasattr(fileobj, "seek"):
+                    fileobj.seek(0)  # file uploads are read again on every attempt
+        except (ValueError, OSError) as e:
+            # Closed under us, e.g. the request that uploaded the photo went away
+            self._settle(message, {"ok": False, "status": None, "attempts": message.attempts, "batched": 1 + len(message.followers), "description": f"photo unreadable: {e}"})
+            return None
+        try:
+            response = self.session.post(f"{self.base_url}/{message.method}", data=message.data, files=message.files, timeout=TELEGRAM_TIMEOUT)
+            status, text = response.status_code, response.text
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+        except (requests.RequestException, ValueError) as e:
+            status, text, body = None, str(e), {}  # ValueError: the file was closed mid-upload
+
+        if status == 200:
+            self._settle(message, {"ok": True, "status": 200, "attempts": message.attempts, "batched": 1 + len(message.followers), "result": body.get("result")})
+            return None
+
+        retryable = status is None or status == 429 or status >= 500
+        if retryable and message.attempts <= TELEGRAM_MAX_RETRIES:
+            with self.cond:
+                self.stats["retries"] += 1
+                if status == 429:
+                    self.stats["rate_limited"] += 1
+            if status == 429:
+                retry_after = body.get("parameters", {}).get("retry_after") or response.headers.get("Retry-After") or 1
+                return float(retry_after)
+            return min(0.5 * 2 ** (message.attempts - 1), 30) * random.uniform(0.8, 1.2)
+
+        self._settle(message, {"ok": False, "status": status, "attempts": message.attempts, "batched": 1 + len(message.followers), "description": body.get("description") or text[:300]})
+        return None
+
+    def _settle(self, message, result):
+        with self.cond:
+            self.stats["sent" if result["ok"] else "failed"] += 1
+            self.stats["batched"] += len(message.followers)
+        for settled in [message, *message.followers]:
+            settled.future.set_result(result)
+
+    def close(self, timeout=5):
+        # Let the queue drain for up to `timeout` seconds, then fail what is left
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        with self.cond:
+            leftovers = [message for queue in self.chats.values() for message in queue]
+            self.chats.clear()
+        for message in leftovers:
+            self._settle(message, {"ok": False, "status": None, "attempts": message.attempts, "batched": 1 + len(message.followers), "description": "dropped on shutdown"})
+        self.session.close()
+
+
+class TelegramService:
+    def __init__(self, bots=TELEGRAM_BOTS, api_url=TELEGRAM_API_URL):
+        self.bots = bots
+        self.api_url = api_url
+        self.senders = {}
+        self._lock = threading.Lock()
+
+    def sender(self, bot_name):
+        settings = self.bots.get(bot_name)
+        if not settings:
+            raise KeyError(f"Bot '{bot_name}' not found in config_telegram.py")
+        with self._lock:
+            if bot_name not in self.senders:
+                self.senders[bot_name] = BotSender(bot_name, settings["bot_token"], self.api_url)
+            return self.senders[bot_name]
+
+    def default_chat(self, bot_name):
+        return self.bots[bot_name]["chat_id"]
+
+    def send_message(self, bot_name, text, chat_id=None, parse_mode=None, batch=True):
+        sender = self.sender(bot_name)
+        data = {"chat_id": chat_id or self.default_chat(bot_name), "text": text}
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        return sender.submit(OutgoingMessage("sendMessage", data["chat_id"], data, batchable=batch))
+
+    def send_photo(self, bot_name, photo, filename="photo.jpg", caption="", chat_id=None, parse_mode=None, mime="image/jpeg"):
+        sender = self.sender(bot_name)
+        data = {"chat_id": chat_id or self.default_chat(bot_name), "caption": caption}
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        return sender.submit(OutgoingMessage("sendPhoto", data["chat_id"], data, files={"photo": (filename, photo, mime)}))
+
+    def status(self):
+        with self._lock:
+            senders = list(self.senders.values())
+        return {sender.bot_name: dict(sender.stats, pending=sender.pending()) for sender in senders}
+
+    def close(self, timeout=5):
+        with self._lock:
+            senders = list(self.senders.values())
+            self.senders.clear()
+        for sender in senders:
+            sender.close(timeout)
+
+
+telegram_service = TelegramService()
@@ -0,0 +1,108 @@
+# benchmarks/bench_event_loop.py
+#
+# Load test for GET /scripts/ with the SQL Server store selected.
+# The SQL round trip is emulated with a sleep, so it runs without a database:
+#
+#   python -m benchmarks.bench_event_loop --polls 50 --latency 0.05
+#
+# "inline" mode reproduces the old behaviour (pyodbc called inside the handler),
+# "executor" mode is the current TaskStore path. The heartbeat lag is how long
+# the event loop was unable to run anything else.
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+from app.api import scripts
+from app.utils import store as store_module
+
+
+class EmulatedSqlTaskStore(store_module.SqlServerTaskStore):
+    def __init__(self, task_count, latency):
+        self.task_count = task_count
+        self.latency = latency
+
+    def list_all_sync(self):
+        time.sleep(self.latency)  # network + query time of a real SQL Server
+        return [{
+            "id": i,
+            "name": f"task_{i}",
+            "enabled": False,
+            "path": f"scripts/task_{i}.py",
+            "description": "",
+            "tags": "bench",
+            "apps": ["scheduler"],
+            "schedule_expression": "* * * * *",
+        } for i in range(1, self.task_count + 1)]
+
+
+class InlineSqlTaskStore(EmulatedSqlTaskStore):
+    async def list_all(self):
+        return self.list_all_sync()
+
+
+async def heartbeat(stop_event, interval, lags):
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run_mode(mode, polls, task_count, latency):
+    store_cls = InlineSqlTaskStore if mode == "inline" else EmulatedSqlTaskStore
+    store_module.set_task_store(store_cls(task_count, latency))
+
+    lags = []
+    stop_event = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop_event, 0.005, lags))
+
+    transport = httpx.ASGITransport(app=_build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.get("/scripts/") for _ in range(polls)))
+        elapsed = time.perf_counter() - started
+
+    stop_event.set()
+    await beat
+    store_module.set_task_store(None)
+
+    return {
+        "mode": mode,
+        "polls": polls,
+        "ok": sum(1 for r in responses if r.status_code == 200),
+        "wall_seconds": round(elapsed, 4),
+        "max_loop_lag_ms": round(max(lags, default=0.0) * 1000, 2),
+        "p50_loop_lag_ms": round(sorted(lags)[len(lags) // 2] * 1000, 2) if lags else 0.0,
+    }
+
+
+def _build_app():
+    from fastapi import FastAPI
+    app = FastAPI()
+    app.include_router(scripts.router, prefix="/scripts")
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop stall test for concurrent dashboard polls")
+    parser.add_argument("--polls", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Emulated SQL round trip in seconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pipecrab-bench-")
+    os.chdir(workdir)
+
+    results = [asyncio.run(run_mode(mode, args.polls, args.tasks, args.latency)) for mode in ("inline", "executor")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/bench_image_memory.py
+#
+# Peak memory of the nasa_day_image download + resize step, old vs streaming.
+# Fixture JPEGs are generated locally and served from a local HTTP server; each
+# pipeline runs in a fresh subprocess, and pipeline_mb is its peak RSS above the
+# post-import baseline:
+#
+#   python -m benchmarks.bench_image_memory --sizes 4000x3000 8000x6000
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def make_fixture(path, width, height):
+    from PIL import Image
+    # Noise does not compress, so the file is about as large as a detailed NASA photo
+    noise = Image.effect_noise((width, height), 60).convert("RGB")
+    noise.save(path, format="JPEG", quality=92)
+
+
+def peak_rss_mb():
+    # VmHWM is per address space; ru_maxrss would carry over the parent's peak across fork+exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_legacy(url, workdir):
+    # The previous nasa_day_image code path
+    import requests
+    from io import BytesIO
+    from PIL import Image
+    baseline = peak_rss_mb()
+    img_response = requests.get(url)
+    img_response.raise_for_status()
+    img = Image.open(BytesIO(img_response.content))
+    img = img.resize((1200, int(1200 * img.height / img.width)))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=85)
+    return baseline, len(buffer.getvalue())
+
+
+def run_streaming(url, workdir):
+    from app.utils.http_cache import HttpCache
+    from app.utils.image_pipeline import prepare_photo
+    baseline = peak_rss_mb()
+    cache = HttpCache(os.path.join(workdir, "cache"))
+    img_file = cache.download(url, max_bytes=200 * 1024 * 1024)
+    img_file.raise_for_status()
+    buffer, _ = prepare_photo(img_file.path)
+    size = len(buffer.read())
+    cache.close()
+    return baseline, size
+
+
+def worker(mode, url, workdir):
+    started = time.perf_counter()
+    baseline, output_bytes = (run_legacy if mode == "legacy" else run_streaming)(url, workdir)
+    print(json.dumps({
+        "baseline_mb": baseline,
+        "peak_rss_mb": peak_rss_mb(),
+        "pipeline_mb": round(peak_rss_mb() - baseline, 1),
+        "output_kb": output_bytes // 1024,
+        "seconds": round(time.perf_counter() - started, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of the image download/resize pipeline")
+    parser.add_argument("--sizes", nargs="+", default=["4000x3000", "8000x6000"], help="Fixture sizes, WIDTHxHEIGHT")
+    parser.add_argument("--worker", nargs=3, metavar=("MODE", "URL", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fixtures = os.path.join(workdir, "fixtures")
+        os.makedirs(fixtures)
+        for size in args.sizes:
+            width, height = map(int, size.split("x"))
+            make_fixture(os.path.join(fixtures, f"{size}.jpg"), width, height)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=fixtures))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        report = {}
+        for size in args.sizes:
+            url = f"http://127.0.0.1:{server.server_address[1]}/{size}.jpg"
+            report[size] = {"source_mb": round(os.path.getsize(os.path.join(fixtures, f"{size}.jpg")) / 1024 / 1024, 1)}
+            for mode in ("legacy", "streaming"):
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_image_memory", "--worker", mode, url, os.path.join(workdir, mode)],
+                    capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                )
+                report[size][mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
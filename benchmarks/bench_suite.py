@@ -0,0 +1,433 @@
+# benchmarks/bench_suite.py
+#
+# Offline benchmark suite for the dashboard API and the process manager. Each run
+# works in a temp directory with a synthetic scripts.json (10 to 10k tasks), log
+# files of varying size and a dummy script that prints continuously. The results
+# are written as JSON so two runs can be compared:
+#
+#   python -m benchmarks.bench_suite --output before.json
+#   python -m benchmarks.bench_suite --output after.json --compare before.json
+#   python -m benchmarks.bench_suite --quick --only list_latency append_log
+#
+# start_stop_race is a stress test as well: it fires overlapping start/stop calls
+# at many tasks and exits 1 if any child process is left running untracked.
+import os
+import random
+import sys
+import json
+import time
+import asyncio
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from app.api import scripts
+from app.utils import store as store_module
+
+SECTIONS = ["list_latency", "append_log", "start_stop", "start_stop_race", "bulk", "cron_lag", "memory"]
+
+CHATTY_SCRIPT = """import sys, time
+i = 0
+while True:
+    print(f"line {i} " + "x" * 80)
+    i += 1
+    if i % 50 == 0:
+        time.sleep(0.01)
+"""
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "p50_ms": round(pick(0.5) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def live_children():
+    # PIDs of our child processes that are still running (not zombies)
+    if not os.path.isdir("/proc"):
+        return None
+    me, children = os.getpid(), []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == me and fields[0] != "Z":
+            children.append(int(entry))
+    return children
+
+
+def rss_mb(pid="self"):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# --- fixtures ---
+
+def write_fixture(workdir, task_count, log_tasks=200):
+    # Tasks all point at the same chatty script; a slice of them gets a log file
+    os.makedirs(os.path.join(workdir, "scripts"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    with open(os.path.join(workdir, "scripts", "chatty.py"), "w", encoding="utf-8") as f:
+        f.write(CHATTY_SCRIPT)
+
+    tasks = [{
+        "id": i,
+        "name": f"task_{i}",
+        "path": "scripts/chatty.py",
+        "description": f"synthetic task {i}",
+        "tags": "bench",
+        "status": "stopped",
+        "apps": ["scheduler"] if i % 3 == 0 else ["longrun"],
+        "email_recipients": "",
+        "pass_bot_param": False,
+        "bot_name": "",
+        "schedule_expression": f"{i % 60} * * * *",
+        "cron_expr_parse": "",
+        "enabled": False,
+        "run_count": 0,
+    } for i in range(1, task_count + 1)]
+    path = os.path.join(workdir, f"scripts_{task_count}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tasks, f, indent=2)
+
+    line = "[2024-01-01 00:00:00] [MANAGER] Starting process PID: 1234\n"
+    for i in range(1, min(task_count, log_tasks) + 1):
+        lines = (10, 1000, 10000)[i % 3]  # a few bytes up to ~600 KB
+        with open(os.path.join(workdir, "logs", f"task_{i}.log"), "w", encoding="utf-8") as f:
+            f.write(line * lines)
+    return path
+
+
+def use_fixture(path):
+    store_module.set_task_store(store_module.JsonTaskStore(path))
+
+
+def build_app():
+    app = FastAPI()
+    app.include_router(scripts.router, prefix="/scripts")
+    return app
+
+
+# --- sections ---
+
+async def bench_list_latency(sizes, workdir, requests):
+    results = {}
+    transport = httpx.ASGITransport(app=build_app())
+    for size in sizes:
+        use_fixture(write_fixture(workdir, size))
+        samples = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = await client.get("/scripts/")
+                samples.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        tracemalloc.start()
+        await scripts.list_scripts()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[str(size)] = dict(percentiles(samples), requests=requests, bytes_per_task=peak // size)
+    return results
+
+
+def bench_append_log(workdir, lines):
+    results = {}
+    log_path = os.path.join(workdir, "logs", "append_bench.log")
+    for label, prefill, width in (("empty", 0, 60), ("full", scripts.LOG_LINE_LIMIT, 60), ("full_long_lines", scripts.LOG_LINE_LIMIT, 2000)):
+        with open(log_path, "w", encoding="utf-8") as f:
+            f.write(("y" * width + "\n") * prefill)
+        started = time.perf_counter()
+        for i in range(lines):
+            scripts.append_to_limited_log(log_path, f"[bench] line {i} " + "z" * width)
+        elapsed = time.perf_counter() - started
+        results[label] = {"lines": lines, "lines_per_sec": round(lines / elapsed, 1), "us_per_line": round(elapsed / lines * 1e6, 1)}
+    return results
+
+
+async def bench_start_stop(sizes, workdir, cycles):
+    results = {}
+    for size in sizes:
+        use_fixture(write_fixture(workdir, size, log_tasks=0))
+        name = "task_1"  # apps=["longrun"], so start_script launches a process
+        start_samples, stop_samples = [], []
+        for _ in range(cycles):
+            started = time.perf_counter()
+            await scripts.start_script(name)
+            start_samples.append(time.perf_counter() - started)
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            await scripts.stop_script(name)
+            stop_samples.append(time.perf_counter() - started)
+        results[str(size)] = {"cycles": cycles, "start": percentiles(start_samples), "stop": percentiles(stop_samples)}
+    return results
+
+
+async def bench_start_stop_race(workdir, tasks, ops):
+    # `ops` random start/stop calls per task, all in flight at once. Afterwards every
+    # task is stopped; a child still alive then was started but never tracked.
+    use_fixture(write_fixture(workdir, tasks * 2, log_tasks=0))
+    names = [f"task_{i}" for i in range(1, tasks * 2 + 1) if i % 3 != 0][:tasks]
+    rng = random.Random(41)
+    calls = [(rng.choice((scripts.start_script, scripts.stop_script)), name) for name in names for _ in range(ops)]
+    rng.shuffle(calls)
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(call(name) for call, name in calls), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    rejected = sum(1 for o in outcomes if isinstance(o, HTTPException))
+    errors = [repr(o) for o in outcomes if isinstance(o, Exception) and not isinstance(o, HTTPException)]
+    tracked = sum(1 for info in scripts.running_processes.values() if info.get("process"))
+
+    for name in names:
+        try:
+            await scripts.stop_script(name)
+        except HTTPException:
+            pass  # left stopped by the race
+    await asyncio.sleep(0.2)
+    orphans = live_children()
+    states = scripts.task_states.counts()
+    return {
+        "tasks": len(names),
+        "calls": len(calls),
+        "calls_per_sec": round(len(calls) / elapsed, 1),
+        "running_after_race": tracked,
+        "rejected": rejected,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "orphans": None if orphans is None else len(orphans),
+        "states_after_stop": dict(states),
+    }
+
+
+async def bench_bulk(workdir, tasks):
+    # Starting and stopping `tasks` tasks one call each (as the dashboard did) against
+    # one POST /scripts/bulk call, counting the writes to scripts.json
+    use_fixture(write_fixture(workdir, tasks * 2, log_tasks=0))
+    names = [f"task_{i}" for i in range(1, tasks * 2 + 1) if i % 3 != 0][:tasks]
+    ids = [int(name.split("_")[1]) for name in names]
+    store = store_module.get_task_store()
+    write = store._write
+    writes = [0]
+
+    def counted_write(data):
+        writes[0] += 1
+        write(data)
+
+    store._write = counted_write
+    results = {"tasks": len(names)}
+    try:
+        for mode in ("per_task", "bulk"):
+            writes[0] = 0
+            started = time.perf_counter()
+            if mode == "bulk":
+                await scripts.bulk_action(scripts.BulkRequest(action="start", ids=ids))
+            else:
+                for name in names:
+                    await scripts.start_script(name)
+            start_elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            if mode == "bulk":
+                await scripts.bulk_action(scripts.BulkRequest(action="stop", ids=ids))
+            else:
+                for name in names:
+                    await scripts.stop_script(name)
+            stop_elapsed = time.perf_counter() - started
+            results[mode] = {
+                "start_ms": round(start_elapsed * 1000, 3),
+                "stop_ms": round(stop_elapsed * 1000, 3),
+                "store_writes": writes[0],
+            }
+    finally:
+        store._write = write
+    return results
+
+
+async def bench_cron_lag(workdir, fires):
+    # `fires` jobs due in the same second, like many tasks on "0 9 * * *"; lag is
+    # how long after the due time each one got its process started
+    use_fixture(write_fixture(workdir, fires, log_tasks=0))
+    scripts.start_scheduler()  # normally started by the app lifespan, captures the running loop
+    command = scripts.build_command({"path": "scripts/chatty.py"})
+    command = [command[0], "-c", "pass"]
+    lags, lock, done = [], threading.Lock(), threading.Event()
+
+    def fire(due, name, task_id):
+        scripts.launch_cron_script(name, command, task_id)
+        with lock:
+            lags.append(time.time() - due.timestamp())
+            if len(lags) == fires:
+                done.set()
+
+    due = datetime.now(scripts.scheduler.timezone) + timedelta(seconds=1)
+    for i in range(1, fires + 1):
+        scripts.scheduler.add_job(fire, "date", run_date=due, args=[due, f"task_{i}", i],
+                                  id=f"bench_fire_{i}", misfire_grace_time=None)
+    await asyncio.get_running_loop().run_in_executor(None, done.wait, 60 + fires)
+    await asyncio.sleep(0.5)  # let the exit callbacks collect the runs
+    return dict(percentiles(lags), fires=fires, completed=len(lags))
+
+
+async def bench_memory(workdir, tasks):
+    # Dashboard RSS growth per running task, and the RSS of each child process
+    use_fixture(write_fixture(workdir, tasks * 2, log_tasks=0))
+    names = [f"task_{i}" for i in range(1, tasks * 2 + 1) if i % 3 != 0][:tasks]
+    before = rss_mb()
+    for name in names:
+        await scripts.start_script(name)
+    await asyncio.sleep(0.5)
+    after = rss_mb()
+    children = [rss_mb(info["process"].pid) for info in scripts.running_processes.values() if info.get("process")]
+    children = [c for c in children if c is not None]
+    for name in names:
+        await scripts.stop_script(name)
+    if before is None or after is None:
+        return {"tasks": len(names), "error": "no /proc on this platform"}
+    return {
+        "tasks": len(names),
+        "dashboard_mb_per_task": round((after - before) / len(names), 3),
+        "child_rss_mb_mean": round(statistics.mean(children), 2) if children else None,
+    }
+
+
+# --- runner ---
+
+def git_revision():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run_async_sections(args, workdir, results):
+    if "list_latency" in args.only:
+        results["list_latency"] = await bench_list_latency(args.sizes, workdir, args.requests)
+    if "start_stop" in args.only:
+        results["start_stop"] = await bench_start_stop(args.start_sizes, workdir, args.cycles)
+    if "start_stop_race" in args.only:
+        results["start_stop_race"] = await bench_start_stop_race(workdir, args.race_tasks, args.race_ops)
+    if "bulk" in args.only:
+        results["bulk"] = await bench_bulk(workdir, args.bulk_tasks)
+    if "memory" in args.only:
+        results["memory"] = await bench_memory(workdir, args.memory_tasks)
+    if "cron_lag" in args.only:
+        results["cron_lag"] = await bench_cron_lag(workdir, args.fires)
+    scripts.reaper.close()
+
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, threshold):
+    # Everything is lower-is-better except throughput (*_per_sec)
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    report = []
+    for key in sorted(old.keys() & new.keys()):
+        if not key.endswith(("_ms", "_per_sec", "_per_line", "_per_task", "_mean")) or not old[key]:
+            continue
+        ratio = new[key] / old[key]
+        worse = ratio < 1 / threshold if key.endswith("_per_sec") else ratio > threshold
+        report.append({"metric": key, "baseline": old[key], "current": new[key], "ratio": round(ratio, 3), "regression": worse})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the dashboard API and process manager")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Task counts for GET /scripts/")
+    parser.add_argument("--start-sizes", type=int, nargs="+", default=[10, 1000], help="Task counts for start/stop")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--log-lines", type=int, default=500)
+    parser.add_argument("--fires", type=int, default=50, help="Cron jobs due in the same second")
+    parser.add_argument("--memory-tasks", type=int, default=20)
+    parser.add_argument("--race-tasks", type=int, default=50, help="Tasks hit by start_stop_race")
+    parser.add_argument("--race-ops", type=int, default=20, help="Start/stop calls per task in start_stop_race")
+    parser.add_argument("--bulk-tasks", type=int, default=50, help="Tasks started and stopped by the bulk section")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--quick", action="store_true", help="Small sizes and few iterations")
+    parser.add_argument("--output", help="Write the JSON report here as well")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio counted as a regression")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.sizes, args.start_sizes = [10, 100], [10]
+        args.requests, args.cycles, args.log_lines, args.fires, args.memory_tasks = 5, 3, 100, 10, 5
+        args.race_tasks, args.race_ops, args.bulk_tasks = 10, 8, 10
+
+    args.output = os.path.abspath(args.output) if args.output else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix="pipecrab-bench-")
+    os.chdir(workdir)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": {},
+    }
+
+    asyncio.run(run_async_sections(args, workdir, report["results"]))
+    if "append_log" in args.only:
+        report["results"]["append_log"] = bench_append_log(workdir, args.log_lines)
+    if scripts.scheduler.running:
+        scripts.scheduler.shutdown(wait=False)
+    store_module.set_task_store(None)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if args.compare and any(row["regression"] for row in report["comparison"]):
+        sys.exit(1)
+    race = report["results"].get("start_stop_race", {})
+    if race.get("orphans") or race.get("errors") or race.get("states_after_stop"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/cluster_sim.py
+#
+# Single-host cluster simulation: several local processes act as PipeCrab nodes
+# sharing one SQLite file. The driver queues runs, kills the first leader halfway
+# and reports which node executed what. Every launch is logged by the worker, and
+# the run exits 1 unless each run executed exactly once (runs the killed leader had
+# started are requeued, so those must run exactly once on another node). Cron fires
+# queued by several nodes must collapse into one run per fire key.
+#
+#   python -m benchmarks.cluster_sim --nodes 3 --runs 30
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utils.cluster import SqliteClusterStore, ClusterCoordinator
+
+
+def launches_path(db_path):
+    return os.path.join(os.path.dirname(db_path), "launches.log")
+
+
+def run_node(db_path, node_id, capacity):
+    store = SqliteClusterStore(db_path)
+
+    async def launch_run(run):
+        # One short O_APPEND write per launch, so lines from several nodes never interleave
+        with open(launches_path(db_path), "a", encoding="utf-8") as f:
+            f.write(f"{run['run_id']} {node_id}\n")
+        return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.3)"])
+
+    async def main():
+        coordinator = ClusterCoordinator(store, launch_run, node_id=node_id, capacity=capacity,
+                                         lease_seconds=2, poll_interval=0.1)
+        coordinator.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate cluster nodes as local processes")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--worker", nargs=3, metavar=("DB", "NODE_ID", "CAPACITY"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_node(args.worker[0], args.worker[1], int(args.worker[2]))
+        return
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="pipecrab-cluster-"), "cluster.db")
+    store = SqliteClusterStore(db_path)
+    capacities = {f"node-{i}": 1 + i for i in range(args.nodes)}
+    nodes = {
+        node_id: subprocess.Popen([sys.executable, "-m", "benchmarks.cluster_sim", "--worker", db_path, node_id, str(capacity)],
+                                  stdout=subprocess.DEVNULL)
+        for node_id, capacity in capacities.items()
+    }
+
+    time.sleep(1.5)
+    first_leader = store.get_lease_holder()
+    # Each fire is queued once per node, as every node's scheduler sees it
+    fire_keys = [f"1@fire-{i}" for i in range(args.runs // 2)]
+    for key in fire_keys:
+        for _ in nodes:
+            store.enqueue_run(1, "sim task", key)
+
+    # Leader failover: the lease expires and another node takes over
+    nodes[first_leader].kill()
+    time.sleep(3)
+    second_leader = store.get_lease_holder()
+    for i in range(args.runs - args.runs // 2):
+        store.enqueue_run(1, "sim task")
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        runs = store.list_runs(limit=args.runs)
+        if runs and all(r["Status"] in ("succeeded", "failed") for r in runs):
+            break
+        time.sleep(0.2)
+
+    for process in nodes.values():
+        process.kill()
+
+    runs = store.list_runs(limit=args.runs * len(nodes))
+    launches = {}
+    with open(launches_path(db_path), encoding="utf-8") as f:
+        for line in f:
+            run_id, node_id = line.split()
+            launches.setdefault(int(run_id), []).append(node_id)
+
+    never_run = [r["RunId"] for r in runs if r["RunId"] not in launches]
+    duplicated = []
+    for run_id, node_ids in launches.items():
+        # A run the killed leader had started is requeued once; everything else runs once
+        survivors = [n for n in node_ids if n != first_leader]
+        if len(survivors) != 1 and not (len(node_ids) == 1 and node_ids[0] == first_leader):
+            duplicated.append({"run_id": run_id, "nodes": node_ids})
+    report = {
+        "capacities": capacities,
+        "first_leader": first_leader,
+        "leader_after_failover": second_leader,
+        "runs": len(runs),
+        "fires_queued": len(fire_keys) * len(nodes),
+        "fire_runs": sum(1 for r in runs if r["FireKey"]),
+        "runs_per_node": Counter(r["NodeId"] for r in runs),
+        "statuses": Counter(r["Status"] for r in runs),
+        "requeued_from_killed_leader": sum(1 for n in launches.values() if first_leader in n and len(n) > 1),
+        "never_run": never_run,
+        "run_more_than_once": duplicated,
+    }
+    print(json.dumps(report, indent=2))
+    if never_run or duplicated or report["fire_runs"] != len(fire_keys):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
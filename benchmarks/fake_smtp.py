@@ -0,0 +1,117 @@
+# benchmarks/fake_smtp.py
+#
+# Checks the email queue against a local aiosmtpd server (pip install aiosmtpd).
+# A burst of failure alerts is sent once the old way (new SMTP session per
+# message) and once through EmailService, and the sessions, delivered emails
+# and transient failures seen by the server are compared:
+#
+#   python -m benchmarks.fake_smtp --alerts 40 --tasks 8 --fail-first 2
+#
+#   python -m benchmarks.fake_smtp --serve --port 8025
+#       then run the dashboard with SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=False
+import os
+import sys
+import json
+import time
+import smtplib
+import argparse
+import threading
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from aiosmtpd.controller import Controller
+
+
+class CountingHandler:
+    def __init__(self, fail_first=0):
+        self.lock = threading.Lock()
+        self.fail_first = fail_first
+        self.stats = {"sessions": 0, "delivered": 0, "rejected_451": 0}
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        with self.lock:
+            self.stats["sessions"] += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                self.stats["rejected_451"] += 1
+                return "451 4.3.0 Temporary failure, try again"
+            self.stats["delivered"] += 1
+        return "250 OK"
+
+
+def start_server(port=0, fail_first=0):
+    handler = CountingHandler(fail_first)
+    controller = Controller(handler, hostname="127.0.0.1", port=port or 8025)
+    controller.start()
+    return controller, handler
+
+
+def run_naive(port, alerts):
+    for recipients, subject, body in alerts:
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        try:
+            with smtplib.SMTP("127.0.0.1", port) as server:
+                server.sendmail("pipecrab@localhost", recipients, msg.as_string())
+        except smtplib.SMTPException:
+            pass  # the old code logs and drops the alert
+
+
+def run_service(port, alerts, batch_window):
+    from app.utils import email_service as email_module
+    email_module.EMAIL_MAX_RETRIES = 3
+    service = email_module.EmailService(server="127.0.0.1", port=port, user=None, password=None,
+                                        starttls=False, batch_window=batch_window)
+    futures = [service.send(recipients, subject, body) for recipients, subject, body in alerts]
+    results = [future.result() for future in futures]
+    status = service.status()
+    service.close()
+    return sum(r["ok"] for r in results), status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email queue check against a local aiosmtpd server")
+    parser.add_argument("--serve", action="store_true", help="Only run the fake SMTP server")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--alerts", type=int, default=40, help="Alerts in the burst")
+    parser.add_argument("--tasks", type=int, default=8, help="Distinct failing tasks (the rest are repeats)")
+    parser.add_argument("--fail-first", type=int, default=2, help="DATA commands answered with 451 first")
+    parser.add_argument("--batch-window", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.serve:
+        controller, _ = start_server(args.port)
+        print(f"Fake SMTP server on 127.0.0.1:{args.port}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            controller.stop()
+        return
+
+    recipient_sets = [["ops@example.com"], ["ops@example.com", "dev@example.com"]]
+    alerts = [(recipient_sets[i % 2], f"Task task_{i % args.tasks} failed", f"task_{i % args.tasks} exited with code 1")
+              for i in range(args.alerts)]
+
+    report = {}
+    for mode in ("naive", "service"):
+        controller, handler = start_server(args.port, args.fail_first)
+        started = time.perf_counter()
+        if mode == "naive":
+            run_naive(args.port, alerts)
+            service_stats = None
+        else:
+            _, service_stats = run_service(args.port, alerts, args.batch_window)
+        report[mode] = dict(handler.stats, seconds=round(time.perf_counter() - started, 2), service=service_stats)
+        controller.stop()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
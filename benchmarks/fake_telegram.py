@@ -0,0 +1,164 @@
+# benchmarks/fake_telegram.py
+#
+# Local stand-in for api.telegram.org that enforces a per-chat rate limit the way
+# Telegram does (HTTP 429 with parameters.retry_after) and counts TCP connections.
+#
+#   python -m benchmarks.fake_telegram --serve --port 8081
+#       then run the dashboard with TELEGRAM_API_URL=http://127.0.0.1:8081
+#
+#   python -m benchmarks.fake_telegram --messages 60 --chats 3
+#       sends a burst through TelegramService and through plain requests.post
+#       and compares 429s, connections and delivery time
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import requests
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, chat_interval=1.0):
+        super().__init__(address, FakeTelegramHandler)
+        self.chat_interval = chat_interval
+        self.lock = threading.Lock()
+        self.last_by_chat = {}
+        self.stats = {"connections": 0, "accepted": 0, "rate_limited": 0}
+        self.messages = []
+
+    def check_rate(self, chat_id):
+        with self.lock:
+            now = time.monotonic()
+            last = self.last_by_chat.get(chat_id)
+            if last is not None and now - last < self.chat_interval * 0.95:  # some clock slack, like the real API
+                self.stats["rate_limited"] += 1
+                return max(1, round(self.chat_interval - (now - last)))
+            self.last_by_chat[chat_id] = now
+            self.stats["accepted"] += 1
+            return 0
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients reuse the connection
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        match = re.match(r"^/bot([^/]+)/(sendMessage|sendPhoto)$", self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not match:
+            self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+
+        if self.headers.get("Content-Type", "").startswith("multipart/"):
+            found = re.search(rb'name="chat_id"\r\n\r\n([^\r]*)', body)
+            chat_id = found.group(1).decode() if found else ""
+            text = "<photo>"
+        else:
+            form = parse_qs(body.decode("utf-8"))
+            chat_id = form.get("chat_id", [""])[0]
+            text = form.get("text", [""])[0]
+
+        retry_after = self.server.check_rate(chat_id)
+        if retry_after:
+            self._reply(429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}", "parameters": {"retry_after": retry_after}})
+            return
+
+        with self.server.lock:
+            self.server.messages.append((chat_id, text))
+            message_id = len(self.server.messages)
+        self._reply(200, {"ok": True, "result": {"message_id": message_id, "chat": {"id": chat_id}}})
+
+
+def start_server(port=0, chat_interval=1.0):
+    server = FakeTelegramServer(("127.0.0.1", port), chat_interval)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_naive(api_url, messages):
+    delivered = 0
+    for chat_id, text in messages:
+        response = requests.post(f"{api_url}/botFAKE/sendMessage", data={"chat_id": chat_id, "text": text})
+        delivered += response.status_code == 200
+    return delivered
+
+
+def run_service(api_url, messages, batch):
+    from app.utils.telegram_service import TelegramService
+    bots = {"FakeBot": {"bot_token": "FAKE", "chat_id": messages[0][0]}}
+    service = TelegramService(bots=bots, api_url=api_url)
+    futures = [service.send_message("FakeBot", text, chat_id=chat_id, batch=batch) for chat_id, text in messages]
+    results = [future.result() for future in futures]
+    status = service.status()["FakeBot"]
+    service.close()
+    return sum(r["ok"] for r in results), status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server and delivery benchmark")
+    parser.add_argument("--serve", action="store_true", help="Only run the fake server")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--chats", type=int, default=3)
+    parser.add_argument("--chat-interval", type=float, default=1.0, help="Seconds between accepted messages per chat")
+    args = parser.parse_args()
+
+    if args.serve:
+        server = start_server(args.port, args.chat_interval)
+        print(f"Fake Telegram API on http://127.0.0.1:{server.server_address[1]}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    messages = [(str(1000 + i % args.chats), f"message {i}") for i in range(args.messages)]
+    report = {}
+    for mode in ("naive", "service", "service_batched"):
+        server = start_server(0, args.chat_interval)
+        api_url = f"http://127.0.0.1:{server.server_address[1]}"
+        started = time.perf_counter()
+        if mode == "naive":
+            delivered, service_stats = run_naive(api_url, messages), None
+        else:
+            delivered, service_stats = run_service(api_url, messages, batch=(mode == "service_batched"))
+        report[mode] = {
+            "delivered": delivered,
+            "of": len(messages),
+            "seconds": round(time.perf_counter() - started, 2),
+            "server_requests_429": server.stats["rate_limited"],
+            "server_connections": server.stats["connections"],
+            "service": service_stats,
+        }
+        server.shutdown()
+        server.server_close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-import requests
 import sys
 import os
 import argparse
 from io import BytesIO
 from datetime import datetime
 from app.config_telegram import TELEGRAM_BOTS, DEFAULT_BOT_NAME
+from app.utils import telegram_client
+from app.utils.http_cache import HttpCache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -19,18 +20,11 @@ def get_timestamp():
     return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
 
 def send_photo_to_telegram(bot_settings, image_buffer, caption, script_name, post_description, bot_name):
-    response = requests.post(
-        f"https://api.telegram.org/bot{bot_settings['bot_token']}/sendPhoto",
-        data={
-            'chat_id': bot_settings['chat_id'],
-            'caption': caption,
-            'parse_mode': 'HTML'
-        },
-        files={'photo': ('nasa_apod.jpg', image_buffer, 'image/jpeg')}
-    )
+    # Queued through the dashboard's Telegram service (pooled, rate limited, retried)
+    result = telegram_client.send_photo(bot_name, image_buffer, caption=caption, parse_mode='HTML', filename='nasa_apod.jpg')
 
     bot_token_tail = bot_settings['bot_token'][-5:]
-    status = "Success" if response.status_code == 200 else f"Failed! Status: {response.status_code} {response.text}"
+    status = "Success" if result.get("ok") else f"Failed! Status: {result.get('status')} {result.get('description', '')}"
     
     print(f"{get_timestamp()} Telegram post: {status} "
           f"[script_name: {script_name}; "
@@ -38,18 +32,29 @@ def send_photo_to_telegram(bot_settings, image_buffer, caption, script_name, pos
           f"chat_id: {bot_settings['chat_id']}; "
           f"bot_name: {bot_name}; "
           f"bot_token: ***{bot_token_tail};]")
+    return result.get("ok", False)
 
 def get_nasa_image(bot_settings, bot_name):
     print(f"{get_timestamp()} Script executed. Launch command: {' '.join(sys.argv[0:])}")
+    # Conditional requests + posted ledger: a re-run on the same day costs a 304 and posts nothing
+    cache = HttpCache()
+    ledger = f"nasa_apod_image:{bot_name}"
     try:
         params = {"api_key": NASA_API_KEY}
         print(f"{get_timestamp()} Requesting NASA image of the day...")
-        response = requests.get(NASA_APOD_URL, params=params)
+        response = cache.get(NASA_APOD_URL, params=params)
         if response.status_code != 200:
             print(f"{get_timestamp()} Error! Request failed with status: {response.status_code}")
             sys.exit(1)
+        if response.from_cache:
+            print(f"{get_timestamp()} APOD data not modified since last run (304), using cached copy.")
 
         data = response.json()
+        item_id = data.get("date") or data.get("url")
+        if cache.already_posted(ledger, item_id):
+            print(f"{get_timestamp()} APOD for {item_id} was already posted via '{bot_name}'. Skipping post.")
+            return
+
         if data.get("media_type") != "image":
             media_type = data.get("media_type")
             url = data.get("url")
@@ -72,17 +77,12 @@ def get_nasa_image(bot_settings, bot_name):
                     
 
 
-            response = requests.post(
-                f"https://api.telegram.org/bot{bot_settings['bot_token']}/sendMessage",
-                data={
-                    'chat_id': bot_settings['chat_id'],
-                    'text': caption,
-                    'parse_mode': 'HTML'
-                }
-            )
+            result = telegram_client.send_message(bot_name, caption, parse_mode='HTML')
+            if result.get("ok"):
+                cache.mark_posted(ledger, item_id, {"title": title})
 
             bot_token_tail = bot_settings['bot_token'][-5:]
-            status = "Success" if response.status_code == 200 else f"Failed! Status: {response.status_code} {response.text}"
+            status = "Success" if result.get("ok") else f"Failed! Status: {result.get('status')} {result.get('description', '')}"
             print(f"{get_timestamp()} Telegram post: {status} "
                 f"[script_name: nasa_apod_image; "
                 f"post_description: {title.strip()[:50]}; "
@@ -101,7 +101,7 @@ def get_nasa_image(bot_settings, bot_name):
         print(f"{get_timestamp()} Found image: {title} ({date})")
         print(f"{get_timestamp()} Downloading image...")
 
-        image_response = requests.get(image_url)
+        image_response = cache.get(image_url)
         if image_response.status_code != 200:
             print(f"{get_timestamp()} Error downloading image!")
             sys.exit(1)
@@ -115,12 +115,14 @@ def get_nasa_image(bot_settings, bot_name):
                   f"📷 <b>{title}</b>\n" \
                   f"🔗 <a href='{page_url}'>View full post</a>"
 
-        send_photo_to_telegram(bot_settings, image_buffer, caption, script_name="nasa_apod_image", post_description=title, bot_name=bot_name)
+        if send_photo_to_telegram(bot_settings, image_buffer, caption, script_name="nasa_apod_image", post_description=title, bot_name=bot_name):
+            cache.mark_posted(ledger, item_id, {"title": title, "image_sha256": image_response.content_hash})
 
     except Exception as e:
         print(f"{get_timestamp()} Exception occurred: {str(e)}")
         sys.exit(1)
     finally:
+        cache.close()
         print(f"{get_timestamp()} Script finished.")
 
 if __name__ == "__main__":
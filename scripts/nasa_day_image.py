@@ -1,13 +1,13 @@
-import requests
 import feedparser
 from bs4 import BeautifulSoup
-from PIL import Image
-from io import BytesIO
 import argparse
 import sys
 import os
 from datetime import datetime, timezone
 from app.config_telegram import TELEGRAM_BOTS, DEFAULT_BOT_NAME
+from app.utils import telegram_client
+from app.utils.http_cache import HttpCache
+from app.utils.image_pipeline import prepare_photo, MAX_IMAGE_DOWNLOAD_MB
 
 NASA_DAY_RSS_URL = "https://www.nasa.gov/rss/dyn/lg_image_of_the_day.rss"
 TAKE_LAST_IF_NOTFOUND = False
@@ -20,18 +20,14 @@ def sanitize_text(text):
     return text.encode('utf-8', 'ignore').decode('utf-8')
 
 def send_photo_to_telegram(bot_settings, image_buffer, caption, script_name, post_description, bot_name):
-    response = requests.post(
-        f"https://api.telegram.org/bot{bot_settings['bot_token']}/sendPhoto",
-        data={
-            'chat_id': bot_settings['chat_id'],
-            'caption': caption,
-            'parse_mode': 'HTML'
-        },
-        files={'photo': (f"nasa_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg", image_buffer, 'image/jpeg')}
+    # Queued through the dashboard's Telegram service (pooled, rate limited, retried)
+    result = telegram_client.send_photo(
+        bot_name, image_buffer, caption=caption, parse_mode='HTML',
+        filename=f"nasa_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
     )
 
     bot_token_tail = bot_settings['bot_token'][-5:]
-    status = "Success" if response.status_code == 200 else f"Failed! Status: {response.status_code} {response.text}"
+    status = "Success" if result.get("ok") else f"Failed! Status: {result.get('status')} {result.get('description', '')}"
     
     print(f"{get_timestamp()} Telegram post: {status} "
           f"[script_name: {script_name}; "
@@ -39,12 +35,20 @@ def send_photo_to_telegram(bot_settings, image_buffer, caption, script_name, pos
           f"chat_id: {bot_settings['chat_id']}; "
           f"bot_name: {bot_name}; "
           f"bot_token: ***{bot_token_tail};]")
+    return result.get("ok", False)
 
 def main(bot_settings, bot_name):
+    # Conditional requests + posted ledger: an unchanged feed costs a 304 and posts nothing
+    cache = HttpCache()
+    ledger = f"nasa_day_image:{bot_name}"
     try:
         print(f"{get_timestamp()} Script executed. Launch command: {' '.join(sys.argv[0:])}")
         print(f"{get_timestamp()} Fetching RSS feed...")
-        feed = feedparser.parse(NASA_DAY_RSS_URL)
+        rss_response = cache.get(NASA_DAY_RSS_URL)
+        rss_response.raise_for_status()
+        if rss_response.from_cache:
+            print(f"{get_timestamp()} RSS feed not modified since last run (304), using cached copy.")
+        feed = feedparser.parse(rss_response.content)
         latest = max(feed.entries, key=lambda e: e.published_parsed)
 
         title = sanitize_text(latest.title)
@@ -64,9 +68,14 @@ def main(bot_settings, bot_name):
             print(f"{get_timestamp()} No new image today. Skipping post.")
             return
 
+        item_id = latest.get("id") or link
+        if cache.already_posted(ledger, item_id):
+            print(f"{get_timestamp()} '{title}' was already posted via '{bot_name}'. Skipping post.")
+            return
+
         print(f"{get_timestamp()} Found today's image: {title}")
         print(f"{get_timestamp()} Fetching image page...")
-        response = requests.get(link)
+        response = cache.get(link)
         response.raise_for_status()
         soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -87,14 +96,12 @@ def main(bot_settings, bot_name):
         print(f"{get_timestamp()} Image URL: {image_url}")
 
         print(f"{get_timestamp()} Downloading and resizing image...")
-        img_response = requests.get(image_url)
-        img_response.raise_for_status()
-        img = Image.open(BytesIO(img_response.content))
-        img = img.resize((1200, int(1200 * img.height / img.width)))
-
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=85)
-        buffer.seek(0)
+        # Streamed to disk with a size cap, then decoded at reduced scale: memory stays
+        # bounded by the output size, not by the source image
+        img_file = cache.download(image_url, max_bytes=MAX_IMAGE_DOWNLOAD_MB * 1024 * 1024)
+        img_file.raise_for_status()
+        buffer, (width, height) = prepare_photo(img_file.path)
+        print(f"{get_timestamp()} Image: {img_file.size // 1024} KB source -> {width}x{height} progressive JPEG")
 
         caption = f"🚀 <b>NASA Image of the Day!</b>\n" \
                   f"<b>Date:</b> {post_date}\n" \
@@ -102,12 +109,15 @@ def main(bot_settings, bot_name):
                   f"<b>{description}</b>\n" \
                   f"🔗 <a href='{link}'>View full post</a>"
 
-        send_photo_to_telegram(bot_settings, buffer, caption, script_name="nasa_day_image", post_description=title, bot_name=bot_name)
+        if send_photo_to_telegram(bot_settings, buffer, caption, script_name="nasa_day_image", post_description=title, bot_name=bot_name):
+            cache.mark_posted(ledger, item_id, {"title": title, "image_sha256": img_file.content_hash})
 
         print(f"{get_timestamp()} Script finished.")
     except Exception as e:
         print(f"{get_timestamp()} Exception occurred: {str(e)}")
         sys.exit(1)
+    finally:
+        cache.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -1,10 +1,5 @@
-import os
 import sys
 import argparse
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from pathlib import Path
 
@@ -14,12 +9,7 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path=root_env_path)
 
 from app.config_telegram import TELEGRAM_BOTS, DEFAULT_BOT_NAME
-
-# === Email Config ===
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
+from app.utils import telegram_client, email_client
 
 def get_timestamp():
     return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]"
@@ -37,35 +27,23 @@ def send_push(bot_name, message):
         print(f"{get_timestamp()} ERROR: Missing token or chat_id for bot '{bot_name}'")
         return
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": message}
-
     try:
-        resp = requests.post(url, json=payload)
-        if resp.status_code == 200:
+        result = telegram_client.send_message(bot_name, message)
+        if result.get("ok"):
             print(f"{get_timestamp()} Push sent via '{bot_name}' to chat {chat_id}")
         else:
-            print(f"{get_timestamp()} Failed to send push: {resp.status_code} - {resp.text}")
+            print(f"{get_timestamp()} Failed to send push: {result.get('status')} - {result.get('description', '')}")
     except Exception as e:
         print(f"{get_timestamp()} Push error:", str(e))
 
 def send_email(to_list, subject, body):
-    if not EMAIL_USER or not EMAIL_PASS:
-        print(f"{get_timestamp()} ERROR: Email credentials not set.")
-        return
-
-    msg = MIMEMultipart()
-    msg["From"] = EMAIL_USER
-    msg["To"] = ", ".join(to_list)
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
-
+    # Queued on the dashboard's email service (reused SMTP session, batching, retries)
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.sendmail(EMAIL_USER, to_list, msg.as_string())
-        print(f"{get_timestamp()} Email sent to:", ", ".join(to_list))
+        result = email_client.send_email(to_list, subject, body)
+        if result.get("ok"):
+            print(f"{get_timestamp()} Email sent to:", ", ".join(to_list))
+        else:
+            print(f"{get_timestamp()} Email error:", result.get("error", ""))
     except Exception as e:
         print(f"{get_timestamp()} Email error:", str(e))
 